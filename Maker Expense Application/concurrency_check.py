@@ -0,0 +1,164 @@
+"""
+Concurrent access check for Project Pricer
+Starts several writer processes on one database file, each repeatedly
+reading a material's quantity and writing back one more with a versioned
+update, and adding labor lines, the way copies of the application on a
+shared file do. Fails if any increment is lost, any write errors out with
+"database is locked", or a project total no longer matches its line items.
+
+Usage:
+    python concurrency_check.py [--workers 6] [--updates 200] [--projects 4]
+"""
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+DEFAULT_WORKERS = 6
+DEFAULT_UPDATES = 200
+DEFAULT_PROJECTS = 4
+UNIT_COST_CENTS = 125
+HOURLY_RATE_CENTS = 4000
+# Longest pause between loading a row and saving it
+THINK_SECONDS = 0.002
+
+def setup(db_path, projects):
+    """Create a database with one counter material per project; returns the material IDs"""
+    from schema import connect
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO profiles (name, hourly_rate_cents, created_date) "
+                       "VALUES ('Check', ?, '2024-01-01')", (HOURLY_RATE_CENTS,))
+        profile_id = cursor.lastrowid
+        material_ids = []
+        for number in range(projects):
+            cursor.execute("INSERT INTO projects (profile_id, name, created_date) VALUES (?, ?, '2024-01-01')",
+                           (profile_id, f"Project {number + 1}"))
+            cursor.execute("INSERT INTO materials (project_id, name, quantity, unit_cost_cents) "
+                           "VALUES (?, 'Counter', 0, ?)", (cursor.lastrowid, UNIT_COST_CENTS))
+            material_ids.append(cursor.lastrowid)
+        conn.commit()
+        return material_ids
+    finally:
+        conn.close()
+
+def writer(db_path, material_ids, updates, seed):
+    """
+    Worker process: increment random counters with versioned read-modify-write
+    
+    Returns:
+        Dictionary with increments per material, labor lines added per
+        project, conflicts retried and errors
+    """
+    from db_locking import ConflictError, update_versioned, write_transaction
+    from schema import connect
+    
+    rng = random.Random(seed)
+    result = {'increments': {}, 'labor': {}, 'conflicts': 0, 'errors': []}
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        for _ in range(updates):
+            material_id = rng.choice(material_ids)
+            try:
+                while True:
+                    # Read outside the transaction, like a form loaded earlier
+                    cursor.execute('SELECT project_id, quantity, row_version FROM materials WHERE id = ?',
+                                   (material_id,))
+                    project_id, quantity, version = cursor.fetchone()
+                    # Others may save while this one is "editing"
+                    time.sleep(rng.random() * THINK_SECONDS)
+                    try:
+                        with write_transaction(conn) as write:
+                            update_versioned(write, 'materials', material_id, version, {'quantity': quantity + 1})
+                            if rng.random() < 0.25:
+                                write.execute('INSERT INTO labor (project_id, description, hours) VALUES (?, ?, 0.5)',
+                                              (project_id, f"pid {os.getpid()}"))
+                                result['labor'][project_id] = result['labor'].get(project_id, 0) + 1
+                        break
+                    except ConflictError:
+                        result['conflicts'] += 1
+                result['increments'][material_id] = result['increments'].get(material_id, 0) + 1
+            except sqlite3.Error as e:
+                result['errors'].append(f"{type(e).__name__}: {e}")
+    finally:
+        conn.close()
+    return result
+
+def verify(db_path, material_ids, results):
+    """Compare the database with what the workers report; returns a list of failure messages"""
+    from pricing import project_total_sql
+    
+    failures = []
+    increments = {}
+    labor = {}
+    for result in results:
+        for material_id, count in result['increments'].items():
+            increments[material_id] = increments.get(material_id, 0) + count
+        for project_id, count in result['labor'].items():
+            labor[project_id] = labor.get(project_id, 0) + count
+        failures.extend(result['errors'])
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        for material_id in material_ids:
+            cursor.execute('SELECT project_id, quantity FROM materials WHERE id = ?', (material_id,))
+            project_id, quantity = cursor.fetchone()
+            if quantity != increments.get(material_id, 0):
+                failures.append(f"material {material_id}: quantity {quantity}, "
+                                f"{increments.get(material_id, 0)} increments committed (lost update)")
+            cursor.execute('SELECT COUNT(*) FROM labor WHERE project_id = ?', (project_id,))
+            count = cursor.fetchone()[0]
+            if count != labor.get(project_id, 0):
+                failures.append(f"project {project_id}: {count} labor lines, {labor.get(project_id, 0)} inserted")
+        
+        cursor.execute(f'''
+            SELECT p.id, t.total_cents, {project_total_sql()}
+            FROM projects p JOIN project_totals t ON t.project_id = p.id
+        ''')
+        for project_id, stored, computed in cursor.fetchall():
+            if stored != computed:
+                failures.append(f"project {project_id}: stored total {stored}, line items add up to {computed}")
+    finally:
+        conn.close()
+    return failures
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Check that concurrent writer processes lose no updates")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Writer processes")
+    parser.add_argument('--updates', type=int, default=DEFAULT_UPDATES, help="Increments per writer")
+    parser.add_argument('--projects', type=int, default=DEFAULT_PROJECTS,
+                        help="Projects to spread the writes over (fewer means more conflicts)")
+    args = parser.parse_args()
+    
+    temp_dir = tempfile.mkdtemp(prefix='concurrency_check_')
+    db_path = os.path.join(temp_dir, 'check.db')
+    try:
+        material_ids = setup(db_path, args.projects)
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.starmap(writer, [(db_path, material_ids, args.updates, seed)
+                                            for seed in range(args.workers)])
+        elapsed = time.perf_counter() - started
+        failures = verify(db_path, material_ids, results)
+    finally:
+        for name in os.listdir(temp_dir):
+            os.remove(os.path.join(temp_dir, name))
+        os.rmdir(temp_dir)
+    
+    conflicts = sum(result['conflicts'] for result in results)
+    print(f"{args.workers} writers x {args.updates} updates in {elapsed:.1f} s, "
+          f"{conflicts} version conflicts retried")
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nNo lost updates")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,426 @@
+"""
+Cut-list optimizer for Project Pricer
+Works out how many stock boards or sheets a project's parts need.
+
+Boards (stock with a length only) are packed in one dimension and sheets
+(stock with a length and width) in two. Each has a fast heuristic and a
+bounded exact mode:
+    
+    1D heuristic: best fit decreasing
+    1D exact:     branch and bound, proven optimal unless the time limit is hit
+    2D heuristic: guillotine packing, best area fit
+    2D exact:     repeated guillotine packing over part orders and split rules,
+                  proven optimal only when it reaches the area lower bound
+
+Saw kerf is handled by growing every part and the stock by one kerf width,
+which leaves a kerf between neighbouring parts but not at the stock edges.
+"""
+import math
+import random
+import time
+from bisect import bisect_left, insort
+
+EPSILON = 1e-9
+# Exact 1D search recurses once per part
+EXACT_MAX_PARTS = 800
+DEFAULT_TIME_LIMIT = 2.0
+
+class CutPlan:
+    """Result of packing parts into stock"""
+    
+    def __init__(self, stock, layouts, lower_bound, optimal, method):
+        # (length, width) of the stock; width is None for boards
+        self.stock = stock
+        # One list of placed parts per stock piece; a part is
+        # (name, length, width, x, y, rotated) with width, x and y None for boards
+        self.layouts = layouts
+        self.lower_bound = lower_bound
+        self.optimal = optimal
+        self.method = method
+    
+    @property
+    def stock_count(self):
+        return len(self.layouts)
+    
+    def used_area(self):
+        """Total length (boards) or area (sheets) of the placed parts"""
+        if self.stock[1] is None:
+            return sum(part[1] for layout in self.layouts for part in layout)
+        return sum(part[1] * part[2] for layout in self.layouts for part in layout)
+    
+    def waste_ratio(self):
+        """Share of the stock that is left over as offcuts and kerf"""
+        stock_size = self.stock[0] if self.stock[1] is None else self.stock[0] * self.stock[1]
+        total = stock_size * self.stock_count
+        return 1.0 - self.used_area() / total if total else 0.0
+    
+    def describe(self):
+        """
+        Describe the plan as text lines for display
+        
+        Returns:
+            List of strings, one per stock piece plus a summary line
+        """
+        lines = []
+        for number, layout in enumerate(self.layouts, 1):
+            if self.stock[1] is None:
+                used = sum(part[1] for part in layout)
+                pieces = ', '.join(f"{part[0]} {part[1]:g}" for part in layout)
+                lines.append(f"Board {number}: {pieces} (offcut {self.stock[0] - used:g})")
+            else:
+                pieces = ', '.join(
+                    f"{part[0]} {part[1]:g}x{part[2]:g}{' (rotated)' if part[5] else ''} at {part[3]:g},{part[4]:g}"
+                    for part in layout
+                )
+                lines.append(f"Sheet {number}: {pieces}")
+        proof = "optimal" if self.optimal else f"lower bound {self.lower_bound}"
+        lines.append(f"{self.stock_count} stock pieces, {self.waste_ratio() * 100:.1f}% waste ({self.method}, {proof})")
+        return lines
+
+def expand_parts(parts):
+    """
+    Expand part rows into one entry per piece
+    
+    Args:
+        parts: Iterable of (name, length, width, count); width is ignored for boards
+    
+    Returns:
+        List of (name, length, width) tuples
+    """
+    pieces = []
+    for name, length, width, count in parts:
+        if not length or length <= 0:
+            raise ValueError(f"Part '{name}' needs a positive length")
+        pieces.extend([(name, float(length), float(width) if width else None)] * int(count or 1))
+    return pieces
+
+# ---------------------------------------------------------------------------
+# One dimension
+# ---------------------------------------------------------------------------
+
+def _check_1d(pieces, stock_length):
+    for name, length, _ in pieces:
+        if length > stock_length + EPSILON:
+            raise ValueError(f"Part '{name}' ({length:g}) is longer than the stock ({stock_length:g})")
+
+def _best_fit_decreasing(sizes, capacity):
+    """Return bins as lists of indexes into sizes"""
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i])
+    bins = []
+    # Sorted (remaining, bin number) so the tightest fitting bin is a bisect away
+    free = []
+    for i in order:
+        size = sizes[i]
+        pos = bisect_left(free, (size - EPSILON, -1))
+        if pos < len(free):
+            remaining, number = free.pop(pos)
+        else:
+            remaining, number = capacity, len(bins)
+            bins.append([])
+        bins[number].append(i)
+        insort(free, (remaining - size, number))
+    return bins
+
+def _branch_and_bound(sizes, capacity, best_bins, lower_bound, deadline):
+    """
+    Search for a packing in fewer bins than best_bins
+    
+    Returns:
+        (bins, proven) where proven is False if the deadline cut the search short
+    """
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i])
+    ordered = [sizes[i] for i in order]
+    # Size of all parts from position k onwards, for the capacity bound
+    tail = [0.0] * (len(ordered) + 1)
+    for k in range(len(ordered) - 1, -1, -1):
+        tail[k] = tail[k + 1] + ordered[k]
+    
+    best = {'count': len(best_bins), 'assign': None}
+    loads = []
+    assign = [0] * len(ordered)
+    state = {'nodes': 0, 'timed_out': False}
+    
+    def search(k):
+        if best['count'] <= lower_bound:
+            return
+        state['nodes'] += 1
+        if state['nodes'] % 1024 == 0 and time.monotonic() > deadline:
+            state['timed_out'] = True
+        if state['timed_out']:
+            return
+        if k == len(ordered):
+            best['count'] = len(loads)
+            best['assign'] = list(assign)
+            return
+        
+        # Parts still to place must fit in the open bins or new ones
+        free = sum(capacity - load for load in loads)
+        needed = len(loads) + max(0, math.ceil((tail[k] - free) / capacity - EPSILON))
+        if needed >= best['count']:
+            return
+        
+        size = ordered[k]
+        tried = set()
+        for b, load in enumerate(loads):
+            # Bins with the same load are interchangeable
+            key = round(load, 9)
+            if load + size <= capacity + EPSILON and key not in tried:
+                tried.add(key)
+                loads[b] += size
+                assign[k] = b
+                search(k + 1)
+                loads[b] -= size
+        if len(loads) + 1 < best['count']:
+            loads.append(size)
+            assign[k] = len(loads) - 1
+            search(k + 1)
+            loads.pop()
+    
+    search(0)
+    
+    if best['assign'] is None:
+        return best_bins, not state['timed_out']
+    bins = [[] for _ in range(best['count'])]
+    for k, b in enumerate(best['assign']):
+        bins[b].append(order[k])
+    return bins, not state['timed_out']
+
+def pack_boards(pieces, stock_length, kerf=0.0, exact=False, time_limit=DEFAULT_TIME_LIMIT):
+    """
+    Pack parts into boards of a fixed length
+    
+    Args:
+        pieces: List of (name, length, width) from expand_parts
+        stock_length: Length of one stock board
+        kerf: Width of the saw cut
+        exact: Run branch and bound after the heuristic
+        time_limit: Seconds the exact search may take
+    
+    Returns:
+        CutPlan
+    """
+    _check_1d(pieces, stock_length)
+    sizes = [length + kerf for _, length, _ in pieces]
+    capacity = stock_length + kerf
+    lower_bound = max(math.ceil(sum(sizes) / capacity - EPSILON), 1 if pieces else 0)
+    
+    bins = _best_fit_decreasing(sizes, capacity)
+    optimal = len(bins) <= lower_bound
+    method = "best fit decreasing"
+    if exact and not optimal:
+        if len(pieces) > EXACT_MAX_PARTS:
+            method += f" (exact search skipped above {EXACT_MAX_PARTS} parts)"
+        else:
+            bins, optimal = _branch_and_bound(sizes, capacity, bins, lower_bound,
+                                              time.monotonic() + time_limit)
+            method = "branch and bound"
+    
+    layouts = [[(pieces[i][0], pieces[i][1], None, None, None, False) for i in b] for b in bins]
+    return CutPlan((float(stock_length), None), layouts, lower_bound, optimal, method)
+
+# ---------------------------------------------------------------------------
+# Two dimensions
+# ---------------------------------------------------------------------------
+
+class _Sheet:
+    """Free rectangles of one sheet under guillotine cuts"""
+    
+    def __init__(self, length, width):
+        self.free = [(0.0, 0.0, length, width)]
+        self.placed = []
+    
+    def best_fit(self, length, width, rotate):
+        """Return (leftover area, free index, rotated) of the tightest fit or None"""
+        best = None
+        for index, (_, _, free_length, free_width) in enumerate(self.free):
+            for rotated, (l, w) in ((False, (length, width)), (True, (width, length))):
+                if rotated and (not rotate or length == width):
+                    continue
+                if l <= free_length + EPSILON and w <= free_width + EPSILON:
+                    leftover = free_length * free_width - l * w
+                    if best is None or leftover < best[0]:
+                        best = (leftover, index, rotated)
+        return best
+    
+    def place(self, index, length, width, split_rule):
+        x, y, free_length, free_width = self.free.pop(index)
+        spare_length = free_length - length
+        spare_width = free_width - width
+        if split_rule(spare_length, spare_width):
+            # Cut across the full length first
+            right = (x + length, y, spare_length, width)
+            top = (x, y + width, free_length, spare_width)
+        else:
+            right = (x + length, y, spare_length, free_width)
+            top = (x, y + width, length, spare_width)
+        for rect in (right, top):
+            if rect[2] > EPSILON and rect[3] > EPSILON:
+                self.free.append(rect)
+        return x, y
+
+def _shorter_leftover(spare_length, spare_width):
+    return spare_length < spare_width
+
+def _longer_leftover(spare_length, spare_width):
+    return spare_length >= spare_width
+
+def _guillotine(sized, sheet_length, sheet_width, rotate, split_rule):
+    """Pack pre-ordered (index, length, width) parts; returns list of _Sheet"""
+    sheets = []
+    for index, length, width in sized:
+        best = None
+        for sheet in sheets:
+            fit = sheet.best_fit(length, width, rotate)
+            if fit and (best is None or fit[0] < best[0]):
+                best = fit + (sheet,)
+        if best is None:
+            sheet = _Sheet(sheet_length, sheet_width)
+            sheets.append(sheet)
+            best = sheet.best_fit(length, width, rotate) + (sheet,)
+        _, free_index, rotated, sheet = best
+        l, w = (width, length) if rotated else (length, width)
+        x, y = sheet.place(free_index, l, w, split_rule)
+        sheet.placed.append((index, x, y, rotated))
+    return sheets
+
+def pack_sheets(pieces, stock_length, stock_width, kerf=0.0, rotate=True, exact=False,
+                time_limit=DEFAULT_TIME_LIMIT, seed=None):
+    """
+    Pack rectangular parts into sheets
+    
+    Args:
+        pieces: List of (name, length, width) from expand_parts
+        stock_length: Length of one sheet
+        stock_width: Width of one sheet
+        kerf: Width of the saw cut
+        rotate: Allow parts to turn 90 degrees (set False to keep the grain)
+        exact: Keep searching other orders until the time limit or the lower bound
+        time_limit: Seconds the exact search may take
+        seed: Optional random seed for repeatable exact searches
+    
+    Returns:
+        CutPlan
+    """
+    sheet_length = stock_length + kerf
+    sheet_width = stock_width + kerf
+    sized = []
+    for index, (name, length, width) in enumerate(pieces):
+        if width is None:
+            raise ValueError(f"Part '{name}' needs a width to be cut from sheet stock")
+        l, w = length + kerf, width + kerf
+        fits = l <= sheet_length + EPSILON and w <= sheet_width + EPSILON
+        fits_rotated = rotate and w <= sheet_length + EPSILON and l <= sheet_width + EPSILON
+        if not (fits or fits_rotated):
+            raise ValueError(f"Part '{name}' ({length:g}x{width:g}) does not fit the sheet "
+                             f"({stock_length:g}x{stock_width:g})")
+        sized.append((index, l, w))
+    
+    area = sum(l * w for _, l, w in sized)
+    lower_bound = max(math.ceil(area / (sheet_length * sheet_width) - EPSILON), 1 if pieces else 0)
+    
+    orders = [
+        sorted(sized, key=lambda p: -(p[1] * p[2])),
+        sorted(sized, key=lambda p: -max(p[1], p[2])),
+        sorted(sized, key=lambda p: (-p[2], -p[1])),
+    ]
+    split_rules = (_shorter_leftover, _longer_leftover)
+    
+    best = _guillotine(orders[0], sheet_length, sheet_width, rotate, _shorter_leftover)
+    method = "guillotine best area fit"
+    if exact and len(best) > lower_bound:
+        deadline = time.monotonic() + time_limit
+        rng = random.Random(seed)
+        attempt = 0
+        while len(best) > lower_bound and time.monotonic() < deadline:
+            if attempt < len(orders) * len(split_rules):
+                order = orders[attempt // len(split_rules)]
+                rule = split_rules[attempt % len(split_rules)]
+            else:
+                # Perturb the area order: swap a few neighbours at random
+                order = list(orders[0])
+                for _ in range(max(1, len(order) // 10)):
+                    i = rng.randrange(len(order))
+                    j = min(len(order) - 1, i + rng.randint(1, 3))
+                    order[i], order[j] = order[j], order[i]
+                rule = rng.choice(split_rules)
+            candidate = _guillotine(order, sheet_length, sheet_width, rotate, rule)
+            if len(candidate) < len(best):
+                best = candidate
+            attempt += 1
+        method = f"guillotine search ({attempt} orders)"
+    
+    layouts = []
+    for sheet in best:
+        layout = []
+        for index, x, y, rotated in sheet.placed:
+            name, length, width = pieces[index]
+            layout.append((name, length, width, x, y, rotated))
+        layouts.append(layout)
+    return CutPlan((float(stock_length), float(stock_width)), layouts, lower_bound,
+                   len(best) <= lower_bound, method)
+
+def optimize(parts, stock_length, stock_width=None, kerf=0.0, rotate=True, exact=False,
+             time_limit=DEFAULT_TIME_LIMIT):
+    """
+    Plan the cuts for a list of parts
+    
+    Args:
+        parts: Iterable of (name, length, width, count)
+        stock_length: Length of the stock
+        stock_width: Width of sheet stock, or None for boards
+        kerf: Width of the saw cut
+        rotate: Allow sheet parts to turn 90 degrees
+        exact: Use the bounded exact mode
+        time_limit: Seconds the exact mode may take
+    
+    Returns:
+        CutPlan
+    """
+    if not stock_length or stock_length <= 0:
+        raise ValueError("Stock length must be positive")
+    pieces = expand_parts(parts)
+    if stock_width:
+        return pack_sheets(pieces, stock_length, stock_width, kerf, rotate, exact, time_limit)
+    return pack_boards(pieces, stock_length, kerf, exact, time_limit)
+
+# ---------------------------------------------------------------------------
+# Database
+# ---------------------------------------------------------------------------
+
+def load_parts(cursor, material_id):
+    """Return (id, name, length, width, count) rows for a material's parts"""
+    cursor.execute('SELECT id, name, length, width, count FROM cut_parts WHERE material_id = ? ORDER BY id',
+                   (material_id,))
+    return cursor.fetchall()
+
+def load_stock(cursor, material_id):
+    """Return (stock_length, stock_width, kerf) for a material"""
+    cursor.execute('SELECT stock_length, stock_width, kerf FROM materials WHERE id = ?', (material_id,))
+    row = cursor.fetchone()
+    if not row:
+        raise ValueError("Material not found")
+    return row
+
+def plan_material(cursor, material_id, exact=False, rotate=True, time_limit=DEFAULT_TIME_LIMIT):
+    """
+    Plan the cuts for a material's parts
+    
+    Args:
+        cursor: SQLite cursor
+        material_id: ID of the stock material
+        exact: Use the bounded exact mode
+        rotate: Allow sheet parts to turn 90 degrees
+        time_limit: Seconds the exact mode may take
+    
+    Returns:
+        CutPlan
+    """
+    stock_length, stock_width, kerf = load_stock(cursor, material_id)
+    if not stock_length:
+        raise ValueError("Set the stock length for this material first")
+    parts = [row[1:] for row in load_parts(cursor, material_id)]
+    return optimize(parts, stock_length, stock_width, kerf or 0.0, rotate, exact, time_limit)
+
+def apply_plan(cursor, material_id, plan):
+    """Set a material's quantity to the number of stock pieces in a plan"""
+    cursor.execute('UPDATE materials SET quantity = ? WHERE id = ?', (plan.stock_count, material_id))
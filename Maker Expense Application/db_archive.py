@@ -0,0 +1,329 @@
+"""
+Cold-storage archiving for Project Pricer
+Projects older than a cutoff are moved, with all of their line items, into
+per-year archive databases. Archives are ATTACHed read-only on demand so
+listings and totals can still reach them while the working database stays
+small.
+
+Command line usage:
+    python db_archive.py archive <cutoff YYYY-MM-DD>
+    python db_archive.py list
+"""
+import os
+import re
+import sqlite3
+from urllib.request import pathname2url
+
+from money import format_money
+from pricing import project_filter_sql, project_total_sql
+from schema import convert_money_columns
+from time_tracking import compact_timer_events
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+DEFAULT_ARCHIVE_DIR = 'archives'
+
+ARCHIVE_PREFIX = 'project_pricer_archive_'
+ARCHIVE_SUFFIX = '.db'
+SCHEMA_PREFIX = 'archive_'
+
+# Line item tables moved with their project
+LINE_ITEM_TABLES = ('materials', 'labor', 'tool_usage', 'cut_parts')
+# Reference tables copied so archived line items can still be priced
+REFERENCE_TABLES = ('profiles', 'tools')
+ARCHIVED_TABLES = REFERENCE_TABLES + ('projects',) + LINE_ITEM_TABLES
+
+# Result columns of list_archived_projects to order by for each project list sort
+ARCHIVE_SORT_COLUMNS = {
+    'ID': '2',
+    'Name': '3 COLLATE NOCASE',
+    'Description': '4',
+    'Date': '5',
+    'Total Cost': '6',
+}
+
+def archive_path(archive_dir, year):
+    """Return the archive file for a year"""
+    return os.path.join(archive_dir, f"{ARCHIVE_PREFIX}{year}{ARCHIVE_SUFFIX}")
+
+def list_archives(archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    List archive files by year
+    
+    Args:
+        archive_dir: Folder holding the archives
+    
+    Returns:
+        List of (year, path) tuples, oldest first
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    
+    pattern = re.compile(rf'^{ARCHIVE_PREFIX}(\d{{4}}){re.escape(ARCHIVE_SUFFIX)}$')
+    archives = []
+    for name in os.listdir(archive_dir):
+        match = pattern.match(name)
+        if match:
+            archives.append((match.group(1), os.path.join(archive_dir, name)))
+    archives.sort()
+    return archives
+
+def attached_schemas(conn):
+    """Return the names of attached archive schemas"""
+    return [row[1] for row in conn.execute('PRAGMA database_list')
+            if row[1].startswith(SCHEMA_PREFIX)]
+
+def attach_limit(conn):
+    """Number of additional databases that can still be attached"""
+    attached = len(conn.execute('PRAGMA database_list').fetchall()) - 2
+    return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - max(attached, 0)
+
+def sync_archive_schema(conn, path):
+    """
+    Create or update the tables of an archive file to match the working database
+    
+    Args:
+        conn: Connection to the working database
+        path: Archive file to prepare
+    """
+    archive = sqlite3.connect(path)
+    try:
+        # Archives written before money was stored in cents
+        convert_money_columns(archive.cursor())
+        for table in ARCHIVED_TABLES:
+            create_sql = conn.execute(
+                "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()[0]
+            archive.execute(create_sql.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1))
+            
+            # Columns added to the working database since the archive was created
+            existing = {row[1] for row in archive.execute(f'PRAGMA table_info({table})')}
+            for _, name, col_type, _, default, _ in conn.execute(f'PRAGMA main.table_info({table})'):
+                if name not in existing:
+                    default_sql = f' DEFAULT {default}' if default is not None else ''
+                    archive.execute(f'ALTER TABLE {table} ADD COLUMN {name} {col_type}{default_sql}')
+        
+        user_version = conn.execute('PRAGMA main.user_version').fetchone()[0]
+        archive.execute(f'PRAGMA user_version = {int(user_version)}')
+        archive.commit()
+    finally:
+        archive.close()
+
+def upgrade_archive(conn, path):
+    """
+    Sync an archive's schema if it was written by an older schema version
+    
+    Args:
+        conn: Connection to the working database
+        path: Archive file
+    """
+    uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+    archive = sqlite3.connect(uri, uri=True)
+    try:
+        version = archive.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        archive.close()
+    if version < conn.execute('PRAGMA main.user_version').fetchone()[0]:
+        sync_archive_schema(conn, path)
+
+def archive_projects(conn, cutoff_date, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    Move projects created before a cutoff into per-year archive databases
+    
+    All years are moved in a single transaction across the attached
+    archives, so a failure leaves both the working database and the
+    archives unchanged. Timer events are compacted into labor rows first,
+    so time tracked on an archived project moves with it.
+    
+    Args:
+        conn: Connection to the working database
+        cutoff_date: ISO date; projects created before it are archived
+        archive_dir: Folder holding the archives
+    
+    Returns:
+        Dictionary of year -> number of projects archived
+    """
+    if conn.in_transaction:
+        conn.commit()
+    compact_timer_events(conn)
+    
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT substr(created_date, 1, 4) AS year, COUNT(*)
+        FROM projects
+        WHERE created_date < ?
+        GROUP BY year
+        ORDER BY year
+    ''', (cutoff_date,))
+    counts = dict(cursor.fetchall())
+    if not counts:
+        return {}
+    
+    if len(counts) > attach_limit(conn):
+        raise sqlite3.OperationalError(
+            f"Too many years to archive at once ({len(counts)}); use an earlier cutoff first"
+        )
+    
+    os.makedirs(archive_dir, exist_ok=True)
+    schemas = {}
+    for year in counts:
+        path = archive_path(archive_dir, year)
+        sync_archive_schema(conn, path)
+        schema = f"{SCHEMA_PREFIX}{year}_rw"
+        cursor.execute('ATTACH DATABASE ? AS ' + schema, (path,))
+        schemas[year] = schema
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS archive_selection (
+                id INTEGER PRIMARY KEY,
+                year TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('DELETE FROM temp.archive_selection')
+        cursor.execute('''
+            INSERT INTO temp.archive_selection (id, year)
+            SELECT id, substr(created_date, 1, 4) FROM projects WHERE created_date < ?
+        ''', (cutoff_date,))
+        
+        for year, schema in schemas.items():
+            selection = 'SELECT id FROM temp.archive_selection WHERE year = ?'
+            
+            def copy(table, where):
+                columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO {schema}.{table} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE {where}
+                ''', (year,))
+            
+            copy('profiles', f'id IN (SELECT profile_id FROM main.projects WHERE id IN ({selection}))')
+            copy('tools', f'profile_id IN (SELECT profile_id FROM main.projects WHERE id IN ({selection}))')
+            copy('projects', f'id IN ({selection})')
+            for table in LINE_ITEM_TABLES:
+                copy(table, f'project_id IN ({selection})')
+        
+        for table in LINE_ITEM_TABLES:
+            cursor.execute(f'DELETE FROM main.{table} WHERE project_id IN (SELECT id FROM temp.archive_selection)')
+        cursor.execute('DELETE FROM main.projects WHERE id IN (SELECT id FROM temp.archive_selection)')
+        cursor.execute('DROP TABLE temp.archive_selection')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for schema in schemas.values():
+            cursor.execute(f'DETACH DATABASE {schema}')
+    
+    return counts
+
+def attach_archives(conn, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    ATTACH archive databases read-only
+    
+    The connection must have been opened with uri=True. Archives that are
+    already attached are skipped; the newest years are preferred when there
+    are more archives than attach slots.
+    
+    Args:
+        conn: Connection to the working database
+        archive_dir: Folder holding the archives
+    
+    Returns:
+        List of attached archive schema names
+    """
+    already = set(attached_schemas(conn))
+    available = attach_limit(conn)
+    
+    for year, path in reversed(list_archives(archive_dir)):
+        schema = f"{SCHEMA_PREFIX}{year}"
+        if schema in already:
+            continue
+        if available <= 0:
+            break
+        upgrade_archive(conn, path)
+        uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+        conn.execute('ATTACH DATABASE ? AS ' + schema, (uri,))
+        available -= 1
+    
+    return attached_schemas(conn)
+
+def detach_archives(conn):
+    """DETACH all attached archive databases"""
+    for schema in attached_schemas(conn):
+        conn.execute(f'DETACH DATABASE {schema}')
+
+def list_archived_projects(cursor, schemas, name_filter=None, filters=None, sort='Date', descending=True):
+    """
+    List projects from attached archives with their totals computed in SQL
+    
+    Args:
+        cursor: SQLite cursor on the working database
+        schemas: Attached archive schema names
+        name_filter: Optional substring to match in the project name
+        filters: Optional project list filters (see pricing.project_filter_sql)
+        sort: Key of pricing.PROJECT_SORT_COLUMNS
+        descending: Sort direction
+    
+    Returns:
+        List of (schema, id, name, description, created_date, total_cents)
+    """
+    if not schemas:
+        return []
+    
+    filters = dict(filters or {})
+    if name_filter:
+        filters['name'] = name_filter
+    
+    selects = []
+    params = []
+    for schema in schemas:
+        total_sql = project_total_sql(schema)
+        where, where_params = project_filter_sql(filters, total_sql)
+        selects.append(f'''
+            SELECT '{schema}', p.id, p.name, p.description, p.created_date, {total_sql}
+            FROM {schema}.projects p
+            {where}
+        ''')
+        params.extend(where_params)
+    
+    # Archive totals are computed, so sort on the result columns
+    order = ARCHIVE_SORT_COLUMNS[sort]
+    direction = 'DESC' if descending else 'ASC'
+    cursor.execute(' UNION ALL '.join(selects) + f' ORDER BY {order} {direction}', params)
+    return cursor.fetchall()
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer archiving")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('--dir', default=DEFAULT_ARCHIVE_DIR, help="Archive folder")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    archive_parser = subparsers.add_parser('archive', help="Archive old projects")
+    archive_parser.add_argument('cutoff', help="Archive projects created before this date (YYYY-MM-DD)")
+    subparsers.add_parser('list', help="List archived projects")
+    
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db, uri=True)
+    
+    try:
+        if args.command == 'archive':
+            counts = archive_projects(conn, args.cutoff, args.dir)
+            if not counts:
+                print("No projects to archive")
+            for year, count in counts.items():
+                print(f"{year}: {count} projects -> {archive_path(args.dir, year)}")
+        
+        elif args.command == 'list':
+            schemas = attach_archives(conn, args.dir)
+            for schema, project_id, name, _, created_date, total in \
+                    list_archived_projects(conn.cursor(), schemas):
+                print(f"{schema}  #{project_id}  {created_date[:10]}  {name}  {format_money(total)}")
+    finally:
+        conn.close()
+    
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,313 @@
+"""
+Online backup functionality for Project Pricer
+Snapshots are taken with the SQLite backup API, so the database can be
+copied safely while the application is writing to it.
+
+Command line usage:
+    python db_backup.py snapshot
+    python db_backup.py list
+    python db_backup.py verify [snapshot]
+    python db_backup.py restore <snapshot>
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from db_locking import write_transaction
+from schema import SCHEMA_VERSION, init_schema
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+DEFAULT_BACKUP_DIR = 'backups'
+DEFAULT_KEEP = 10
+DEFAULT_INTERVAL_MINUTES = 30
+
+# Pages copied per backup step and the pause between steps. Small steps keep
+# each lock on the source short so the UI and other writers are never stalled.
+PAGES_PER_STEP = 64
+STEP_SLEEP = 0.005
+
+SNAPSHOT_PREFIX = 'project_pricer-'
+SNAPSHOT_SUFFIX = '.db'
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+def snapshot_name(when=None):
+    """Build a timestamped snapshot filename"""
+    when = when or datetime.now()
+    return f"{SNAPSHOT_PREFIX}{when.strftime('%Y%m%d-%H%M%S')}{SNAPSHOT_SUFFIX}"
+
+def list_snapshots(backup_dir=DEFAULT_BACKUP_DIR):
+    """
+    List snapshots in a backup folder, newest first
+    
+    Args:
+        backup_dir: Folder holding the snapshots
+    
+    Returns:
+        List of snapshot paths
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+    
+    names = [name for name in os.listdir(backup_dir)
+             if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)]
+    # The timestamp in the name sorts chronologically
+    names.sort(key=lambda name: name[:-len(SNAPSHOT_SUFFIX)], reverse=True)
+    return [os.path.join(backup_dir, name) for name in names]
+
+def verify_snapshot(path):
+    """
+    Quickly verify that a snapshot is a usable SQLite database
+    
+    Checks the file header and runs PRAGMA quick_check, which validates
+    the b-tree structure without the slower index cross-checks.
+    
+    Args:
+        path: Path to the snapshot file
+    
+    Returns:
+        Tuple of (ok, message)
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(len(SQLITE_HEADER))
+    except OSError as e:
+        return False, f"Cannot read snapshot: {e}"
+    
+    if header != SQLITE_HEADER:
+        return False, "Not a SQLite database"
+    
+    conn = sqlite3.connect(path)
+    try:
+        results = [row[0] for row in conn.execute('PRAGMA quick_check')]
+    except sqlite3.DatabaseError as e:
+        return False, str(e)
+    finally:
+        conn.close()
+    
+    if results == ['ok']:
+        return True, "ok"
+    return False, '; '.join(results)
+
+def create_snapshot(db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR,
+                    pages=PAGES_PER_STEP, sleep=STEP_SLEEP, progress=None):
+    """
+    Write a verified, timestamped snapshot of the database
+    
+    The copy is written to a temporary file first and only renamed into
+    place once it passes verification, so a failed backup never leaves a
+    torn snapshot behind.
+    
+    Args:
+        db_path: Database to back up
+        backup_dir: Folder to write the snapshot into
+        pages: Number of pages copied per backup step
+        sleep: Seconds to pause between steps
+        progress: Optional callback(status, remaining, total)
+    
+    Returns:
+        Path of the new snapshot
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    
+    target = os.path.join(backup_dir, snapshot_name())
+    counter = 1
+    while os.path.exists(target):
+        base = snapshot_name()[:-len(SNAPSHOT_SUFFIX)]
+        target = os.path.join(backup_dir, f"{base}-{counter}{SNAPSHOT_SUFFIX}")
+        counter += 1
+    temp_path = target + '.tmp'
+    
+    source = sqlite3.connect(db_path)
+    dest = sqlite3.connect(temp_path)
+    try:
+        source.backup(dest, pages=pages, progress=progress, sleep=sleep)
+    finally:
+        dest.close()
+        source.close()
+    
+    ok, message = verify_snapshot(temp_path)
+    if not ok:
+        os.remove(temp_path)
+        raise sqlite3.DatabaseError(f"Snapshot failed verification: {message}")
+    
+    os.replace(temp_path, target)
+    return target
+
+def prune_snapshots(backup_dir=DEFAULT_BACKUP_DIR, keep=DEFAULT_KEEP):
+    """
+    Delete the oldest snapshots beyond the retention limit
+    
+    Args:
+        backup_dir: Folder holding the snapshots
+        keep: Number of snapshots to retain
+    
+    Returns:
+        List of removed snapshot paths
+    """
+    removed = []
+    for path in list_snapshots(backup_dir)[keep:]:
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError:
+            pass
+    return removed
+
+def restore_snapshot(snapshot_path, db_path=DEFAULT_DB_PATH, conn=None):
+    """
+    Restore a snapshot over the working database
+    
+    The snapshot is verified first. The restore itself also goes through the
+    backup API, so an open connection (pass it as conn) sees the restored
+    data immediately without having to reconnect. A snapshot taken before
+    later migrations is brought up to the current schema once restored.
+    
+    Args:
+        snapshot_path: Snapshot to restore from
+        db_path: Database to overwrite when conn is not given
+        conn: Optional open connection to restore into
+    
+    Raises:
+        sqlite3.DatabaseError: If the snapshot fails verification or was
+            written by a newer version of the application
+    """
+    ok, message = verify_snapshot(snapshot_path)
+    if not ok:
+        raise sqlite3.DatabaseError(f"Snapshot failed verification: {message}")
+    
+    source = sqlite3.connect(snapshot_path)
+    target = conn or sqlite3.connect(db_path)
+    try:
+        version = source.execute('PRAGMA user_version').fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(f"Snapshot has schema version {version}; "
+                                        f"this version of Project Pricer supports up to {SCHEMA_VERSION}")
+        if target.in_transaction:
+            target.commit()
+        source.backup(target, pages=PAGES_PER_STEP)
+        with write_transaction(target) as cursor:
+            init_schema(cursor)
+    finally:
+        source.close()
+        if conn is None:
+            target.close()
+
+class BackupScheduler:
+    """Takes periodic snapshots on a worker thread, driven by the Tk event loop"""
+    
+    def __init__(self, root, db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR,
+                 interval_minutes=DEFAULT_INTERVAL_MINUTES, keep=DEFAULT_KEEP):
+        self.root = root
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval_ms = int(interval_minutes * 60 * 1000)
+        self.keep = keep
+        
+        self.last_snapshot = None
+        self.last_error = None
+        self._after_id = None
+        self._thread = None
+        self._callbacks = []
+    
+    def start(self):
+        """Schedule the first periodic snapshot"""
+        self._after_id = self.root.after(self.interval_ms, self._scheduled)
+    
+    def stop(self):
+        """Cancel periodic snapshots"""
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def run_now(self, on_complete=None):
+        """
+        Start a snapshot immediately
+        
+        Args:
+            on_complete: Optional callback(path, error) run on the Tk thread
+        """
+        if on_complete:
+            self._callbacks.append(on_complete)
+        if self.is_running():
+            return
+        
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self.root.after(200, self._poll)
+    
+    def _scheduled(self):
+        self.run_now()
+        self._after_id = self.root.after(self.interval_ms, self._scheduled)
+    
+    def _worker(self):
+        try:
+            self.last_snapshot = create_snapshot(self.db_path, self.backup_dir)
+            self.last_error = None
+            prune_snapshots(self.backup_dir, self.keep)
+        except (sqlite3.Error, OSError) as e:
+            self.last_error = e
+    
+    def _poll(self):
+        if self.is_running():
+            self.root.after(200, self._poll)
+            return
+        
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self.last_snapshot, self.last_error)
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer database backups")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('--dir', default=DEFAULT_BACKUP_DIR, help="Backup folder")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    snapshot_parser = subparsers.add_parser('snapshot', help="Take a snapshot now")
+    snapshot_parser.add_argument('--keep', type=int, default=DEFAULT_KEEP,
+                                 help="Number of snapshots to retain")
+    subparsers.add_parser('list', help="List snapshots")
+    verify_parser = subparsers.add_parser('verify', help="Verify snapshots")
+    verify_parser.add_argument('snapshot', nargs='?', help="Snapshot to verify (default: all)")
+    restore_parser = subparsers.add_parser('restore', help="Restore a snapshot")
+    restore_parser.add_argument('snapshot', help="Snapshot to restore")
+    
+    args = parser.parse_args()
+    
+    if args.command == 'snapshot':
+        path = create_snapshot(args.db, args.dir)
+        print(f"Snapshot written: {path}")
+        for removed in prune_snapshots(args.dir, args.keep):
+            print(f"Removed old snapshot: {removed}")
+    
+    elif args.command == 'list':
+        for path in list_snapshots(args.dir):
+            size_kb = os.path.getsize(path) / 1024
+            print(f"{path}  ({size_kb:.1f} KB)")
+    
+    elif args.command == 'verify':
+        paths = [args.snapshot] if args.snapshot else list_snapshots(args.dir)
+        failed = False
+        for path in paths:
+            ok, message = verify_snapshot(path)
+            print(f"{'OK  ' if ok else 'FAIL'} {path}: {message}")
+            failed = failed or not ok
+        return 1 if failed else 0
+    
+    elif args.command == 'restore':
+        # Keep a copy of the current state in case the wrong snapshot was picked
+        if os.path.exists(args.db):
+            safety = create_snapshot(args.db, args.dir)
+            print(f"Current database saved as: {safety}")
+        restore_snapshot(args.snapshot, args.db)
+        print(f"Restored {args.snapshot} -> {args.db}")
+    
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,216 @@
+"""
+Concurrent access for Project Pricer
+Several copies of the application, the pricing API and the command line
+tools may share one database file. Writes take the write lock up front with
+BEGIN IMMEDIATE, so two sessions can never both read under a shared lock and
+then deadlock trying to upgrade it; a writer that finds the lock held waits
+out the busy timeout, then retries with backoff.
+
+Projects and line items carry a row_version. An edit made from what a
+session loaded earlier names the version it saw; if another session changed
+the row in between, the edit matches no row and raises ConflictError
+instead of silently overwriting the other change.
+"""
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# How long a statement waits for another session's lock before failing
+BUSY_TIMEOUT_MS = 5000
+# Extra attempts to start a write transaction after the busy timeout expires
+WRITE_RETRIES = 4
+# First backoff delay; doubled on each retry, with jitter
+BACKOFF_SECONDS = 0.05
+
+VERSIONED_TABLES = ('projects', 'materials', 'labor', 'tool_usage')
+
+class ConflictError(Exception):
+    """Raised when a row was changed or deleted by another session"""
+    
+    def __init__(self, table, row_id):
+        super().__init__(f"{table} row {row_id} was changed or deleted by another session")
+        self.table = table
+        self.row_id = row_id
+
+def configure(conn, busy_timeout_ms=BUSY_TIMEOUT_MS):
+    """
+    Set up a connection for sharing the database with other processes
+    
+    Implicit transactions opened by the sqlite3 module before a write also
+    start with BEGIN IMMEDIATE.
+    
+    Args:
+        conn: SQLite connection
+        busy_timeout_ms: Milliseconds to wait for a lock
+    
+    Returns:
+        The connection
+    """
+    conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+    conn.isolation_level = 'IMMEDIATE'
+    return conn
+
+def is_busy(error):
+    """Check whether an sqlite3 error means another session holds the lock"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def begin_write(conn, retries=WRITE_RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Start a BEGIN IMMEDIATE transaction, retrying while the database is busy
+    
+    Args:
+        conn: SQLite connection
+        retries: Extra attempts after the first one times out
+        backoff: First delay in seconds between attempts
+    
+    Raises:
+        sqlite3.OperationalError: If the lock is still held after every retry
+    """
+    if conn.in_transaction:
+        return
+    for attempt in range(retries + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == retries:
+                raise
+            # Jitter keeps waiting sessions from retrying in lockstep
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+@contextmanager
+def write_transaction(conn, retries=WRITE_RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Run a block as one write transaction, committed on success and rolled back on error
+    
+    Inside a transaction the caller already holds, the block runs in a
+    savepoint instead: it is released on success, leaving the commit to the
+    caller, and on error only the block's own changes are undone.
+    
+    Usage:
+        with write_transaction(conn) as cursor:
+            cursor.execute(...)
+    
+    Args:
+        conn: SQLite connection
+        retries: Extra attempts to take the write lock
+        backoff: First delay in seconds between attempts
+    """
+    if conn.in_transaction:
+        # Savepoints with the same name nest; each statement acts on the innermost
+        conn.execute('SAVEPOINT write_transaction')
+        try:
+            yield conn.cursor()
+            conn.execute('RELEASE write_transaction')
+        except BaseException:
+            conn.execute('ROLLBACK TO write_transaction')
+            conn.execute('RELEASE write_transaction')
+            raise
+        return
+    
+    begin_write(conn, retries, backoff)
+    try:
+        yield conn.cursor()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+@contextmanager
+def read_transaction(conn):
+    """
+    Run a block of reads against one consistent state of the database
+    
+    Without a transaction every statement sees the latest commit, so totals
+    and the rows read after them could disagree. Inside a transaction the
+    caller already holds, the block simply joins it.
+    
+    Usage:
+        with read_transaction(conn) as cursor:
+            cursor.execute(...)
+    
+    Args:
+        conn: SQLite connection
+    """
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn.cursor()
+    finally:
+        # Nothing was written, so ending the transaction either way only releases the snapshot
+        conn.rollback()
+
+def install_row_versions(cursor):
+    """
+    (Re)create the triggers that bump row_version on every update
+    
+    Writers that check versions set row_version = row_version + 1
+    themselves; the triggers cover every other update, such as bulk price
+    changes, so no write goes unnoticed by a later versioned edit.
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    for table in VERSIONED_TABLES:
+        trigger = f'row_version_{table}'
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute(f'''
+            CREATE TRIGGER {trigger} AFTER UPDATE ON {table}
+            WHEN NEW.row_version IS OLD.row_version
+            BEGIN
+                UPDATE {table} SET row_version = OLD.row_version + 1 WHERE id = NEW.id;
+            END
+        ''')
+
+def row_version(cursor, table, row_id):
+    """A row's current version, or None if the row does not exist"""
+    cursor.execute(f'SELECT row_version FROM {table} WHERE id = ?', (row_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def update_versioned(cursor, table, row_id, version, fields):
+    """
+    Update a row only if it is still at the version the caller loaded
+    
+    Args:
+        cursor: SQLite cursor, inside a write transaction
+        table: One of VERSIONED_TABLES
+        row_id: Row ID
+        version: row_version the caller loaded
+        fields: Dictionary of column -> new value
+    
+    Returns:
+        The row's new version
+    
+    Raises:
+        ConflictError: If the row changed or was deleted since it was loaded
+    """
+    assignments = ''.join(f'{name} = ?, ' for name in fields)
+    cursor.execute(f'''
+        UPDATE {table} SET {assignments}row_version = row_version + 1
+        WHERE id = ? AND row_version = ?
+    ''', list(fields.values()) + [row_id, version])
+    if cursor.rowcount == 0:
+        raise ConflictError(table, row_id)
+    return version + 1
+
+def delete_versioned(cursor, table, row_id, version):
+    """
+    Delete a row only if it is still at the version the caller loaded
+    
+    Args:
+        cursor: SQLite cursor, inside a write transaction
+        table: One of VERSIONED_TABLES
+        row_id: Row ID
+        version: row_version the caller loaded
+    
+    Raises:
+        ConflictError: If the row changed or was deleted since it was loaded
+    """
+    cursor.execute(f'DELETE FROM {table} WHERE id = ? AND row_version = ?', (row_id, version))
+    if cursor.rowcount == 0:
+        raise ConflictError(table, row_id)
@@ -0,0 +1,364 @@
+"""
+Database maintenance for Project Pricer
+Reports page and row statistics, keeps query planner statistics current
+with ANALYZE, recomputes the stored project totals, and returns free pages
+to the file system with incremental vacuum. Maintenance runs while the application is idle.
+
+Command line usage:
+    python db_maintenance.py report
+    python db_maintenance.py run
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from pricing import rebuild_project_totals
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+# Rows sampled per index by ANALYZE; keeps it fast on large tables
+ANALYSIS_LIMIT = 1000
+# Free pages released per maintenance run
+VACUUM_PAGES_PER_RUN = 2000
+# Switch an existing database to incremental vacuum once this share of
+# its pages is free
+CONVERT_FREE_RATIO = 0.25
+
+IDLE_SECONDS = 120
+CHECK_INTERVAL_MS = 30 * 1000
+MIN_HOURS_BETWEEN_RUNS = 24
+
+def pragma(conn, name):
+    """Read a single-valued PRAGMA"""
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+def database_stats(conn):
+    """
+    Collect file level statistics
+    
+    Args:
+        conn: SQLite connection
+    
+    Returns:
+        Dictionary of statistics
+    """
+    page_size = pragma(conn, 'page_size')
+    page_count = pragma(conn, 'page_count')
+    freelist_count = pragma(conn, 'freelist_count')
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone() is not None
+    
+    return {
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_count': freelist_count,
+        'file_size': page_size * page_count,
+        'free_bytes': page_size * freelist_count,
+        'auto_vacuum': AUTO_VACUUM_MODES.get(pragma(conn, 'auto_vacuum'), 'unknown'),
+        'has_statistics': has_stats,
+    }
+
+def table_stats(conn, exact=True):
+    """
+    Collect per-table row and page counts
+    
+    Exact counts read every row, and every page through the dbstat virtual
+    table; page counts are None when SQLite was built without dbstat.
+    Otherwise rows are the estimates ANALYZE stored in sqlite_stat1 and
+    pages are None, so only the statistics are read.
+    
+    Args:
+        conn: SQLite connection
+        exact: Count rows and pages instead of using planner estimates
+    
+    Returns:
+        List of (name, type, rows, pages) sorted by name; rows is None for
+        indexes and for tables without an estimate
+    """
+    pages = {}
+    has_dbstat = False
+    estimates = {}
+    if exact:
+        try:
+            for name, count in conn.execute('SELECT name, COUNT(*) FROM dbstat GROUP BY name'):
+                pages[name] = count
+            has_dbstat = True
+        except sqlite3.OperationalError:
+            pass
+    elif database_stats(conn)['has_statistics']:
+        # The first number of every entry is the row count of its table or index
+        for name, stat in conn.execute('SELECT tbl, stat FROM sqlite_stat1'):
+            estimates.setdefault(name, int(stat.split()[0]))
+    
+    stats = []
+    objects = conn.execute('''
+        SELECT name, type FROM sqlite_master
+        WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_autoindex%'
+        ORDER BY name
+    ''').fetchall()
+    for name, obj_type in objects:
+        rows = None
+        if obj_type == 'table':
+            rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] if exact else estimates.get(name)
+        stats.append((name, obj_type, rows, pages.get(name, 0) if has_dbstat else None))
+    return stats
+
+def run_maintenance(conn, vacuum_pages=VACUUM_PAGES_PER_RUN):
+    """
+    Refresh planner statistics and project totals, and release free pages
+    
+    Args:
+        conn: SQLite connection with no open transaction
+        vacuum_pages: Maximum free pages released by incremental vacuum
+    
+    Returns:
+        List of strings describing what was done
+    """
+    actions = []
+    before = database_stats(conn)
+    
+    # Bounded ANALYZE keeps sqlite_stat1 current without reading every row
+    started = time.perf_counter()
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+    conn.commit()
+    actions.append(f"ANALYZE completed in {(time.perf_counter() - started) * 1000:.0f} ms")
+    
+    # Totals are exact cents, but rows written with the triggers missing would leave them stale
+    started = time.perf_counter()
+    rebuild_project_totals(conn.cursor())
+    conn.commit()
+    actions.append(f"Project totals rebuilt in {(time.perf_counter() - started) * 1000:.0f} ms")
+    
+    mode = before['auto_vacuum']
+    free_ratio = before['freelist_count'] / max(before['page_count'], 1)
+    if mode == 'none' and free_ratio >= CONVERT_FREE_RATIO:
+        # auto_vacuum can only change through a full VACUUM; done once
+        started = time.perf_counter()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        actions.append(f"Converted to incremental vacuum in {(time.perf_counter() - started) * 1000:.0f} ms")
+    elif mode == 'incremental' and before['freelist_count']:
+        # incremental_vacuum frees one page per step and returns no columns,
+        # so execute() would stop after the first page; executescript() steps
+        # it to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages)});')
+    else:
+        actions.append("No free pages to release" if not before['freelist_count']
+                       else "Free pages below vacuum threshold")
+    
+    after = database_stats(conn)
+    released = before['freelist_count'] - after['freelist_count']
+    if released > 0:
+        actions.append(f"Released {released} free pages ({released * after['page_size'] / 1024:.0f} KB), "
+                       f"{after['freelist_count']} left")
+    return actions
+
+def format_table_stats(stats, exact=True):
+    """
+    Build the per-table lines of the report
+    
+    Args:
+        stats: Result of table_stats
+        exact: Whether stats holds exact counts; estimates are listed for
+            tables only, without pages
+    
+    Returns:
+        List of report lines
+    """
+    if exact:
+        lines = [f"  {'Table/Index':<32}{'Rows':>10}{'Pages':>8}"]
+    else:
+        lines = [f"  {'Table':<32}{'Rows (est.)':>12}"]
+    for name, obj_type, rows, pages in stats:
+        rows_text = '' if rows is None else str(rows)
+        if not exact:
+            if obj_type == 'table':
+                lines.append(f"  {name:<32}{rows_text:>12}")
+            continue
+        label = name if obj_type == 'table' else f"  {name}"
+        pages_text = '?' if pages is None else str(pages)
+        lines.append(f"  {label:<32}{rows_text:>10}{pages_text:>8}")
+    return lines
+
+def format_report(conn, last_run=None, last_actions=None, exact=True, table_lines=None):
+    """
+    Build a text report of database statistics
+    
+    Args:
+        conn: SQLite connection
+        last_run: Optional datetime of the last maintenance run
+        last_actions: Optional list of actions from the last run
+        exact: Count rows and pages; False lists estimated rows only, which
+            is fast enough for the UI thread
+        table_lines: Optional per-table lines to show instead of reading
+            them, e.g. from format_table_stats
+    
+    Returns:
+        List of report lines
+    """
+    stats = database_stats(conn)
+    report = []
+    report.append(f"File size: {stats['file_size'] / 1024:.1f} KB "
+                  f"({stats['page_count']} pages of {stats['page_size']} bytes)")
+    report.append(f"Free pages: {stats['freelist_count']} ({stats['free_bytes'] / 1024:.1f} KB)")
+    report.append(f"Auto vacuum: {stats['auto_vacuum']}")
+    report.append(f"Planner statistics: {'present' if stats['has_statistics'] else 'missing'}")
+    report.append("")
+    
+    if table_lines is None:
+        table_lines = format_table_stats(table_stats(conn, exact), exact)
+    report.extend(table_lines)
+    report.append("")
+    
+    if last_run:
+        report.append(f"Last maintenance: {last_run.strftime('%Y-%m-%d %H:%M')}")
+        for action in last_actions or []:
+            report.append(f"  {action}")
+    else:
+        report.append("Last maintenance: not run this session")
+    return report
+
+class MaintenanceScheduler:
+    """Runs maintenance on a worker thread once the application has been idle"""
+    
+    def __init__(self, root, db_path=DEFAULT_DB_PATH, idle_seconds=IDLE_SECONDS,
+                 min_hours=MIN_HOURS_BETWEEN_RUNS):
+        self.root = root
+        self.db_path = db_path
+        self.idle_seconds = idle_seconds
+        self.min_seconds = min_hours * 3600
+        
+        self.last_activity = time.monotonic()
+        self.last_run = None
+        self.last_actions = []
+        self.last_error = None
+        self._started = None
+        self._after_id = None
+        self._thread = None
+        self._callbacks = []
+    
+    def start(self):
+        """Track user activity and check for idle time periodically"""
+        for sequence in ('<Any-KeyPress>', '<Any-ButtonPress>', '<Motion>'):
+            self.root.bind_all(sequence, self._activity, add='+')
+        self._after_id = self.root.after(CHECK_INTERVAL_MS, self._check)
+    
+    def stop(self):
+        """Cancel idle checks"""
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def _activity(self, event=None):
+        self.last_activity = time.monotonic()
+    
+    def _check(self):
+        idle = time.monotonic() - self.last_activity
+        due = self._started is None or time.monotonic() - self._started >= self.min_seconds
+        if idle >= self.idle_seconds and due:
+            self.run_now()
+        self._after_id = self.root.after(CHECK_INTERVAL_MS, self._check)
+    
+    def run_now(self, on_complete=None):
+        """
+        Start maintenance immediately
+        
+        Args:
+            on_complete: Optional callback(actions, error) run on the Tk thread
+        """
+        if on_complete:
+            self._callbacks.append(on_complete)
+        if self.is_running():
+            return
+        
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self.root.after(200, self._poll)
+    
+    def _worker(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            self.last_actions = run_maintenance(conn)
+            self.last_run = datetime.now()
+            self.last_error = None
+        except sqlite3.Error as e:
+            self.last_error = e
+        finally:
+            conn.close()
+    
+    def _poll(self):
+        if self.is_running():
+            self.root.after(200, self._poll)
+            return
+        
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self.last_actions, self.last_error)
+    
+    def collect_table_stats(self, on_complete):
+        """
+        Count rows and pages of every table on a worker thread
+        
+        Args:
+            on_complete: Callback(stats, error) run on the Tk thread, where
+                stats is the exact result of table_stats
+        """
+        result = {'stats': None, 'error': None}
+        
+        def work():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                result['stats'] = table_stats(conn)
+            except sqlite3.Error as e:
+                result['error'] = e
+            finally:
+                conn.close()
+        
+        def poll():
+            if thread.is_alive():
+                self.root.after(200, poll)
+                return
+            on_complete(result['stats'], result['error'])
+        
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        self.root.after(200, poll)
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer database maintenance")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('report', help="Show page and row statistics")
+    subparsers.add_parser('run', help="Run ANALYZE, rebuild project totals and vacuum now")
+    
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} not found")
+    
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        if args.command == 'run':
+            for action in run_maintenance(conn):
+                print(action)
+            print()
+        print('\n'.join(format_report(conn)))
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
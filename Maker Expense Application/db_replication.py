@@ -0,0 +1,506 @@
+"""
+Change log and incremental replication for Project Pricer
+While a replica is configured, every write to the core tables is captured
+by triggers in an append-only change_log table. The Replicator ships only
+new log entries to a secondary SQLite file (for example on a mounted share),
+so redundancy does not require recopying the whole database. Without a
+replica the triggers are removed, so writes are not logged at all; a replica
+that missed writes while capture was off is rebuilt from a full copy.
+
+Command line usage:
+    python db_replication.py sync <replica>
+    python db_replication.py status <replica>
+    python db_replication.py stop
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INTERVAL_SECONDS = 60
+
+REPLICATED_TABLES = ('profiles', 'tools', 'projects', 'materials', 'labor', 'tool_usage', 'cut_parts',
+                     'material_prices')
+
+OPERATIONS = {'INSERT': 'I', 'UPDATE': 'U', 'DELETE': 'D'}
+
+def table_columns(cursor, table, schema='main'):
+    """Return the column names of a table"""
+    cursor.execute(f'PRAGMA {schema}.table_info({table})')
+    return [row[1] for row in cursor.fetchall()]
+
+def row_json_sql(columns, alias):
+    """Build a json_object() expression capturing a row image"""
+    pairs = ', '.join(f"'{col}', {alias}.{col}" for col in columns)
+    return f'json_object({pairs})'
+
+def install_change_log(cursor):
+    """
+    Create the change log table and (re)create its capture triggers
+    
+    Triggers are rebuilt on every start so they always match the current
+    columns of each table after schema changes.
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            old_data TEXT,
+            new_data TEXT,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+    ''')
+    
+    # Entries are never edited once written
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS change_log_append_only
+        BEFORE UPDATE ON change_log
+        BEGIN
+            SELECT RAISE(ABORT, 'change_log is append-only');
+        END
+    ''')
+    
+    for table in REPLICATED_TABLES:
+        columns = table_columns(cursor, table)
+        for event, op in OPERATIONS.items():
+            trigger = f'change_log_{table}_{event.lower()}'
+            old_data = row_json_sql(columns, 'OLD') if op != 'I' else 'NULL'
+            new_data = row_json_sql(columns, 'NEW') if op != 'D' else 'NULL'
+            row_id = 'OLD.id' if op == 'D' else 'NEW.id'
+            
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'''
+                CREATE TRIGGER {trigger}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op, old_data, new_data)
+                    VALUES ('{table}', {row_id}, '{op}', {old_data}, {new_data});
+                END
+            ''')
+
+def stop_change_log(cursor):
+    """
+    Remove the capture triggers and empty the change log
+    
+    The log's sequence is advanced past its last entry, so a replica that
+    later resumes sees a gap for the writes made while nothing was captured
+    and is reseeded.
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    cursor.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'trigger' AND name LIKE 'change_log%' AND name != 'change_log_append_only'
+    ''')
+    triggers = [row[0] for row in cursor.fetchall()]
+    if not triggers:
+        return
+    for trigger in triggers:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute('DELETE FROM change_log')
+    
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+    row = cursor.fetchone()
+    if row:
+        cursor.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'change_log'")
+    else:
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', 1)")
+
+def drop_change_log(cursor):
+    """Remove the change log table and its triggers"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_log%'")
+    for (trigger,) in cursor.fetchall():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute('DROP TABLE IF EXISTS change_log')
+
+def trim_change_log(cursor, through_seq):
+    """
+    Delete change log entries that have already been shipped
+    
+    Args:
+        cursor: SQLite cursor
+        through_seq: Highest sequence number confirmed by the replica
+    """
+    cursor.execute('DELETE FROM change_log WHERE seq <= ?', (through_seq,))
+
+class Replicator:
+    """Ships change log entries from a source database to a replica file"""
+    
+    def __init__(self, source_path, replica_path, batch_size=DEFAULT_BATCH_SIZE):
+        self.source_path = source_path
+        self.replica_path = replica_path
+        self.batch_size = batch_size
+    
+    def _connect(self):
+        source = sqlite3.connect(self.source_path)
+        replica = sqlite3.connect(self.replica_path)
+        # INSERT OR REPLACE must fire delete triggers so the replica's
+        # project_totals rollup subtracts the row being replaced
+        replica.execute('PRAGMA recursive_triggers = ON')
+        return source, replica
+    
+    def needs_seed(self, source, replica):
+        """Check whether the replica has to be rebuilt from a full copy"""
+        cursor = replica.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'replication_state'")
+        if not cursor.fetchone():
+            return True
+        
+        # Schema migrations on the source invalidate the replica layout
+        source_version = source.execute('PRAGMA user_version').fetchone()[0]
+        replica_version = replica.execute('PRAGMA user_version').fetchone()[0]
+        if source_version != replica_version:
+            return True
+        
+        # A cursor ahead of the source means the source was restored from an
+        # older backup; one behind the oldest remaining log entry, or behind
+        # the sequence of an empty log, means entries were trimmed or capture
+        # was stopped before this replica received them
+        last_seq = self.checkpoint(replica)
+        row = source.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        sequence = row[0] if row else 0
+        if last_seq > sequence:
+            return True
+        oldest = source.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+        if oldest is None:
+            return last_seq < sequence
+        return last_seq < oldest - 1
+    
+    def seed(self, source, replica):
+        """
+        Rebuild the replica from a full copy of the source
+        
+        The copy goes through the backup API, and the checkpoint is taken
+        from the copied change log so it matches the copied data exactly.
+        """
+        source.backup(replica)
+        
+        # sqlite_sequence still holds the last sequence after the log is trimmed
+        cursor = replica.cursor()
+        row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        last_seq = row[0] if row else 0
+        drop_change_log(cursor)
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS replication_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                source_path TEXT,
+                last_seq INTEGER NOT NULL,
+                last_sync TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS replication_conflicts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                seq INTEGER NOT NULL,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                expected TEXT,
+                found TEXT,
+                detected_at TEXT
+            )
+        ''')
+        cursor.execute('DELETE FROM replication_state')
+        cursor.execute(
+            'INSERT INTO replication_state (id, source_path, last_seq, last_sync) VALUES (1, ?, ?, ?)',
+            (os.path.abspath(self.source_path), last_seq, datetime.now().isoformat())
+        )
+        replica.commit()
+    
+    def checkpoint(self, replica):
+        """Return the last change log sequence applied to the replica"""
+        row = replica.execute('SELECT last_seq FROM replication_state WHERE id = 1').fetchone()
+        return row[0] if row else 0
+    
+    def _apply(self, cursor, entry, columns_cache):
+        """Apply one change log entry, returning a conflict tuple or None"""
+        seq, table, row_id, op, old_data, new_data = entry
+        
+        if table not in columns_cache:
+            columns_cache[table] = table_columns(cursor, table)
+        columns = columns_cache[table]
+        
+        # Compare the replica row with the image the source saw before the change
+        cursor.execute(f'SELECT {row_json_sql(columns, table)} FROM {table} WHERE id = ?', (row_id,))
+        current = cursor.fetchone()
+        current = current[0] if current else None
+        
+        if op == 'I':
+            expected = None
+            conflict = current is not None and current != new_data
+        else:
+            expected = old_data
+            conflict = current != old_data
+        
+        # The source is authoritative; conflicts are recorded, then overwritten
+        if op == 'D':
+            cursor.execute(f'DELETE FROM {table} WHERE id = ?', (row_id,))
+        else:
+            values = ', '.join(f"json_extract(?1, '$.{col}')" for col in columns)
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) SELECT {values}',
+                (new_data,)
+            )
+        
+        if conflict:
+            return (seq, table, row_id, op, expected, current)
+        return None
+    
+    def sync(self, max_batches=None):
+        """
+        Ship new change log entries to the replica in batches
+        
+        Args:
+            max_batches: Optional limit on batches shipped in this call
+        
+        Returns:
+            Dictionary with shipped, conflicts, last_seq and seeded keys
+        """
+        source, replica = self._connect()
+        stats = {'shipped': 0, 'conflicts': 0, 'last_seq': 0, 'seeded': False}
+        try:
+            if self.needs_seed(source, replica):
+                self.seed(source, replica)
+                stats['seeded'] = True
+            
+            last_seq = self.checkpoint(replica)
+            columns_cache = {}
+            batches = 0
+            
+            while max_batches is None or batches < max_batches:
+                entries = source.execute('''
+                    SELECT seq, table_name, row_id, op, old_data, new_data
+                    FROM change_log
+                    WHERE seq > ?
+                    ORDER BY seq
+                    LIMIT ?
+                ''', (last_seq, self.batch_size)).fetchall()
+                if not entries:
+                    break
+                
+                # Each batch and its checkpoint commit together
+                cursor = replica.cursor()
+                cursor.execute('BEGIN')
+                conflicts = []
+                for entry in entries:
+                    conflict = self._apply(cursor, entry, columns_cache)
+                    if conflict:
+                        conflicts.append(conflict + (datetime.now().isoformat(),))
+                
+                cursor.executemany('''
+                    INSERT INTO replication_conflicts
+                        (seq, table_name, row_id, op, expected, found, detected_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', conflicts)
+                last_seq = entries[-1][0]
+                cursor.execute(
+                    'UPDATE replication_state SET last_seq = ?, last_sync = ? WHERE id = 1',
+                    (last_seq, datetime.now().isoformat())
+                )
+                replica.commit()
+                
+                stats['shipped'] += len(entries)
+                stats['conflicts'] += len(conflicts)
+                batches += 1
+            
+            stats['last_seq'] = last_seq
+        except Exception:
+            if replica.in_transaction:
+                replica.rollback()
+            raise
+        finally:
+            source.close()
+            replica.close()
+        return stats
+    
+    def lag(self):
+        """
+        Measure how far the replica is behind the source
+        
+        Returns:
+            Tuple of (pending_entries, seconds_behind)
+        """
+        source = sqlite3.connect(self.source_path)
+        try:
+            last_seq = 0
+            if os.path.exists(self.replica_path):
+                replica = sqlite3.connect(self.replica_path)
+                try:
+                    last_seq = self.checkpoint(replica)
+                except sqlite3.OperationalError:
+                    last_seq = 0
+                finally:
+                    replica.close()
+            
+            pending, oldest = source.execute('''
+                SELECT COUNT(*), MIN(changed_at) FROM change_log WHERE seq > ?
+            ''', (last_seq,)).fetchone()
+        finally:
+            source.close()
+        
+        if not pending:
+            return 0, 0.0
+        # changed_at is recorded in UTC by SQLite
+        oldest = datetime.fromisoformat(oldest).replace(tzinfo=timezone.utc)
+        seconds = (datetime.now(timezone.utc) - oldest).total_seconds()
+        return pending, max(seconds, 0.0)
+
+class ReplicationScheduler:
+    """Runs Replicator.sync periodically on a worker thread, driven by the Tk event loop"""
+    
+    def __init__(self, root, source_path, replica_path, interval_seconds=DEFAULT_INTERVAL_SECONDS,
+                 trim=True):
+        self.root = root
+        self.replicator = Replicator(source_path, replica_path)
+        self.interval_ms = int(interval_seconds * 1000)
+        self.trim = trim
+        
+        self.last_stats = None
+        self.last_error = None
+        self._after_id = None
+        self._thread = None
+        self._callbacks = []
+    
+    def start(self):
+        """Schedule periodic replication"""
+        self._after_id = self.root.after(self.interval_ms, self._scheduled)
+    
+    def stop(self):
+        """Cancel periodic replication"""
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def run_now(self, on_complete=None):
+        """
+        Start a sync immediately
+        
+        Args:
+            on_complete: Optional callback(stats, error) run on the Tk thread
+        """
+        if on_complete:
+            self._callbacks.append(on_complete)
+        if self.is_running():
+            return
+        
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self.root.after(200, self._poll)
+    
+    def _scheduled(self):
+        self.run_now()
+        self._after_id = self.root.after(self.interval_ms, self._scheduled)
+    
+    def _worker(self):
+        try:
+            self.last_stats = self.replicator.sync()
+            self.last_error = None
+            if self.trim and self.last_stats['last_seq']:
+                conn = sqlite3.connect(self.replicator.source_path, timeout=30)
+                try:
+                    trim_change_log(conn.cursor(), self.last_stats['last_seq'])
+                    conn.commit()
+                finally:
+                    conn.close()
+        except (sqlite3.Error, OSError) as e:
+            self.last_error = e
+    
+    def _poll(self):
+        if self.is_running():
+            self.root.after(200, self._poll)
+            return
+        
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self.last_stats, self.last_error)
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer replication")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Source database file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    sync_parser = subparsers.add_parser('sync', help="Ship new changes to the replica")
+    sync_parser.add_argument('replica', help="Replica database file")
+    sync_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    sync_parser.add_argument('--watch', type=float, metavar='SECONDS',
+                             help="Keep syncing at this interval")
+    status_parser = subparsers.add_parser('status', help="Show replication lag")
+    status_parser.add_argument('replica', help="Replica database file")
+    subparsers.add_parser('stop', help="Forget the replica and stop capturing changes")
+    
+    args = parser.parse_args()
+    
+    # The replica is registered in settings like File > Set Replica File...,
+    # so the application keeps capturing changes for it and trims the log
+    from db_locking import write_transaction
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = 'replica_path'").fetchone()
+        configured = row[0] if row and row[0] else None
+        if args.command == 'stop':
+            with write_transaction(conn) as cursor:
+                cursor.execute("DELETE FROM settings WHERE key = 'replica_path'")
+                stop_change_log(cursor)
+            print(f"Stopped replicating to {configured}" if configured else "No replica configured")
+            return 0
+        
+        same = configured and os.path.normcase(os.path.abspath(configured)) == \
+            os.path.normcase(os.path.abspath(args.replica))
+        if args.command == 'sync' and configured and not same:
+            parser.error(f"{args.db} already replicates to {configured}; run 'stop' first to change replicas")
+        if args.command == 'status' and not same:
+            parser.error(f"{args.replica} is not the configured replica of {args.db}")
+        if not configured:
+            with write_transaction(conn) as cursor:
+                cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('replica_path', ?)",
+                               (os.path.abspath(args.replica),))
+                install_change_log(cursor)
+    finally:
+        conn.close()
+    
+    replicator = Replicator(args.db, args.replica, getattr(args, 'batch_size', DEFAULT_BATCH_SIZE))
+    
+    if args.command == 'sync':
+        while True:
+            stats = replicator.sync()
+            if stats['seeded']:
+                print(f"Replica seeded from full copy: {args.replica}")
+            print(f"Shipped {stats['shipped']} changes "
+                  f"({stats['conflicts']} conflicts), checkpoint {stats['last_seq']}")
+            # The registered replica is the log's only reader
+            if stats['last_seq']:
+                conn = sqlite3.connect(args.db, timeout=30)
+                try:
+                    trim_change_log(conn.cursor(), stats['last_seq'])
+                    conn.commit()
+                finally:
+                    conn.close()
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    
+    elif args.command == 'status':
+        pending, seconds = replicator.lag()
+        print(f"Pending changes: {pending}")
+        print(f"Lag: {seconds:.1f} seconds")
+    
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+"""
+Change events for Project Pricer
+Writes publish a ChangeEvent naming the table, operation and rows they
+touched. Views subscribe with the tables they show and a visibility check;
+events are coalesced so a burst of writes costs each visible view one
+redraw, and hidden views catch up when they are next shown.
+"""
+
+# Delay before delivering a burst of events; about one frame
+FRAME_MS = 16
+
+class ChangeEvent:
+    """A committed write to one table"""
+    
+    __slots__ = ('table', 'op', 'row_ids', 'project_id', 'profile_id', 'source')
+    
+    def __init__(self, table, op, row_ids=(), project_id=None, profile_id=None, source=None):
+        # op is 'insert', 'update' or 'delete'; row_ids may be empty for bulk changes
+        self.table = table
+        self.op = op
+        self.row_ids = tuple(row_ids)
+        self.project_id = project_id
+        self.profile_id = profile_id
+        # The widget that made the change, if it already shows the result
+        self.source = source
+    
+    def __repr__(self):
+        return (f"ChangeEvent({self.table!r}, {self.op!r}, {self.row_ids!r}, "
+                f"project_id={self.project_id!r}, profile_id={self.profile_id!r})")
+
+# Published when everything may have changed, e.g. after restoring a backup
+ALL_TABLES = '*'
+
+class _Subscription:
+    __slots__ = ('callback', 'tables', 'accepts', 'is_visible', 'pending')
+    
+    def __init__(self, callback, tables, accepts, is_visible):
+        self.callback = callback
+        self.tables = tables
+        self.accepts = accepts
+        self.is_visible = is_visible
+        self.pending = []
+    
+    def wants(self, event):
+        if event.table != ALL_TABLES and self.tables is not None and event.table not in self.tables:
+            return False
+        return self.accepts is None or event.table == ALL_TABLES or self.accepts(event)
+
+class EventBus:
+    """Delivers change events to subscribed views once per frame"""
+    
+    def __init__(self, root=None):
+        # Without a Tk root events are delivered immediately
+        self.root = root
+        self._subscriptions = []
+        self._scheduled = None
+    
+    def subscribe(self, callback, tables=None, accepts=None, is_visible=None):
+        """
+        Register a view
+        
+        Args:
+            callback: Called with the list of pending events
+            tables: Table names the view shows, or None for all
+            accepts: Optional filter called with each matching event
+            is_visible: Optional function; while it returns False events are
+                held until a later flush() finds the view visible
+        
+        Returns:
+            Subscription token for unsubscribe()
+        """
+        subscription = _Subscription(callback, None if tables is None else frozenset(tables),
+                                     accepts, is_visible)
+        self._subscriptions.append(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+    
+    def publish(self, table, op, row_ids=(), project_id=None, profile_id=None, source=None):
+        """Queue an event for every subscriber that wants it"""
+        event = ChangeEvent(table, op, row_ids, project_id, profile_id, source)
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                subscription.pending.append(event)
+        
+        if self.root is None:
+            self.flush()
+        elif self._scheduled is None:
+            self._scheduled = self.root.after(FRAME_MS, self.flush)
+        return event
+    
+    def flush(self):
+        """Deliver pending events to visible subscribers; call when a view is shown"""
+        self._scheduled = None
+        for subscription in list(self._subscriptions):
+            self._deliver(subscription)
+    
+    def _deliver(self, subscription):
+        if not subscription.pending:
+            return
+        if subscription.is_visible is not None and not subscription.is_visible():
+            return
+        events = subscription.pending
+        subscription.pending = []
+        subscription.callback(events)
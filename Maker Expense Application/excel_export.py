@@ -2,16 +2,55 @@
 Excel export functionality for Project Pricer
 Requires: pip install openpyxl
 """
+import os
+import sqlite3
+import tempfile
+import threading
 from datetime import datetime
+from urllib.request import pathname2url
 
-def export_project_to_excel(cursor, project_id, filename):
+from db_locking import read_transaction
+from models import LaborEntry, Material, ToolUsage, select
+from money import CURRENCY_FORMAT, from_cents
+from pricing import project_costs
+
+# Rows written between progress reports and cancel checks
+PROGRESS_EVERY = 50
+# Excel number format for hourly rates
+RATE_FORMAT = '"$"#,##0.00"/hr"'
+
+class ExportCancelled(Exception):
+    """Raised inside an export when its cancel event is set"""
+
+def count_export_rows(cursor, project_id, scenarios=None):
+    """Number of line item and scenario rows an export will write"""
+    cursor.execute('''
+        SELECT (SELECT COUNT(*) FROM materials WHERE project_id = :id)
+             + (SELECT COUNT(*) FROM labor WHERE project_id = :id)
+             + (SELECT COUNT(*) FROM tool_usage WHERE project_id = :id)
+    ''', {'id': project_id})
+    total = cursor.fetchone()[0]
+    if scenarios is not None:
+        total += len(scenarios)
+    return total
+
+def export_project_to_excel(cursor, project_id, filename, scenarios=None, simulation=None,
+                            progress=None, cancel=None):
     """
     Export a project to Excel format
     
+    The workbook is saved to a temporary file next to filename and renamed
+    over it only once complete, so a failed or cancelled export never leaves
+    a partial file behind.
+    
     Args:
         cursor: SQLite cursor
         project_id: ID of project to export
         filename: Path to save Excel file
+        scenarios: Optional ScenarioGrid added as a "What-If Scenarios" sheet
+        simulation: Optional Monte Carlo result added to the same sheet
+        progress: Optional callback(rows_done, rows_total)
+        cancel: Optional threading.Event; setting it raises ExportCancelled
     """
     try:
         from openpyxl import Workbook
@@ -27,7 +66,7 @@ def export_project_to_excel(cursor, project_id, filename):
     
     # Get project details
     cursor.execute('''
-        SELECT p.name, p.description, p.created_date, pr.name, pr.hourly_rate
+        SELECT p.name, p.description, p.created_date, pr.name, pr.hourly_rate_cents
         FROM projects p
         JOIN profiles pr ON p.profile_id = pr.id
         WHERE p.id = ?
@@ -37,7 +76,20 @@ def export_project_to_excel(cursor, project_id, filename):
     if not project:
         raise ValueError("Project not found")
     
-    project_name, description, created_date, profile_name, hourly_rate = project
+    project_name, description, created_date, profile_name, hourly_rate_cents = project
+    # Subtotals and the grand total are exact sums computed by SQL
+    costs = project_costs(cursor, project_id)
+    
+    total_rows = count_export_rows(cursor, project_id, scenarios)
+    done = [0]
+    
+    def step():
+        done[0] += 1
+        if done[0] % PROGRESS_EVERY == 0:
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            if progress:
+                progress(done[0], total_rows)
     
     # Styles
     title_font = Font(size=16, bold=True)
@@ -79,7 +131,8 @@ def export_project_to_excel(cursor, project_id, filename):
     
     row += 1
     ws[f'A{row}'] = "Hourly Rate:"
-    ws[f'B{row}'] = f"${hourly_rate:.2f}"
+    ws[f'B{row}'] = from_cents(hourly_rate_cents)
+    ws[f'B{row}'].number_format = CURRENCY_FORMAT
     ws[f'A{row}'].font = Font(bold=True)
     
     # Materials section
@@ -97,27 +150,19 @@ def export_project_to_excel(cursor, project_id, filename):
         cell.alignment = Alignment(horizontal='center')
         cell.border = border
     
-    # Get materials
-    cursor.execute('''
-        SELECT name, quantity, unit_cost
-        FROM materials
-        WHERE project_id = ?
-    ''', (project_id,))
-    materials = cursor.fetchall()
-    
-    materials_total = 0
-    for mat in materials:
+    # Materials are streamed from the cursor as they are written
+    for mat in select(cursor, Material, 'WHERE project_id = ?', (project_id,), 'ORDER BY id'):
         row += 1
-        total = (mat[1] or 0) * (mat[2] or 0)
-        materials_total += total
-        
-        ws[f'A{row}'] = mat[0]
-        ws[f'B{row}'] = mat[1]
-        ws[f'C{row}'] = f"${mat[2]:.2f}"
-        ws[f'D{row}'] = f"${total:.2f}"
+        ws[f'A{row}'] = mat.name
+        ws[f'B{row}'] = mat.quantity
+        ws[f'C{row}'] = from_cents(mat.unit_cost_cents or 0)
+        ws[f'C{row}'].number_format = CURRENCY_FORMAT
+        ws[f'D{row}'] = from_cents(mat.total_cents)
+        ws[f'D{row}'].number_format = CURRENCY_FORMAT
         
         for col in range(1, 5):
             ws.cell(row=row, column=col).border = border
+        step()
     
     # Materials subtotal
     row += 1
@@ -129,7 +174,8 @@ def export_project_to_excel(cursor, project_id, filename):
     cell.alignment = Alignment(horizontal='right')
     
     cell = ws[f'D{row}']
-    cell.value = f"${materials_total:.2f}"
+    cell.value = from_cents(costs['materials'])
+    cell.number_format = CURRENCY_FORMAT
     cell.font = Font(bold=True)
     cell.fill = subtotal_fill
     
@@ -152,26 +198,18 @@ def export_project_to_excel(cursor, project_id, filename):
         cell.border = border
     
     # Get labor
-    cursor.execute('''
-        SELECT description, hours
-        FROM labor
-        WHERE project_id = ?
-    ''', (project_id,))
-    labor = cursor.fetchall()
-    
-    labor_total = 0
-    for lab in labor:
+    for lab in select(cursor, LaborEntry, 'WHERE l.project_id = ?', (project_id,), 'ORDER BY l.id'):
         row += 1
-        total = (lab[1] or 0) * hourly_rate
-        labor_total += total
-        
-        ws[f'A{row}'] = lab[0]
-        ws[f'B{row}'] = lab[1]
-        ws[f'C{row}'] = f"${hourly_rate:.2f}/hr"
-        ws[f'D{row}'] = f"${total:.2f}"
+        ws[f'A{row}'] = lab.description
+        ws[f'B{row}'] = lab.hours
+        ws[f'C{row}'] = from_cents(hourly_rate_cents)
+        ws[f'C{row}'].number_format = RATE_FORMAT
+        ws[f'D{row}'] = from_cents(lab.total_cents)
+        ws[f'D{row}'].number_format = CURRENCY_FORMAT
         
         for col in range(1, 5):
             ws.cell(row=row, column=col).border = border
+        step()
     
     # Labor subtotal
     row += 1
@@ -183,7 +221,8 @@ def export_project_to_excel(cursor, project_id, filename):
     cell.alignment = Alignment(horizontal='right')
     
     cell = ws[f'D{row}']
-    cell.value = f"${labor_total:.2f}"
+    cell.value = from_cents(costs['labor'])
+    cell.number_format = CURRENCY_FORMAT
     cell.font = Font(bold=True)
     cell.fill = subtotal_fill
     
@@ -206,27 +245,18 @@ def export_project_to_excel(cursor, project_id, filename):
         cell.border = border
     
     # Get tool usage
-    cursor.execute('''
-        SELECT t.name, tu.hours, t.cost_per_hour
-        FROM tool_usage tu
-        JOIN tools t ON tu.tool_id = t.id
-        WHERE tu.project_id = ?
-    ''', (project_id,))
-    tools = cursor.fetchall()
-    
-    tools_total = 0
-    for tool in tools:
+    for tool in select(cursor, ToolUsage, 'WHERE tu.project_id = ?', (project_id,), 'ORDER BY tu.id'):
         row += 1
-        total = (tool[1] or 0) * (tool[2] or 0)
-        tools_total += total
-        
-        ws[f'A{row}'] = tool[0]
-        ws[f'B{row}'] = tool[1]
-        ws[f'C{row}'] = f"${tool[2]:.2f}/hr"
-        ws[f'D{row}'] = f"${total:.2f}"
+        ws[f'A{row}'] = tool.tool_name
+        ws[f'B{row}'] = tool.hours
+        ws[f'C{row}'] = from_cents(tool.cost_per_hour_cents or 0)
+        ws[f'C{row}'].number_format = RATE_FORMAT
+        ws[f'D{row}'] = from_cents(tool.total_cents)
+        ws[f'D{row}'].number_format = CURRENCY_FORMAT
         
         for col in range(1, 5):
             ws.cell(row=row, column=col).border = border
+        step()
     
     # Tools subtotal
     row += 1
@@ -238,7 +268,8 @@ def export_project_to_excel(cursor, project_id, filename):
     cell.alignment = Alignment(horizontal='right')
     
     cell = ws[f'D{row}']
-    cell.value = f"${tools_total:.2f}"
+    cell.value = from_cents(costs['tools'])
+    cell.number_format = CURRENCY_FORMAT
     cell.font = Font(bold=True)
     cell.fill = subtotal_fill
     
@@ -247,8 +278,6 @@ def export_project_to_excel(cursor, project_id, filename):
     
     # Grand total
     row += 2
-    grand_total = materials_total + labor_total + tools_total
-    
     ws.merge_cells(f'A{row}:C{row}')
     cell = ws[f'A{row}']
     cell.value = "GRAND TOTAL"
@@ -257,7 +286,8 @@ def export_project_to_excel(cursor, project_id, filename):
     cell.alignment = Alignment(horizontal='right')
     
     cell = ws[f'D{row}']
-    cell.value = f"${grand_total:.2f}"
+    cell.value = from_cents(costs['total'])
+    cell.number_format = CURRENCY_FORMAT
     cell.font = total_font
     cell.fill = total_fill
     
@@ -270,6 +300,182 @@ def export_project_to_excel(cursor, project_id, filename):
     ws.column_dimensions['C'].width = 15
     ws.column_dimensions['D'].width = 15
     
-    # Save workbook
-    wb.save(filename)
-    return filename
\ No newline at end of file
+    if scenarios is not None:
+        add_scenario_sheet(wb, scenarios, simulation, step)
+    
+    if cancel is not None and cancel.is_set():
+        raise ExportCancelled()
+    if progress:
+        progress(total_rows, total_rows)
+    
+    # Save workbook to a temporary file, then swap it into place
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(filename) + '.', suffix='.tmp', dir=directory)
+    os.close(fd)
+    try:
+        wb.save(temp_path)
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return filename
+
+def add_scenario_sheet(wb, grid, simulation=None, step=None):
+    """
+    Add what-if scenario results to a workbook
+    
+    Args:
+        wb: openpyxl Workbook
+        grid: ScenarioGrid from scenarios.ProjectScenario.evaluate
+        simulation: Optional result of ProjectScenario.monte_carlo
+        step: Optional callback run after each scenario row
+    
+    Returns:
+        The new worksheet
+    """
+    from openpyxl.styles import Font, PatternFill
+    
+    ws = wb.create_sheet("What-If Scenarios")
+    header_font = Font(size=12, bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    money = CURRENCY_FORMAT
+    percent = '0.0%'
+    
+    ws['A1'] = "WHAT-IF SCENARIOS"
+    ws['A1'].font = Font(size=16, bold=True)
+    
+    summary = grid.summary()
+    ws['A3'] = "Combinations:"
+    ws['B3'] = summary['count']
+    ws['A4'] = "Lowest total:"
+    ws['B4'] = summary['min']
+    ws['A5'] = "Highest total:"
+    ws['B5'] = summary['max']
+    ws['A6'] = "Mean total:"
+    ws['B6'] = summary['mean']
+    for row in range(3, 7):
+        ws[f'A{row}'].font = Font(bold=True)
+    for row in range(4, 7):
+        ws[f'B{row}'].number_format = money
+    
+    row = 8
+    if simulation:
+        ws[f'A{row}'] = f"MONTE CARLO ON LABOR HOURS ({simulation['iterations']} runs)"
+        ws[f'A{row}'].font = Font(bold=True)
+        for label, key in (("Mean", 'mean'), ("Std deviation", 'std'), ("5th percentile", 'p5'),
+                           ("Median", 'p50'), ("95th percentile", 'p95'), ("99th percentile", 'p99')):
+            row += 1
+            ws[f'A{row}'] = label
+            ws[f'B{row}'] = simulation[key]
+            ws[f'B{row}'].number_format = money
+        row += 2
+    
+    headers = ['Hourly Rate', 'Tool Rate Factor', 'Material Inflation', 'Markup',
+               'Materials', 'Labor', 'Tools', 'Total']
+    formats = [money, '0.00', percent, percent, money, money, money, money]
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=row, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+    ws.freeze_panes = ws.cell(row=row + 1, column=1)
+    
+    for values in grid.rows(order='asc'):
+        row += 1
+        for col, (value, fmt) in enumerate(zip(values, formats), 1):
+            ws.cell(row=row, column=col, value=value).number_format = fmt
+        if step:
+            step()
+    
+    for col in 'ABCDEFGH':
+        ws.column_dimensions[col].width = 18
+    return ws
+
+class ExportJob:
+    """Runs an export on a worker thread with its own read-only connection"""
+    
+    PROGRESS_TEXT = "Writing rows: {done} of {total}"
+    CANCELLED_TEXT = "The export was cancelled; no file was written."
+    
+    def __init__(self, root, db_path, project_id, filename, scenarios=None, simulation=None, cache=None):
+        self.root = root
+        self.db_path = db_path
+        self.project_id = project_id
+        self.filename = filename
+        self.scenarios = scenarios
+        self.simulation = simulation
+        # Optional export_cache.ExportCache; what-if exports are never cached
+        self.cache = cache
+        
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self._cancel = threading.Event()
+        self._thread = None
+    
+    def start(self, on_progress=None, on_complete=None):
+        """
+        Start the export
+        
+        Args:
+            on_progress: Optional callback(rows_done, rows_total) run on the Tk thread
+            on_complete: Optional callback(filename, error) run on the Tk thread;
+                error is None, ExportCancelled or the exception raised
+        """
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self.root.after(100, self._poll, on_progress, on_complete)
+    
+    def cancel(self):
+        """Ask the export to stop at its next progress check"""
+        self._cancel.set()
+    
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def is_cancelled(self):
+        return self._cancel.is_set()
+    
+    def _progress(self, done, total):
+        self.done = done
+        self.total = total
+    
+    def _worker(self):
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        try:
+            conn = sqlite3.connect(uri, uri=True, timeout=30)
+        except sqlite3.Error as e:
+            self.error = e
+            return
+        try:
+            self._export(conn.cursor())
+        except Exception as e:
+            self.error = e
+        finally:
+            conn.close()
+    
+    def _export(self, cursor):
+        # Subtotals and line items are read in separate statements; one
+        # snapshot keeps an edit saved meanwhile from splitting them
+        with read_transaction(cursor.connection) as cursor:
+            if self.cache is not None and self.scenarios is None:
+                self.cache.export(cursor, self.project_id, self.filename, progress=self._progress,
+                                  cancel=self._cancel)
+            else:
+                export_project_to_excel(cursor, self.project_id, self.filename, self.scenarios,
+                                        self.simulation, progress=self._progress, cancel=self._cancel)
+    
+    def message(self):
+        """Text shown when the export succeeds"""
+        return f"Project exported to:\n{self.filename}"
+    
+    def _poll(self, on_progress, on_complete):
+        if on_progress:
+            on_progress(self.done, self.total)
+        if self.is_running():
+            self.root.after(100, self._poll, on_progress, on_complete)
+            return
+        if on_complete:
+            on_complete(self.filename, self.error)
@@ -0,0 +1,319 @@
+"""
+Excel estimate import for Project Pricer
+Requires: pip install openpyxl
+
+Reads workbooks written by excel_export (and older spreadsheets laid out
+the same way) row by row in openpyxl's read-only mode, recognizing the
+project details and the MATERIALS, LABOR and TOOL USAGE sections, and
+inserts them as new projects in batched transactions.
+
+Folders are parsed in parallel by a process pool; the database is written
+from the calling process only.
+
+Command line usage:
+    python excel_import.py estimates/              (every .xlsx in the folder)
+    python excel_import.py quote1.xlsx quote2.xlsx --workers 4
+"""
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+
+from db_locking import begin_write
+from money import to_cents
+from price_history import record_prices
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+
+# Projects inserted per transaction
+BATCH_SIZE = 200
+# Name used when a workbook has no profile
+DEFAULT_PROFILE = 'Imported'
+
+SECTIONS = {
+    'MATERIALS': 'materials',
+    'LABOR': 'labor',
+    'TOOL USAGE': 'tools',
+    'TOOLS': 'tools',
+}
+# Column header rows that follow a section title
+HEADER_CELLS = {'item', 'material', 'description', 'tool', 'tool/machine'}
+TITLE_PREFIX = 'PROJECT COST ESTIMATE:'
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("openpyxl is required. Install with: pip install openpyxl")
+    return openpyxl
+
+def parse_number(value):
+    """Read a number from a cell holding 12.5, '$1,234.50' or '$20.00/hr'; None if blank"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace('$', '').replace(',', '')
+    text = re.sub(r'\s*/\s*hr$', '', text, flags=re.IGNORECASE)
+    return float(text) if text else None
+
+def parse_cents(value):
+    """Read an amount in dollars from a cell as integer cents; None if blank"""
+    return to_cents(parse_number(value))
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).isoformat()
+    text = _text(value)
+    if not text:
+        return None
+    return datetime.strptime(text[:10], '%Y-%m-%d').isoformat()
+
+def parse_workbook(path):
+    """
+    Read one estimate workbook
+    
+    Args:
+        path: .xlsx file
+    
+    Returns:
+        Dictionary with name, description, created_date, profile, hourly_rate_cents,
+        materials [(name, quantity, unit_cost_cents)], labor [(description, hours)]
+        and tools [(name, hours, cost_per_hour_cents)]
+    """
+    openpyxl = _openpyxl()
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb['Project Summary'] if 'Project Summary' in wb.sheetnames else wb.worksheets[0]
+        estimate = {
+            'name': None, 'description': None, 'created_date': None, 'profile': None, 'hourly_rate_cents': None,
+            'materials': [], 'labor': [], 'tools': [],
+        }
+        section = None
+        after_title = False
+        for row in ws.iter_rows(values_only=True):
+            cells = (tuple(row) + (None,) * 4)[:4]
+            first = _text(cells[0])
+            key = first.upper()
+            if not first and all(cell in (None, '') for cell in cells):
+                continue
+            # Titles and totals span the first columns, so a row with a value
+            # in column B is a line item whatever its name
+            label_row = cells[1] in (None, '')
+            follows_title, after_title = after_title, False
+            
+            if key.startswith(TITLE_PREFIX) and section is None:
+                estimate['name'] = first[len(TITLE_PREFIX):].strip()
+            elif key in SECTIONS and label_row:
+                section = SECTIONS[key]
+                after_title = True
+            elif (key.endswith('SUBTOTAL') or key == 'GRAND TOTAL') and label_row:
+                section = None
+            elif section is None:
+                label = key.rstrip(':')
+                if label == 'PROFILE':
+                    estimate['profile'] = _text(cells[1]) or None
+                elif label == 'DESCRIPTION':
+                    estimate['description'] = _text(cells[1]) or None
+                elif label in ('CREATED DATE', 'DATE'):
+                    estimate['created_date'] = _date(cells[1])
+                elif label == 'HOURLY RATE':
+                    estimate['hourly_rate_cents'] = parse_cents(cells[1])
+            elif follows_title and first.lower() in HEADER_CELLS:
+                continue
+            elif section == 'materials':
+                estimate['materials'].append((first, parse_number(cells[1]) or 0, parse_cents(cells[2]) or 0))
+            elif section == 'labor':
+                estimate['labor'].append((first or None, parse_number(cells[1]) or 0))
+            else:
+                estimate['tools'].append((first, parse_number(cells[1]) or 0, parse_cents(cells[2]) or 0))
+    finally:
+        wb.close()
+    
+    if not estimate['name']:
+        estimate['name'] = os.path.splitext(os.path.basename(path))[0]
+    return estimate
+
+def _parse_file(path):
+    """Process pool worker: (path, estimate, None) or (path, None, error message)"""
+    try:
+        return path, parse_workbook(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+def _profile_id(cursor, name, hourly_rate_cents, profiles):
+    """Find or create the profile an estimate was priced with"""
+    key = (name, hourly_rate_cents)
+    if key not in profiles:
+        cursor.execute('SELECT id FROM profiles WHERE name = ? AND hourly_rate_cents = ? ORDER BY id LIMIT 1', key)
+        row = cursor.fetchone()
+        if row:
+            profiles[key] = row[0]
+        else:
+            cursor.execute('INSERT INTO profiles (name, hourly_rate_cents, created_date) VALUES (?, ?, ?)',
+                           (name, hourly_rate_cents, datetime.now().isoformat()))
+            profiles[key] = cursor.lastrowid
+    return profiles[key]
+
+def _tool_id(cursor, profile_id, name, rate_cents, tools):
+    """Find or create a tool of a profile"""
+    key = (profile_id, name, rate_cents)
+    if key not in tools:
+        cursor.execute('SELECT id FROM tools WHERE profile_id = ? AND name = ? AND cost_per_hour_cents = ? '
+                       'ORDER BY id LIMIT 1', key)
+        row = cursor.fetchone()
+        if row:
+            tools[key] = row[0]
+        else:
+            cursor.execute('INSERT INTO tools (profile_id, name, cost_per_hour_cents) VALUES (?, ?, ?)', key)
+            tools[key] = cursor.lastrowid
+    return tools[key]
+
+def insert_estimate(cursor, estimate, profiles=None, tools=None):
+    """
+    Insert a parsed estimate as a new project
+    
+    Profiles are matched by name and hourly rate, and tools by name and
+    rate, so imported totals match the workbook; missing ones are created.
+    
+    Args:
+        cursor: SQLite cursor
+        estimate: Result of parse_workbook
+        profiles: Optional dictionary caching profile lookups across calls
+        tools: Optional dictionary caching tool lookups across calls
+    
+    Returns:
+        ID of the new project
+    """
+    profiles = {} if profiles is None else profiles
+    tools = {} if tools is None else tools
+    profile_id = _profile_id(cursor, estimate['profile'] or DEFAULT_PROFILE, estimate['hourly_rate_cents'] or 0,
+                             profiles)
+    created_date = estimate['created_date'] or datetime.now().isoformat()
+    
+    cursor.execute('INSERT INTO projects (profile_id, name, description, created_date) VALUES (?, ?, ?, ?)',
+                   (profile_id, estimate['name'], estimate['description'], created_date))
+    project_id = cursor.lastrowid
+    
+    cursor.executemany('INSERT INTO materials (project_id, name, quantity, unit_cost_cents) VALUES (?, ?, ?, ?)',
+                       [(project_id, name, quantity, unit_cost_cents)
+                        for name, quantity, unit_cost_cents in estimate['materials']])
+    cursor.executemany('INSERT INTO labor (project_id, description, hours) VALUES (?, ?, ?)',
+                       [(project_id, description, hours) for description, hours in estimate['labor']])
+    cursor.executemany('INSERT INTO tool_usage (project_id, tool_id, hours) VALUES (?, ?, ?)',
+                       [(project_id, _tool_id(cursor, profile_id, name, rate_cents, tools), hours)
+                        for name, hours, rate_cents in estimate['tools']])
+    # Quoted costs become price history as of the estimate date
+    record_prices(cursor, [(name, unit_cost_cents, created_date)
+                           for name, _, unit_cost_cents in estimate['materials']], source='import')
+    return project_id
+
+def find_workbooks(paths):
+    """Expand files and folders into a sorted list of .xlsx files"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                if name.lower().endswith('.xlsx') and not name.startswith(('~$', '.')):
+                    found.append(os.path.join(path, name))
+        else:
+            found.append(path)
+    return sorted(found)
+
+def import_workbooks(conn, paths, workers=None, batch_size=BATCH_SIZE, progress=None):
+    """
+    Import estimate workbooks, parsing them in parallel
+    
+    Args:
+        conn: SQLite connection
+        paths: Workbook files and/or folders of workbooks
+        workers: Parser processes (default: CPU count; 1 parses in this process)
+        batch_size: Projects per transaction
+        progress: Optional callback(files_done, files_total)
+    
+    Returns:
+        Dictionary with files, imported (list of (path, project_id)) and
+        failures (list of (path, message))
+    """
+    files = find_workbooks(paths)
+    imported = []
+    failures = []
+    cursor = conn.cursor()
+    profiles = {}
+    tools = {}
+    
+    if workers == 1 or len(files) < 2:
+        results = map(_parse_file, files)
+        pool = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_parse_file, files, chunksize=8)
+    
+    pending = 0
+    try:
+        for done, (path, estimate, error) in enumerate(results, 1):
+            if error is None:
+                try:
+                    # Take the write lock before the savepoint's first lookup
+                    begin_write(conn)
+                    cursor.execute('SAVEPOINT import_estimate')
+                    imported.append((path, insert_estimate(cursor, estimate, profiles, tools)))
+                    cursor.execute('RELEASE import_estimate')
+                    pending += 1
+                except (sqlite3.Error, TypeError, ValueError) as e:
+                    cursor.execute('ROLLBACK TO import_estimate')
+                    cursor.execute('RELEASE import_estimate')
+                    # Lookups made inside the rolled back savepoint are gone
+                    profiles.clear()
+                    tools.clear()
+                    failures.append((path, f"{type(e).__name__}: {e}"))
+            else:
+                failures.append((path, error))
+            
+            if pending >= batch_size:
+                conn.commit()
+                pending = 0
+            if progress:
+                progress(done, len(files))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return {'files': len(files), 'imported': imported, 'failures': failures}
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Import Excel estimates as Project Pricer projects")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('paths', nargs='+', help=".xlsx files and/or folders of them")
+    parser.add_argument('--workers', type=int, help="Parser processes (default: CPU count)")
+    args = parser.parse_args()
+    
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        result = import_workbooks(conn, args.paths, args.workers)
+    except (ImportError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    
+    for path, message in result['failures']:
+        print(f"FAILED  {path}: {message}")
+    print(f"{len(result['imported'])} of {result['files']} workbooks imported, "
+          f"{len(result['failures'])} failed")
+    return 1 if result['failures'] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,351 @@
+"""
+Excel export cache for Project Pricer
+Every project carries a content version that triggers replace with a new
+random value whenever anything its workbook shows changes: the project, its
+line items, its profile's rate or the rates of the tools it uses. Finished
+workbooks (and HTML quotes, see html_quote) are kept in a size-bounded folder
+keyed by project and version, so exporting an unchanged project again is a
+file copy and a bulk export only regenerates the projects that changed.
+
+Command line usage:
+    python export_cache.py export out/             (every project)
+    python export_cache.py export out/ --project 12 --project 15
+    python export_cache.py stats
+    python export_cache.py clear
+"""
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+
+from db_locking import read_transaction
+from excel_export import ExportCancelled, ExportJob, export_project_to_excel
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+DEFAULT_CACHE_DIR = 'export_cache'
+# Least recently used workbooks are removed beyond this size
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# Part of every cache key; bump when the workbook layout changes so files
+# written by older code are not served
+EXPORT_FORMAT = 1
+WORKBOOK_SUFFIX = f'f{EXPORT_FORMAT}.xlsx'
+# Kinds of file kept in the cache
+CACHED_EXTENSIONS = ('.xlsx', '.html')
+
+def install_project_versions(cursor):
+    """
+    Create the project_versions table and the triggers that bump it
+    
+    Versions are random rather than counters so a version seen before a
+    backup restore is never mistaken for the restored project's content.
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_versions (
+            project_id INTEGER PRIMARY KEY,
+            content_version INTEGER NOT NULL
+        )
+    ''')
+    
+    bump = 'UPDATE project_versions SET content_version = random() WHERE project_id IN ({ids});'
+    triggers = {
+        'project_versions_projects_insert': ('AFTER INSERT ON projects', '''
+            INSERT OR REPLACE INTO project_versions (project_id, content_version) VALUES (NEW.id, random());
+        '''),
+        'project_versions_projects_update': ('AFTER UPDATE ON projects', bump.format(ids='OLD.id, NEW.id')),
+        'project_versions_projects_delete': ('AFTER DELETE ON projects', '''
+            DELETE FROM project_versions WHERE project_id = OLD.id;
+        '''),
+    }
+    for table in ('materials', 'labor', 'tool_usage'):
+        triggers[f'project_versions_{table}_insert'] = (f'AFTER INSERT ON {table}',
+                                                        bump.format(ids='NEW.project_id'))
+        triggers[f'project_versions_{table}_update'] = (f'AFTER UPDATE ON {table}',
+                                                        bump.format(ids='OLD.project_id, NEW.project_id'))
+        triggers[f'project_versions_{table}_delete'] = (f'AFTER DELETE ON {table}',
+                                                        bump.format(ids='OLD.project_id'))
+    # Inserts count too, since replicas apply updates as INSERT OR REPLACE
+    for table, ids in (('profiles', 'SELECT id FROM projects WHERE profile_id = {row}.id'),
+                       ('tools', 'SELECT project_id FROM tool_usage WHERE tool_id = {row}.id')):
+        triggers[f'project_versions_{table}_insert'] = (f'AFTER INSERT ON {table}',
+                                                        bump.format(ids=ids.format(row='NEW')))
+        triggers[f'project_versions_{table}_update'] = (f'AFTER UPDATE ON {table}',
+                                                        bump.format(ids=ids.format(row='NEW')))
+        triggers[f'project_versions_{table}_delete'] = (f'AFTER DELETE ON {table}',
+                                                        bump.format(ids=ids.format(row='OLD')))
+    
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+    
+    cursor.execute('''
+        INSERT OR IGNORE INTO project_versions (project_id, content_version)
+        SELECT id, random() FROM projects
+    ''')
+    cursor.execute('DELETE FROM project_versions WHERE project_id NOT IN (SELECT id FROM projects)')
+
+def content_version(cursor, project_id):
+    """A project's content version, or None if it has none"""
+    cursor.execute('SELECT content_version FROM project_versions WHERE project_id = ?', (project_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def _copy_file(source, filename):
+    """Copy to a temporary file next to filename, then rename it into place"""
+    folder = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=folder)
+    os.close(fd)
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class ExportCache:
+    """Size-bounded folder of exported workbooks keyed by project content version"""
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+    
+    def path(self, project_id, version, suffix=WORKBOOK_SUFFIX):
+        # Versions are signed 64-bit; mask them to a fixed-width hex name
+        return os.path.join(self.cache_dir,
+                            f"project_{project_id}_{version & 0xFFFFFFFFFFFFFFFF:016x}_{suffix}")
+    
+    def get(self, project_id, version, suffix=WORKBOOK_SUFFIX):
+        """
+        Look up a cached workbook
+        
+        Args:
+            project_id: Project ID
+            version: The project's content version
+            suffix: Format and extension of the file, e.g. WORKBOOK_SUFFIX
+        
+        Returns:
+            Path of the cached file, or None
+        """
+        path = self.path(project_id, version, suffix)
+        try:
+            # A hit makes the file the most recently used
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+    
+    def put(self, project_id, version, source, suffix=WORKBOOK_SUFFIX):
+        """
+        Store a copy of an exported workbook, replacing older versions of the project
+        
+        Args:
+            project_id: Project ID
+            version: Content version the workbook was exported at
+            source: The exported file
+            suffix: Format and extension of the file; only older files with
+                the same extension are replaced
+        
+        Returns:
+            Path of the cached file
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(project_id, version, suffix)
+        _copy_file(source, path)
+        prefix = f"project_{project_id}_"
+        extension = os.path.splitext(path)[1]
+        for entry in self._entries():
+            if entry.name.startswith(prefix) and entry.name.endswith(extension) and entry.path != path:
+                self._remove(entry.path)
+        self.evict()
+        return path
+    
+    def _entries(self):
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                return [entry for entry in entries
+                        if entry.is_file() and entry.name.startswith('project_')
+                        and entry.name.endswith(CACHED_EXTENSIONS)]
+        except FileNotFoundError:
+            return []
+    
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    def evict(self):
+        """
+        Remove least recently used workbooks until the cache fits max_bytes
+        
+        Returns:
+            Number of files removed
+        """
+        files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._entries()),
+                       reverse=True)
+        size = 0
+        removed = 0
+        for _, file_size, path in files:
+            size += file_size
+            if size > self.max_bytes:
+                self._remove(path)
+                removed += 1
+        return removed
+    
+    def stats(self):
+        """Dictionary with the number of cached files and their total bytes"""
+        entries = self._entries()
+        return {'files': len(entries), 'bytes': sum(entry.stat().st_size for entry in entries)}
+    
+    def clear(self):
+        """Remove every cached file; returns the number removed"""
+        entries = self._entries()
+        for entry in entries:
+            self._remove(entry.path)
+        return len(entries)
+    
+    def export(self, cursor, project_id, filename, progress=None, cancel=None):
+        """
+        Export a project to Excel, copying the cached workbook when it is current
+        
+        Args:
+            cursor: SQLite cursor
+            project_id: ID of project to export
+            filename: Path to save Excel file
+            progress: Optional callback(rows_done, rows_total)
+            cancel: Optional threading.Event; setting it raises ExportCancelled
+        
+        Returns:
+            True if the workbook came from the cache
+        """
+        version = content_version(cursor, project_id)
+        cached = None if version is None else self.get(project_id, version)
+        if cached is not None:
+            _copy_file(cached, filename)
+            if progress:
+                progress(1, 1)
+            return True
+        
+        export_project_to_excel(cursor, project_id, filename, progress=progress, cancel=cancel)
+        # Only cache the workbook if nothing changed while it was written
+        if version is not None and content_version(cursor, project_id) == version:
+            self.put(project_id, version, filename)
+        return False
+
+def export_filename(project_id, name, ending='estimate.xlsx'):
+    """File name for a project in a bulk export, e.g. '12_Garden_Bench_estimate.xlsx'"""
+    safe_name = re.sub(r'[^\w\-]+', '_', name or '').strip('_') or 'project'
+    return f"{project_id}_{safe_name}_{ending}"
+
+def export_projects(cursor, cache, folder, project_ids=None, progress=None, cancel=None):
+    """
+    Export many projects to a folder through the cache
+    
+    Args:
+        cursor: SQLite cursor
+        cache: ExportCache
+        folder: Folder to write the workbooks to
+        project_ids: Projects to export, or None for all
+        progress: Optional callback(projects_done, projects_total)
+        cancel: Optional threading.Event checked between projects
+    
+    Returns:
+        Dictionary with exported and cached counts and failures
+        (list of (project_id, message))
+    """
+    if project_ids is None:
+        cursor.execute('SELECT id, name FROM projects ORDER BY id')
+    else:
+        ids = list(project_ids)
+        cursor.execute(f'SELECT id, name FROM projects WHERE id IN ({", ".join("?" * len(ids))}) ORDER BY id',
+                       ids)
+    projects = cursor.fetchall()
+    os.makedirs(folder, exist_ok=True)
+    
+    result = {'exported': 0, 'cached': 0, 'failures': []}
+    for done, (project_id, name) in enumerate(projects, 1):
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+        try:
+            # Each workbook is read from one snapshot, without holding one for the whole batch
+            with read_transaction(cursor.connection) as read:
+                hit = cache.export(read, project_id, os.path.join(folder, export_filename(project_id, name)),
+                                   cancel=cancel)
+        except (OSError, sqlite3.Error, ValueError) as e:
+            result['failures'].append((project_id, f"{type(e).__name__}: {e}"))
+        else:
+            result['cached' if hit else 'exported'] += 1
+        if progress:
+            progress(done, len(projects))
+    return result
+
+class BulkExportJob(ExportJob):
+    """Runs export_projects on a worker thread; filename is the target folder"""
+    
+    PROGRESS_TEXT = "Exporting projects: {done} of {total}"
+    CANCELLED_TEXT = "The export was cancelled; workbooks already written were kept."
+    
+    def __init__(self, root, db_path, project_ids, folder, cache):
+        super().__init__(root, db_path, None, folder, cache=cache)
+        self.project_ids = project_ids
+        self.result = None
+    
+    def _export(self, cursor):
+        self.result = export_projects(cursor, self.cache, self.filename, self.project_ids,
+                                      progress=self._progress, cancel=self._cancel)
+    
+    def message(self):
+        lines = [f"{self.result['exported'] + self.result['cached']} projects exported to:\n{self.filename}",
+                 f"{self.result['cached']} unchanged projects copied from the cache"]
+        if self.result['failures']:
+            lines.append(f"{len(self.result['failures'])} failed")
+        return '\n\n'.join(lines)
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Cached Excel exports of Project Pricer projects")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Cache folder")
+    parser.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Cache size limit in MB")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="Export projects to a folder")
+    export_parser.add_argument('folder', help="Output folder")
+    export_parser.add_argument('--project', type=int, action='append', help="Project ID (default: all)")
+    subparsers.add_parser('stats', help="Show the cache size")
+    subparsers.add_parser('clear', help="Empty the cache")
+    args = parser.parse_args()
+    
+    cache = ExportCache(args.cache_dir, args.max_mb * 1024 * 1024)
+    if args.command == 'stats':
+        stats = cache.stats()
+        print(f"{stats['files']} cached workbooks, {stats['bytes'] / (1024 * 1024):.1f} MB")
+        return 0
+    if args.command == 'clear':
+        print(f"Removed {cache.clear()} cached workbooks")
+        return 0
+    
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        result = export_projects(conn.cursor(), cache, args.folder, args.project)
+    except (ImportError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    
+    for project_id, message in result['failures']:
+        print(f"FAILED  project {project_id}: {message}")
+    print(f"{result['exported']} exported, {result['cached']} copied from the cache, "
+          f"{len(result['failures'])} failed")
+    return 1 if result['failures'] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,364 @@
+"""
+Combined reporting across Project Pricer databases
+Shops that keep one project_pricer.db per workstation or per year can report
+on all of them together without merging files. Each database is ATTACHed
+read-only and its projects are rolled up with the same cost SQL the
+application uses, tagged with a source key taken from the file name.
+
+Rollups are kept in a cache database together with each file's size and
+modification time. A file that has not changed since it was last scanned is
+not attached at all; the report queries then run over the cached rollups of
+every selected file in one pass.
+
+Command line usage:
+    python federated_report.py shop.db office_2023.db office_2024.db
+    python federated_report.py --cache report_cache.db --by year --top 20 *.db
+"""
+import os
+import sqlite3
+from datetime import datetime
+from urllib.request import pathname2url
+
+from db_archive import attach_limit
+from money import format_money, line_cost_sql
+from price_history import TREND_BUCKETS
+from pricing import cost_component_sql
+
+DEFAULT_CACHE_PATH = 'report_cache.db'
+SCHEMA_PREFIX = 'source_'
+# Bumped when the cache tables change; an older cache is rebuilt
+CACHE_VERSION = 1
+# First schema version with money in integer cents, which the rollups read
+MIN_SCHEMA_VERSION = 6
+TOP_MATERIALS = 10
+
+def source_key(path):
+    """Source key for a database file: its name without the extension"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+def fingerprint(path):
+    """
+    Size and modification time of a database file
+    
+    Commits not yet checkpointed live in the -wal file beside it, so that
+    file counts too.
+    
+    Returns:
+        (mtime_ns, size), or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    mtime_ns, size = stat.st_mtime_ns, stat.st_size
+    try:
+        wal = os.stat(path + '-wal')
+        mtime_ns, size = max(mtime_ns, wal.st_mtime_ns), size + wal.st_size
+    except OSError:
+        pass
+    return mtime_ns, size
+
+def init_cache(cursor):
+    """Create the cache tables, dropping those of an older cache version"""
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    if version != CACHE_VERSION:
+        for table in ('report_sources', 'report_projects', 'report_materials'):
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_sources (
+            path TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            projects INTEGER NOT NULL,
+            scanned_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_projects (
+            path TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            profile_name TEXT,
+            name TEXT,
+            created_date TEXT,
+            materials_cents INTEGER NOT NULL,
+            labor_cents INTEGER NOT NULL,
+            tools_cents INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            PRIMARY KEY (path, project_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_materials (
+            path TEXT NOT NULL,
+            material_key TEXT NOT NULL,
+            name TEXT,
+            quantity REAL NOT NULL,
+            cost_cents INTEGER NOT NULL,
+            lines INTEGER NOT NULL,
+            PRIMARY KEY (path, material_key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(f'PRAGMA user_version = {CACHE_VERSION}')
+
+def scan_source(cursor, schema, path):
+    """
+    Replace the cached rollups of one attached database
+    
+    Args:
+        cursor: Cursor on the cache database
+        schema: Schema the database is attached as
+        path: The database file, as the cache key
+    
+    Returns:
+        Number of projects rolled up
+    """
+    components = cost_component_sql(schema)
+    cursor.execute('DELETE FROM report_projects WHERE path = ?', (path,))
+    cursor.execute('DELETE FROM report_materials WHERE path = ?', (path,))
+    cursor.execute(f'''
+        INSERT INTO report_projects (path, project_id, profile_name, name, created_date,
+                                     materials_cents, labor_cents, tools_cents, total_cents)
+        SELECT ?, id, profile_name, name, created_date, materials, labor, tools, materials + labor + tools
+        FROM (
+            SELECT p.id, prof.name AS profile_name, p.name, p.created_date,
+                   {components['materials']} AS materials,
+                   {components['labor']} AS labor,
+                   {components['tools']} AS tools
+            FROM {schema}.projects p
+            LEFT JOIN {schema}.profiles prof ON prof.id = p.profile_id
+        )
+    ''', (path,))
+    projects = cursor.rowcount
+    # Keyed like price_history.material_key, so spellings of one material add up
+    cursor.execute(f'''
+        INSERT INTO report_materials (path, material_key, name, quantity, cost_cents, lines)
+        SELECT ?, lower(trim(name)), MIN(name), IFNULL(SUM(quantity), 0),
+               SUM({line_cost_sql('quantity', 'unit_cost_cents')}), COUNT(*)
+        FROM {schema}.materials
+        GROUP BY lower(trim(name))
+    ''', (path,))
+    return projects
+
+class FederatedReport:
+    """Cached cost rollups of several databases, reported on together"""
+    
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+        """
+        Open the cache, creating it if needed
+        
+        Args:
+            cache_path: Cache database file
+        """
+        self.conn = sqlite3.connect(cache_path, uri=True)
+        init_cache(self.conn.cursor())
+        self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS report_selection (path TEXT PRIMARY KEY)')
+        self.conn.commit()
+        self.sources = {}
+    
+    def close(self):
+        self.conn.close()
+    
+    def refresh(self, paths, progress=None):
+        """
+        Select the databases to report on and rescan those changed since their last scan
+        
+        Args:
+            paths: Database files; a file is reported under its name, with a
+                number added if two selected files share one
+            progress: Optional callback(files_done, files_total)
+        
+        Returns:
+            Dictionary with scanned and cached lists of paths and a failures
+            list of (path, message)
+        """
+        paths = list(dict.fromkeys(os.path.abspath(path) for path in paths))
+        result = {'scanned': [], 'cached': [], 'failures': []}
+        stale = []
+        cursor = self.conn.cursor()
+        for path in paths:
+            current = fingerprint(path)
+            if current is None:
+                result['failures'].append((path, "File not found"))
+                continue
+            cursor.execute('SELECT mtime_ns, size FROM report_sources WHERE path = ?', (path,))
+            if cursor.fetchone() == current:
+                result['cached'].append(path)
+            else:
+                stale.append((path, current))
+        
+        # Attach slots are limited, so stale files are scanned a batch at a time
+        limit = attach_limit(self.conn)
+        for start in range(0, len(stale), limit):
+            batch = stale[start:start + limit]
+            attached = []
+            try:
+                for number, (path, current) in enumerate(batch):
+                    schema = f'{SCHEMA_PREFIX}{number}'
+                    uri = f"file:{pathname2url(path)}?mode=ro"
+                    try:
+                        cursor.execute(f'ATTACH DATABASE ? AS {schema}', (uri,))
+                    except sqlite3.Error as e:
+                        result['failures'].append((path, str(e)))
+                        continue
+                    attached.append(schema)
+                    try:
+                        self._scan(cursor, schema, path, current)
+                        result['scanned'].append(path)
+                    except sqlite3.Error as e:
+                        self.conn.rollback()
+                        result['failures'].append((path, str(e)))
+                    if progress:
+                        progress(len(result['cached']) + len(result['scanned']) + len(result['failures']),
+                                 len(paths))
+            finally:
+                self.conn.commit()
+                for schema in attached:
+                    cursor.execute(f'DETACH DATABASE {schema}')
+        
+        failed = {path for path, _ in result['failures']}
+        selected = [path for path in paths if path not in failed]
+        cursor.execute('DELETE FROM temp.report_selection')
+        cursor.executemany('INSERT INTO temp.report_selection (path) VALUES (?)', [(path,) for path in selected])
+        self.conn.commit()
+        
+        self.sources = {}
+        for path in selected:
+            key = source_key(path)
+            number = 1
+            while key in self.sources.values():
+                number += 1
+                key = f"{source_key(path)} ({number})"
+            self.sources[path] = key
+        if progress:
+            progress(len(paths), len(paths))
+        return result
+    
+    def _scan(self, cursor, schema, path, current):
+        version = cursor.execute(f'PRAGMA {schema}.user_version').fetchone()[0]
+        if version < MIN_SCHEMA_VERSION:
+            raise sqlite3.DatabaseError("Written by an older version; open it once in Project Pricer "
+                                        "to upgrade it")
+        # Stale rows and new rows commit together, so an interrupted scan leaves the old rollup
+        projects = scan_source(cursor, schema, path)
+        cursor.execute('''
+            INSERT OR REPLACE INTO report_sources (path, source, mtime_ns, size, projects, scanned_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (path, source_key(path), current[0], current[1], projects, datetime.now().isoformat()))
+        self.conn.commit()
+    
+    def source_totals(self):
+        """
+        Cost rollup per database
+        
+        Returns:
+            List of (source, projects, materials, labor, tools, total), amounts in cents
+        """
+        rows = self.conn.execute('''
+            SELECT s.path, COUNT(p.project_id), IFNULL(SUM(p.materials_cents), 0), IFNULL(SUM(p.labor_cents), 0),
+                   IFNULL(SUM(p.tools_cents), 0), IFNULL(SUM(p.total_cents), 0)
+            FROM temp.report_selection s
+            LEFT JOIN report_projects p ON p.path = s.path
+            GROUP BY s.path
+        ''').fetchall()
+        return sorted(((self.sources[path],) + tuple(rest) for path, *rest in rows), key=lambda row: row[0])
+    
+    def period_totals(self, period='month'):
+        """
+        Projects and cost per day, month or year across every database
+        
+        Args:
+            period: Key of TREND_BUCKETS
+        
+        Returns:
+            List of (period, projects, total_cents, sources), oldest first
+        """
+        return self.conn.execute(f'''
+            SELECT strftime('{TREND_BUCKETS[period]}', p.created_date) AS period, COUNT(*), SUM(p.total_cents), COUNT(DISTINCT p.path)
+            FROM report_projects p
+            WHERE p.path IN (SELECT path FROM temp.report_selection)
+            GROUP BY period
+            ORDER BY period
+        ''').fetchall()
+    
+    def profile_totals(self):
+        """
+        Projects and cost per profile name across every database
+        
+        Returns:
+            List of (profile_name, projects, total_cents, sources), largest total first
+        """
+        return self.conn.execute('''
+            SELECT IFNULL(p.profile_name, '(no profile)'), COUNT(*), SUM(p.total_cents), COUNT(DISTINCT p.path)
+            FROM report_projects p
+            WHERE p.path IN (SELECT path FROM temp.report_selection)
+            GROUP BY p.profile_name
+            ORDER BY SUM(p.total_cents) DESC
+        ''').fetchall()
+    
+    def top_materials(self, limit=TOP_MATERIALS):
+        """
+        Materials with the highest spend across every database
+        
+        Returns:
+            List of (name, quantity, cost_cents, lines, sources)
+        """
+        return self.conn.execute('''
+            SELECT MIN(m.name), SUM(m.quantity), SUM(m.cost_cents), SUM(m.lines), COUNT(DISTINCT m.path)
+            FROM report_materials m
+            WHERE m.path IN (SELECT path FROM temp.report_selection)
+            GROUP BY m.material_key
+            ORDER BY SUM(m.cost_cents) DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    
+    def report(self, period='month', top=TOP_MATERIALS):
+        """
+        Format every rollup of the selected databases as text
+        
+        Returns:
+            List of report lines
+        """
+        lines = ["By database:"]
+        for source, projects, materials, labor, tools, total in self.source_totals():
+            lines.append(f"  {source:<30} {projects:>6} projects  materials {format_money(materials)}  "
+                         f"labor {format_money(labor)}  tools {format_money(tools)}  total {format_money(total)}")
+        lines.append(f"\nBy {period}:")
+        for start, projects, total, sources in self.period_totals(period):
+            lines.append(f"  {start or '(no date)':<10} {projects:>6} projects  {format_money(total):>16}  "
+                         f"from {sources} database(s)")
+        lines.append("\nBy profile:")
+        for profile, projects, total, sources in self.profile_totals():
+            lines.append(f"  {profile:<30} {projects:>6} projects  {format_money(total):>16}  "
+                         f"from {sources} database(s)")
+        lines.append(f"\nTop {top} materials:")
+        for name, quantity, cost, count, sources in self.top_materials(top):
+            lines.append(f"  {name:<30} {quantity:>10g}  {format_money(cost):>16}  "
+                         f"{count} lines in {sources} database(s)")
+        return lines
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Report on several Project Pricer databases together")
+    parser.add_argument('databases', nargs='+', help="Database files")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="Cache database file")
+    parser.add_argument('--by', choices=sorted(TREND_BUCKETS), default='month', help="Period for the totals over time")
+    parser.add_argument('--top', type=int, default=TOP_MATERIALS, help="Materials to list")
+    args = parser.parse_args()
+    
+    report = FederatedReport(args.cache)
+    try:
+        result = report.refresh(args.databases)
+        print(f"{len(result['scanned'])} database(s) scanned, {len(result['cached'])} unchanged since the last "
+              f"report")
+        for path, message in result['failures']:
+            print(f"FAILED  {path}: {message}")
+        print()
+        print('\n'.join(report.report(args.by, args.top)))
+    finally:
+        report.close()
+    return 1 if result['failures'] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
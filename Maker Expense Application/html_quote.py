@@ -0,0 +1,524 @@
+"""
+HTML quote documents for Project Pricer
+Writes a printable quote for a project as a single self-contained HTML file.
+Line items are streamed from the database a row at a time into templates
+that are compiled once per process into literal text and field slots, so
+rendering a row is one join.
+
+Output depends only on the project's content: no timestamps, a fixed
+encoding and line ending, and line items in ID order. Quotes can therefore
+be diffed, and are cached in the export cache next to the Excel workbooks
+under the same project content version.
+
+The built-in templates can be replaced file by file by putting
+page_start.html, section_start.html, row.html, section_end.html or
+page_end.html in a quote_templates folder; fields are written {{ name }}.
+
+Command line usage:
+    python html_quote.py out/                      (every project)
+    python html_quote.py out/ --project 12 --project 15 --workers 4
+    python html_quote.py out/ --templates my_templates/
+"""
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import tempfile
+from urllib.request import pathname2url
+
+from db_locking import read_transaction
+from excel_export import ExportCancelled, ExportJob, count_export_rows
+from export_cache import _copy_file, content_version, export_filename
+from models import LaborEntry, Material, ToolUsage, select
+from money import format_money
+from pricing import project_costs
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+DEFAULT_TEMPLATE_DIR = 'quote_templates'
+# Part of every cache key; bump when the built-in layout or the fields change
+QUOTE_FORMAT = 1
+# Rows written between progress reports and cancel checks
+PROGRESS_EVERY = 50
+# Quotes handed to a worker process at a time
+CHUNK_SIZE = 8
+
+FIELD = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+DEFAULT_TEMPLATES = {
+    'page_start': '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Quote: {{ project_name }}</title>
+<style>
+body { font-family: Arial, Helvetica, sans-serif; color: #222; margin: 2em; }
+h1 { font-size: 1.6em; margin-bottom: 0.3em; }
+h2 { font-size: 1.2em; margin: 1.5em 0 0.4em; }
+table { border-collapse: collapse; width: 100%; }
+th { background: #366092; color: #fff; text-align: left; padding: 4px 8px; }
+td { border-bottom: 1px solid #ddd; padding: 4px 8px; }
+.number { text-align: right; }
+table.details { width: auto; }
+table.details th { background: none; color: #222; padding-left: 0; }
+tr.subtotal td { background: #d9e1f2; font-weight: bold; }
+p.total { background: #70ad47; color: #fff; font-size: 1.2em; font-weight: bold; padding: 8px; text-align: right; }
+@media print {
+    body { margin: 0; }
+    th, tr.subtotal td, p.total { -webkit-print-color-adjust: exact; print-color-adjust: exact; }
+    tr { page-break-inside: avoid; }
+}
+</style>
+</head>
+<body>
+<h1>Quote: {{ project_name }}</h1>
+<table class="details">
+<tr><th>Quote</th><td>#{{ project_id }}</td></tr>
+<tr><th>Date</th><td>{{ created_date }}</td></tr>
+<tr><th>Prepared by</th><td>{{ profile_name }}</td></tr>
+<tr><th>Hourly rate</th><td>{{ hourly_rate }}</td></tr>
+</table>
+<p class="description">{{ description }}</p>
+''',
+    'section_start': '''<h2>{{ title }}</h2>
+<table>
+<thead><tr><th>{{ item_heading }}</th><th class="number">{{ amount_heading }}</th><th class="number">{{ rate_heading }}</th><th class="number">Total</th></tr></thead>
+<tbody>
+''',
+    'row': '''<tr><td>{{ item }}</td><td class="number">{{ amount }}</td><td class="number">{{ rate }}</td><td class="number">{{ total }}</td></tr>
+''',
+    'section_end': '''</tbody>
+<tfoot><tr class="subtotal"><td colspan="3">{{ title }} subtotal</td><td class="number">{{ subtotal }}</td></tr></tfoot>
+</table>
+''',
+    'page_end': '''<p class="total">Total: {{ total }}</p>
+</body>
+</html>
+''',
+}
+
+# Fields each template may use
+TEMPLATE_FIELDS = {
+    'page_start': {'project_id', 'project_name', 'description', 'created_date', 'profile_name', 'hourly_rate'},
+    'section_start': {'title', 'item_heading', 'amount_heading', 'rate_heading'},
+    'row': {'item', 'amount', 'rate', 'total'},
+    'section_end': {'title', 'subtotal'},
+    'page_end': {'materials', 'labor', 'tools', 'total'},
+}
+
+# (cost key, title, item heading, amount heading, rate heading)
+SECTIONS = (
+    ('materials', "Materials", "Item", "Quantity", "Unit Cost"),
+    ('labor', "Labor", "Description", "Hours", "Rate"),
+    ('tools', "Tool Usage", "Tool/Machine", "Hours", "Rate"),
+)
+
+class CompiledTemplate:
+    """A template split once into literal text and the fields between it"""
+    
+    __slots__ = ('literals', 'fields')
+    
+    def __init__(self, text, allowed=None):
+        """
+        Args:
+            text: Template text with {{ name }} fields
+            allowed: Optional set of field names the template may use
+        
+        Raises:
+            ValueError: If the template uses a field not in allowed
+        """
+        parts = FIELD.split(text)
+        self.literals = parts[0::2]
+        self.fields = parts[1::2]
+        unknown = set(self.fields) - allowed if allowed is not None else set()
+        if unknown:
+            raise ValueError(f"Unknown template field(s): {', '.join(sorted(unknown))}")
+    
+    def render(self, values):
+        """Fill in the fields with HTML-escaped values"""
+        out = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            out.append(html.escape(str(values[field])))
+            out.append(literal)
+        return ''.join(out)
+
+class QuoteTemplates:
+    """The compiled set of quote templates"""
+    
+    def __init__(self, texts):
+        """
+        Args:
+            texts: Dictionary of template name to text, for every name in DEFAULT_TEMPLATES
+        
+        Raises:
+            ValueError: If a template uses an unknown field
+        """
+        for name in DEFAULT_TEMPLATES:
+            try:
+                setattr(self, name, CompiledTemplate(texts[name], TEMPLATE_FIELDS[name]))
+            except ValueError as e:
+                raise ValueError(f"{name}.html: {e}") from None
+        # Identifies the layout in cache keys, so edited templates are not served from the cache
+        digest = hashlib.sha1()
+        for name in DEFAULT_TEMPLATES:
+            digest.update(f"{name}\0{texts[name]}\0".encode('utf-8'))
+        self.digest = digest.hexdigest()[:12]
+    
+    @property
+    def cache_suffix(self):
+        return f"q{QUOTE_FORMAT}_{self.digest}.html"
+
+# template_dir -> (file stamps, QuoteTemplates)
+_compiled = {}
+
+def load_templates(template_dir=DEFAULT_TEMPLATE_DIR):
+    """
+    Compiled quote templates, with any files in template_dir replacing the built-in ones
+    
+    Templates are compiled once per process and again only when a file in
+    template_dir is added, removed or changed.
+    
+    Args:
+        template_dir: Folder of replacement templates, or None for the built-in ones
+    
+    Returns:
+        QuoteTemplates
+    
+    Raises:
+        ValueError: If a template uses an unknown field
+    """
+    stamps = []
+    for name in DEFAULT_TEMPLATES:
+        try:
+            stat = os.stat(os.path.join(template_dir, f'{name}.html')) if template_dir else None
+        except OSError:
+            stat = None
+        stamps.append(None if stat is None else (stat.st_mtime_ns, stat.st_size))
+    stamps = tuple(stamps)
+    
+    cached = _compiled.get(template_dir)
+    if cached is not None and cached[0] == stamps:
+        return cached[1]
+    
+    texts = {}
+    for name, stamp in zip(DEFAULT_TEMPLATES, stamps):
+        if stamp is None:
+            texts[name] = DEFAULT_TEMPLATES[name]
+        else:
+            with open(os.path.join(template_dir, f'{name}.html'), encoding='utf-8') as f:
+                # Read as text, so CRLF template files give the same output as LF ones
+                texts[name] = f.read()
+    templates = QuoteTemplates(texts)
+    _compiled[template_dir] = (stamps, templates)
+    return templates
+
+def _section_rows(cursor, key, project_id):
+    """Stream one section's line items as (item, amount, rate, total) display values"""
+    if key == 'materials':
+        for mat in select(cursor, Material, 'WHERE project_id = ?', (project_id,), 'ORDER BY id'):
+            yield mat.name, f"{mat.quantity or 0:g}", format_money(mat.unit_cost_cents), format_money(mat.total_cents)
+    elif key == 'labor':
+        for lab in select(cursor, LaborEntry, 'WHERE l.project_id = ?', (project_id,), 'ORDER BY l.id'):
+            yield (lab.description, f"{lab.hours or 0:g}", format_money(lab.hourly_rate_cents, '/hr'),
+                   format_money(lab.total_cents))
+    else:
+        for tool in select(cursor, ToolUsage, 'WHERE tu.project_id = ?', (project_id,), 'ORDER BY tu.id'):
+            yield (tool.tool_name, f"{tool.hours or 0:g}", format_money(tool.cost_per_hour_cents, '/hr'),
+                   format_money(tool.total_cents))
+
+def render_quote(cursor, project_id, out, templates=None, progress=None, cancel=None):
+    """
+    Write a project's quote to an open text file
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of project to quote
+        out: File object opened for writing text
+        templates: QuoteTemplates (default: load_templates())
+        progress: Optional callback(rows_done, rows_total)
+        cancel: Optional threading.Event; setting it raises ExportCancelled
+    
+    Raises:
+        ValueError: If the project does not exist
+    """
+    templates = templates or load_templates()
+    cursor.execute('''
+        SELECT p.name, p.description, p.created_date, pr.name, pr.hourly_rate_cents
+        FROM projects p
+        JOIN profiles pr ON p.profile_id = pr.id
+        WHERE p.id = ?
+    ''', (project_id,))
+    project = cursor.fetchone()
+    if not project:
+        raise ValueError("Project not found")
+    project_name, description, created_date, profile_name, hourly_rate_cents = project
+    costs = project_costs(cursor, project_id)
+    total_rows = count_export_rows(cursor, project_id)
+    done = 0
+    
+    out.write(templates.page_start.render({
+        'project_id': project_id,
+        'project_name': project_name,
+        'description': description or '',
+        'created_date': (created_date or '')[:10],
+        'profile_name': profile_name,
+        'hourly_rate': format_money(hourly_rate_cents, '/hr'),
+    }))
+    row = templates.row.render
+    for key, title, item_heading, amount_heading, rate_heading in SECTIONS:
+        out.write(templates.section_start.render({'title': title, 'item_heading': item_heading,
+                                                  'amount_heading': amount_heading, 'rate_heading': rate_heading}))
+        for item, amount, rate, total in _section_rows(cursor, key, project_id):
+            out.write(row({'item': item or '', 'amount': amount, 'rate': rate, 'total': total}))
+            done += 1
+            if done % PROGRESS_EVERY == 0:
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                if progress:
+                    progress(done, total_rows)
+        out.write(templates.section_end.render({'title': title, 'subtotal': format_money(costs[key])}))
+    out.write(templates.page_end.render({key: format_money(value) for key, value in costs.items()}))
+    if progress:
+        progress(total_rows, total_rows)
+
+def write_quote(cursor, project_id, filename, templates=None, progress=None, cancel=None):
+    """
+    Write a project's quote to an HTML file
+    
+    The quote is written to a temporary file next to filename and renamed
+    over it only once complete, like the Excel export.
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of project to quote
+        filename: Path to save the HTML file
+        templates: QuoteTemplates (default: load_templates())
+        progress: Optional callback(rows_done, rows_total)
+        cancel: Optional threading.Event; setting it raises ExportCancelled
+    
+    Returns:
+        filename
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(filename) + '.', suffix='.tmp', dir=directory)
+    try:
+        # Fixed encoding and line ending, so the same project gives the same bytes on every system
+        with open(fd, 'w', encoding='utf-8', newline='\n') as out:
+            render_quote(cursor, project_id, out, templates, progress, cancel)
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return filename
+
+def export_quote(cursor, project_id, filename, cache=None, templates=None, progress=None, cancel=None):
+    """
+    Write a project's quote, copying it from the export cache when it is current
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of project to quote
+        filename: Path to save the HTML file
+        cache: Optional export_cache.ExportCache
+        templates: QuoteTemplates (default: load_templates())
+        progress: Optional callback(rows_done, rows_total)
+        cancel: Optional threading.Event; setting it raises ExportCancelled
+    
+    Returns:
+        True if the quote came from the cache
+    """
+    templates = templates or load_templates()
+    version = content_version(cursor, project_id) if cache is not None else None
+    cached = None if version is None else cache.get(project_id, version, templates.cache_suffix)
+    if cached is not None:
+        _copy_file(cached, filename)
+        if progress:
+            progress(1, 1)
+        return True
+    
+    write_quote(cursor, project_id, filename, templates, progress, cancel)
+    # Only cache the quote if nothing changed while it was written
+    if version is not None and content_version(cursor, project_id) == version:
+        cache.put(project_id, version, filename, templates.cache_suffix)
+    return False
+
+# Per-process state of a batch worker
+_worker = {}
+
+def _init_worker(db_path, template_dir):
+    """Process pool initializer: one read-only connection and one set of compiled templates per worker"""
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    _worker['cursor'] = sqlite3.connect(uri, uri=True, timeout=30).cursor()
+    _worker['templates'] = load_templates(template_dir)
+
+def _render_file(cursor, templates, project_id, filename):
+    """
+    Write one quote of a batch
+    
+    Returns:
+        (project_id, version, None) on success, where version is the content
+        version the quote was written at, or (project_id, None, error message)
+    """
+    try:
+        # Totals and rows come from one snapshot, so the version cannot change while the quote is written
+        with read_transaction(cursor.connection) as read:
+            version = content_version(read, project_id)
+            write_quote(read, project_id, filename, templates)
+        return project_id, version, None
+    except (OSError, sqlite3.Error, ValueError) as e:
+        return project_id, None, f"{type(e).__name__}: {e}"
+
+def _render_task(task):
+    """Process pool worker for one (project_id, filename)"""
+    return _render_file(_worker['cursor'], _worker['templates'], *task)
+
+def export_quotes(cursor, db_path, folder, project_ids=None, cache=None, template_dir=DEFAULT_TEMPLATE_DIR,
+                  workers=None, progress=None, cancel=None):
+    """
+    Write quotes for many projects to a folder, rendering them in a process pool
+    
+    Quotes current in the cache are copied from it by this process; the rest
+    are rendered by worker processes, each with its own read-only
+    connection to db_path, and added to the cache as they finish.
+    
+    Args:
+        cursor: SQLite cursor on db_path
+        db_path: Database file, opened by the workers
+        folder: Folder to write the quotes to
+        project_ids: Projects to quote, or None for all
+        cache: Optional export_cache.ExportCache
+        template_dir: Folder of replacement templates, or None
+        workers: Worker processes (default: CPU count; 1 renders in this process)
+        progress: Optional callback(projects_done, projects_total)
+        cancel: Optional threading.Event checked between projects
+    
+    Returns:
+        Dictionary with exported and cached counts and failures
+        (list of (project_id, message))
+    """
+    templates = load_templates(template_dir)
+    if project_ids is None:
+        cursor.execute('SELECT id, name FROM projects ORDER BY id')
+    else:
+        ids = list(project_ids)
+        cursor.execute(f'SELECT id, name FROM projects WHERE id IN ({", ".join("?" * len(ids))}) ORDER BY id',
+                       ids)
+    projects = cursor.fetchall()
+    os.makedirs(folder, exist_ok=True)
+    
+    result = {'exported': 0, 'cached': 0, 'failures': []}
+    tasks = []
+    for project_id, name in projects:
+        filename = os.path.join(folder, export_filename(project_id, name, 'quote.html'))
+        version = content_version(cursor, project_id) if cache is not None else None
+        cached = None if version is None else cache.get(project_id, version, templates.cache_suffix)
+        if cached is None:
+            tasks.append((project_id, filename))
+            continue
+        try:
+            _copy_file(cached, filename)
+            result['cached'] += 1
+        except OSError as e:
+            result['failures'].append((project_id, f"{type(e).__name__}: {e}"))
+    done = len(projects) - len(tasks)
+    if progress:
+        progress(done, len(projects))
+    
+    if workers == 1 or len(tasks) < 2:
+        results = (_render_file(cursor, templates, *task) for task in tasks)
+        pool = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path, template_dir))
+        results = pool.map(_render_task, tasks, chunksize=CHUNK_SIZE)
+    
+    filenames = dict(tasks)
+    try:
+        for project_id, version, error in results:
+            if error is not None:
+                result['failures'].append((project_id, error))
+            else:
+                result['exported'] += 1
+                if cache is not None and version is not None:
+                    try:
+                        cache.put(project_id, version, filenames[project_id], templates.cache_suffix)
+                    except OSError:
+                        pass
+            done += 1
+            if progress:
+                progress(done, len(projects))
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return result
+
+class QuoteJob(ExportJob):
+    """Writes one project's HTML quote on a worker thread"""
+    
+    def _export(self, cursor):
+        with read_transaction(cursor.connection) as cursor:
+            export_quote(cursor, self.project_id, self.filename, self.cache, progress=self._progress,
+                         cancel=self._cancel)
+    
+    def message(self):
+        return f"Quote saved to:\n{self.filename}"
+
+class BulkQuoteJob(ExportJob):
+    """Runs export_quotes on a worker thread; filename is the target folder"""
+    
+    PROGRESS_TEXT = "Writing quotes: {done} of {total}"
+    CANCELLED_TEXT = "The export was cancelled; quotes already written were kept."
+    
+    def __init__(self, root, db_path, project_ids, folder, cache):
+        super().__init__(root, db_path, None, folder, cache=cache)
+        self.project_ids = project_ids
+        self.result = None
+    
+    def _export(self, cursor):
+        self.result = export_quotes(cursor, self.db_path, self.filename, self.project_ids, self.cache,
+                                    progress=self._progress, cancel=self._cancel)
+    
+    def message(self):
+        lines = [f"{self.result['exported'] + self.result['cached']} quotes written to:\n{self.filename}",
+                 f"{self.result['cached']} unchanged quotes copied from the cache"]
+        if self.result['failures']:
+            lines.append(f"{len(self.result['failures'])} failed")
+        return '\n\n'.join(lines)
+
+def main():
+    import argparse
+    from export_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ExportCache
+    
+    parser = argparse.ArgumentParser(description="Write HTML quotes for Project Pricer projects")
+    parser.add_argument('folder', help="Output folder")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('--project', type=int, action='append', help="Project ID (default: all)")
+    parser.add_argument('--templates', default=DEFAULT_TEMPLATE_DIR, help="Folder of replacement templates")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Export cache folder")
+    parser.add_argument('--no-cache', action='store_true', help="Render every quote")
+    args = parser.parse_args()
+    
+    cache = None if args.no_cache else ExportCache(args.cache_dir, DEFAULT_MAX_BYTES)
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        result = export_quotes(conn.cursor(), args.db, args.folder, args.project, cache, args.templates,
+                               args.workers)
+    except (OSError, sqlite3.Error, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    
+    for project_id, message in result['failures']:
+        print(f"FAILED  project {project_id}: {message}")
+    print(f"{result['exported']} written, {result['cached']} copied from the cache, "
+          f"{len(result['failures'])} failed")
+    return 1 if result['failures'] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
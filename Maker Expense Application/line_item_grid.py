@@ -0,0 +1,545 @@
+"""
+Inline line item editing for Project Pricer
+Makes a line item Treeview editable like a spreadsheet: double-click a cell,
+press Enter or F2, or just start typing to edit it; Tab, Enter and the arrow
+keys move between cells, and the blank last row adds a line. Ctrl+V pastes
+tab-separated rows copied from a spreadsheet, starting at the selected cell.
+
+Cells are checked as they are entered and edits are held in the grid, with
+the project total adjusted line by line, until focus leaves the grid or the
+edits are saved. All held rows are then written with one UPDATE and one
+INSERT statement per table in a single transaction.
+"""
+import math
+import tkinter as tk
+from tkinter import ttk
+
+from db_locking import ConflictError
+from money import format_money, line_cost, to_cents
+from price_history import record_prices
+
+# Editable columns of each line item tree as (heading, field, kind);
+# the Rate and Total columns after them are computed
+GRID_COLUMNS = {
+    'materials': (('Name', 'name', 'text'), ('Quantity', 'quantity', 'number'),
+                  ('Unit Cost', 'unit_cost_cents', 'money')),
+    'labor': (('Description', 'description', 'text'), ('Hours', 'hours', 'number')),
+    'tool_usage': (('Tool', 'tool_id', 'tool'), ('Hours', 'hours', 'number')),
+}
+
+# Tree item of the blank row that adds a line
+NEW_ROW = 'new'
+
+def parse_cell(kind, text, tool_ids=None):
+    """
+    Check and convert the text typed into a cell
+    
+    Args:
+        kind: 'text', 'number', 'money' or 'tool'
+        text: Text as typed or pasted
+        tool_ids: Dictionary of lower-case tool name -> tool ID, for 'tool' cells
+    
+    Returns:
+        The value to store
+    
+    Raises:
+        ValueError: With a message for the user if the text is not valid
+    """
+    text = text.strip()
+    if not text:
+        raise ValueError("A value is required")
+    if kind == 'number':
+        try:
+            value = float(text.replace(',', ''))
+        except ValueError:
+            raise ValueError(f"Not a number: {text}")
+        if not math.isfinite(value):
+            raise ValueError(f"Not a number: {text}")
+        return value
+    if kind == 'money':
+        return to_cents(text)
+    if kind == 'tool':
+        tool_id = (tool_ids or {}).get(text.lower())
+        if tool_id is None:
+            raise ValueError(f"No tool named {text} in this profile")
+        return tool_id
+    return text
+
+def parse_clipboard(text):
+    """Split tab-separated clipboard text into rows of cells, skipping blank lines"""
+    return [line.split('\t') for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+            if line.strip()]
+
+class GridRow:
+    """A line as shown in the grid, with the values last saved and any edits held"""
+    
+    __slots__ = ('id', 'row_version', 'values', 'saved_values', 'cents', 'saved_cents')
+    
+    def __init__(self, row_id, row_version, values, cents):
+        self.id = row_id
+        self.row_version = row_version
+        self.values = dict(values)
+        self.saved_values = dict(values)
+        self.cents = cents
+        self.saved_cents = cents
+    
+    @property
+    def dirty(self):
+        return self.id is None or self.values != self.saved_values
+    
+    @property
+    def complete(self):
+        return all(value is not None for value in self.values.values())
+
+def save_line_items(cursor, table, project_id, rows):
+    """
+    Write a grid's edited and new lines, one statement for each kind
+    
+    Edited lines are only updated if they are still at the version the grid
+    loaded. Materials whose name or unit cost changed get a price history entry.
+    
+    Args:
+        cursor: SQLite cursor, inside a write transaction
+        table: 'materials', 'labor' or 'tool_usage'
+        project_id: Project the lines belong to
+        rows: GridRow objects with every field set
+    
+    Returns:
+        List of (id, row_version) in the order of rows
+    
+    Raises:
+        ConflictError: If an edited line was changed or deleted by another session
+    """
+    fields = [field for _, field, _ in GRID_COLUMNS[table]]
+    updates = [row for row in rows if row.id is not None]
+    inserts = [row for row in rows if row.id is None]
+    
+    if updates:
+        # Checked up front under the write lock, so either every row is written or none
+        cursor.execute(f'SELECT id, row_version FROM {table} WHERE project_id = ?', (project_id,))
+        current = dict(cursor.fetchall())
+        for row in updates:
+            if current.get(row.id) != row.row_version:
+                raise ConflictError(table, row.id)
+        assignments = ''.join(f'{field} = ?, ' for field in fields)
+        cursor.executemany(f'''
+            UPDATE {table} SET {assignments}row_version = row_version + 1
+            WHERE id = ? AND row_version = ?
+        ''', [[row.values[field] for field in fields] + [row.id, row.row_version] for row in updates])
+    
+    new_ids = []
+    if inserts:
+        # The write lock is held, so every ID above the current largest is one of these rows
+        cursor.execute(f'SELECT IFNULL(MAX(id), 0) FROM {table}')
+        last_id = cursor.fetchone()[0]
+        cursor.executemany(f'''
+            INSERT INTO {table} (project_id, {', '.join(fields)})
+            VALUES (?{', ?' * len(fields)})
+        ''', [[project_id] + [row.values[field] for field in fields] for row in inserts])
+        cursor.execute(f'SELECT id FROM {table} WHERE id > ? ORDER BY id', (last_id,))
+        new_ids = [row[0] for row in cursor.fetchall()]
+    
+    if table == 'materials':
+        record_prices(cursor, [(row.values['name'], row.values['unit_cost_cents'], None) for row in rows
+                               if row.id is None
+                               or row.values['name'] != row.saved_values['name']
+                               or row.values['unit_cost_cents'] != row.saved_values['unit_cost_cents']],
+                      source='entry')
+    
+    new_ids = iter(new_ids)
+    return [(row.id, row.row_version + 1) if row.id is not None else (next(new_ids), 1) for row in rows]
+
+class LineItemGrid:
+    """Spreadsheet-style editing of one line item Treeview"""
+    
+    def __init__(self, tree, table, status_label, on_change=None, on_leave=None):
+        """
+        Make a line item tree editable
+        
+        Args:
+            tree: Treeview with the editable columns first, then Rate (not for
+                materials) and Total
+            table: 'materials', 'labor' or 'tool_usage'
+            status_label: Label for hints and validation messages
+            on_change: Called after held edits change the pending total
+            on_leave: Called when focus leaves the grid with edits held
+        """
+        self.tree = tree
+        self.table = table
+        self.columns = GRID_COLUMNS[table]
+        self.status_label = status_label
+        self.on_change = on_change
+        self.on_leave = on_leave
+        
+        self.project_id = None
+        self.rows = {}
+        self.hourly_rate_cents = None
+        self.tools = {}
+        self.tool_ids = {}
+        # Sum of (current - saved) cost of the held rows
+        self.pending_cents = 0
+        self.column = 0
+        self.editor = None
+        self.editing = None
+        self.new_rows = 0
+        
+        tree.tag_configure('edited', background='#fff4c2')
+        tree.tag_configure('incomplete', background='#fde0dc')
+        tree.tag_configure('new', foreground='gray')
+        tree.bind('<Double-1>', self.on_double_click)
+        tree.bind('<Return>', lambda e: self.begin_edit(self.focus_row(), self.column))
+        tree.bind('<F2>', lambda e: self.begin_edit(self.focus_row(), self.column))
+        tree.bind('<Left>', lambda e: self.move_column(-1))
+        tree.bind('<Right>', lambda e: self.move_column(1))
+        tree.bind('<Control-v>', self.paste)
+        tree.bind('<Key>', self.on_key)
+        tree.bind('<FocusOut>', lambda e: self.check_focus())
+        self.show_hint()
+    
+    # Loading and display
+    
+    def load(self, project_id, items, hourly_rate_cents=None, tools=()):
+        """
+        Show a project's saved lines, dropping any held edits
+        
+        Args:
+            project_id: Project the lines belong to
+            items: Material, LaborEntry or ToolUsage objects
+            hourly_rate_cents: The profile's labor rate, for labor lines
+            tools: The profile's Tool objects, for tool usage lines
+        """
+        self.clear()
+        self.project_id = project_id
+        self.hourly_rate_cents = hourly_rate_cents
+        self.tools = {tool.id: tool for tool in tools}
+        self.tool_ids = {tool.name.strip().lower(): tool.id for tool in tools}
+        for item in items:
+            values = {field: getattr(item, field) for _, field, _ in self.columns}
+            row = GridRow(item.id, item.row_version, values, self.line_cents(values))
+            iid = self.tree.insert('', 'end', text=str(item.id), values=self.display(values))
+            self.rows[iid] = row
+        self.tree.insert('', 'end', iid=NEW_ROW, text='', values=self.display(None), tags=('new',))
+    
+    def clear(self):
+        """Empty the grid, dropping any held edits"""
+        self.cancel_edit()
+        self.tree.delete(*self.tree.get_children())
+        self.project_id = None
+        self.rows = {}
+        self.pending_cents = 0
+    
+    def rate_cents(self, values):
+        if self.table == 'materials':
+            return values['unit_cost_cents']
+        if self.table == 'labor':
+            return self.hourly_rate_cents
+        tool = self.tools.get(values['tool_id'])
+        return tool.cost_per_hour_cents if tool is not None else None
+    
+    def line_cents(self, values):
+        """Cost of a line in cents; zero until every cell is filled in"""
+        if any(value is None for value in values.values()):
+            return 0
+        quantity = values['quantity'] if self.table == 'materials' else values['hours']
+        return line_cost(quantity, self.rate_cents(values))
+    
+    def cell_text(self, field, kind, value):
+        if value is None:
+            return ''
+        if kind == 'money':
+            return format_money(value)
+        if kind == 'tool':
+            tool = self.tools.get(value)
+            return tool.name if tool is not None else ''
+        return value
+    
+    def display(self, values):
+        """Tree values for a row, or for the blank new row if values is None"""
+        if values is None:
+            return ('(type to add)',) + ('',) * (len(self.tree['columns']) - 1)
+        cells = [self.cell_text(field, kind, values[field]) for _, field, kind in self.columns]
+        if self.table != 'materials':
+            rate = self.rate_cents(values)
+            cells.append(format_money(rate, '/hr') if rate is not None else '')
+        complete = all(value is not None for value in values.values())
+        cells.append(format_money(self.line_cents(values)) if complete else '')
+        return tuple(cells)
+    
+    def redraw(self, iid):
+        row = self.rows[iid]
+        tags = ('incomplete',) if not row.complete else ('edited',) if row.dirty else ()
+        self.tree.item(iid, text=str(row.id) if row.id is not None else '',
+                       values=self.display(row.values), tags=tags)
+    
+    def show_hint(self, message=None, error=False):
+        if message is None:
+            message = "Double-click or type to edit; Ctrl+V pastes rows"
+        self.status_label.config(text=message, foreground='red' if error else 'gray')
+    
+    # Held edits
+    
+    def row_id(self, iid):
+        """Database ID of a tree item's line, or None if it is not saved yet"""
+        row = self.rows.get(iid)
+        return row.id if row is not None else None
+    
+    def row_version(self, row_id):
+        """Version of a saved line as loaded or last saved by this grid, or None"""
+        return next((row.row_version for row in self.rows.values() if row.id == row_id), None)
+    
+    def has_edits(self):
+        return any(row.dirty for row in self.rows.values())
+    
+    def set_values(self, iid, changes):
+        """
+        Hold new values for a row; editing the blank row adds a line
+        
+        Returns:
+            The row's tree item
+        """
+        if iid == NEW_ROW:
+            self.new_rows += 1
+            values = {field: None for _, field, _ in self.columns}
+            iid = self.tree.insert('', self.tree.index(NEW_ROW), iid=f'new{self.new_rows}',
+                                   text='', values=self.display(values))
+            self.rows[iid] = GridRow(None, None, values, 0)
+        row = self.rows[iid]
+        row.values.update(changes)
+        cents = self.line_cents(row.values)
+        self.pending_cents += cents - row.cents
+        row.cents = cents
+        self.redraw(iid)
+        if self.on_change is not None:
+            self.on_change()
+        return iid
+    
+    def pending(self):
+        """Rows with held edits that are ready to save"""
+        return [row for row in self.rows.values() if row.dirty and row.complete]
+    
+    def mark_saved(self, rows, versions):
+        """Record that rows from pending() were saved with the given (id, row_version)s"""
+        for row, (row_id, version) in zip(rows, versions):
+            row.id = row_id
+            row.row_version = version
+            row.saved_values = dict(row.values)
+            self.pending_cents -= row.cents - row.saved_cents
+            row.saved_cents = row.cents
+        saved = set(rows)
+        for iid, row in self.rows.items():
+            if row in saved:
+                self.redraw(iid)
+    
+    def remove_row(self, iid):
+        """Take a line out of the grid, e.g. once it is deleted or if it was never saved"""
+        row = self.rows.pop(iid)
+        self.pending_cents -= row.cents - row.saved_cents
+        self.tree.delete(iid)
+        if self.on_change is not None:
+            self.on_change()
+    
+    # Cell editing
+    
+    def focus_row(self):
+        return self.tree.focus() or NEW_ROW
+    
+    def on_double_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        column = self.tree.identify_column(event.x)
+        if not iid or not column:
+            return
+        self.begin_edit(iid, int(column[1:]) - 1)
+        return 'break'
+    
+    def on_key(self, event):
+        # Typing a character over a selected cell replaces it, as in a spreadsheet
+        if event.char and event.char.isprintable() and not event.state & 0x4:
+            self.begin_edit(self.focus_row(), self.column, event.char)
+            return 'break'
+    
+    def move_column(self, step):
+        self.column = min(max(self.column + step, 0), len(self.columns) - 1)
+        self.show_hint(f"{self.columns[self.column][0]} column")
+        return 'break'
+    
+    def begin_edit(self, iid, column, text=None):
+        """Open an editor over a cell; text replaces the cell's contents"""
+        if self.project_id is None or iid not in self.rows and iid != NEW_ROW:
+            return 'break'
+        if column >= len(self.columns):
+            column = len(self.columns) - 1
+        self.cancel_edit()
+        self.tree.see(iid)
+        self.tree.update_idletasks()
+        bbox = self.tree.bbox(iid, f'#{column + 1}')
+        if not bbox:
+            return 'break'
+        
+        heading, field, kind = self.columns[column]
+        if kind == 'tool':
+            editor = ttk.Combobox(self.tree, values=[tool.name for tool in self.tools.values()])
+        else:
+            editor = ttk.Entry(self.tree)
+        if text is None:
+            row = self.rows.get(iid)
+            value = row.values[field] if row is not None else None
+            text = '' if value is None else (format_money(value).replace('$', '')
+                                             if kind == 'money' else str(self.cell_text(field, kind, value)))
+            editor.insert(0, text)
+            editor.select_range(0, 'end')
+        else:
+            editor.insert(0, text)
+        x, y, width, height = bbox
+        editor.place(x=x, y=y, width=width, height=height)
+        editor.focus_set()
+        editor.icursor('end')
+        
+        editor.bind('<Return>', lambda e: self.finish_edit(rows=1))
+        editor.bind('<KP_Enter>', lambda e: self.finish_edit(rows=1))
+        editor.bind('<Down>', lambda e: self.finish_edit(rows=1) if kind != 'tool' else None)
+        editor.bind('<Up>', lambda e: self.finish_edit(rows=-1) if kind != 'tool' else None)
+        editor.bind('<Tab>', lambda e: self.finish_edit(columns=1))
+        editor.bind('<Shift-Tab>', lambda e: self.finish_edit(columns=-1))
+        try:
+            editor.bind('<ISO_Left_Tab>', lambda e: self.finish_edit(columns=-1))
+        except tk.TclError:
+            pass
+        editor.bind('<Escape>', lambda e: self.cancel_edit(refocus=True))
+        editor.bind('<FocusOut>', lambda e: self.tree.after_idle(self.on_editor_focus_out))
+        self.editor = editor
+        self.editing = (iid, column)
+        self.column = column
+        self.show_hint(f"Editing {heading}: Enter or Tab to accept, Escape to cancel")
+        return 'break'
+    
+    def finish_edit(self, rows=0, columns=0):
+        """
+        Check the editor's text and hold it, then move to another cell
+        
+        Returns:
+            'break', so the key does nothing else; the editor stays open if the text is invalid
+        """
+        if self.editor is None:
+            return 'break'
+        iid, column = self.editing
+        _, field, kind = self.columns[column]
+        try:
+            value = parse_cell(kind, self.editor.get(), self.tool_ids)
+        except ValueError as e:
+            self.show_hint(str(e), error=True)
+            self.editor.focus_set()
+            return 'break'
+        
+        self.cancel_edit()
+        row = self.rows.get(iid)
+        if row is None or row.values[field] != value:
+            iid = self.set_values(iid, {field: value})
+        self.show_hint()
+        
+        # Tab past the last column continues on the next line
+        column += columns
+        if column >= len(self.columns):
+            column, rows = 0, 1
+        elif column < 0:
+            column, rows = len(self.columns) - 1, -1
+        items = self.tree.get_children()
+        index = min(max(items.index(iid) + rows, 0), len(items) - 1)
+        target = items[index]
+        self.tree.focus(target)
+        self.tree.selection_set(target)
+        self.tree.focus_set()
+        if columns:
+            self.begin_edit(target, column)
+        else:
+            self.column = column
+        return 'break'
+    
+    def cancel_edit(self, refocus=False):
+        if self.editor is not None:
+            editor, self.editor, self.editing = self.editor, None, None
+            editor.destroy()
+            if refocus:
+                self.tree.focus_set()
+                self.show_hint()
+        return 'break'
+    
+    def on_editor_focus_out(self):
+        if self.editor is None or self.has_focus(self.editor):
+            return
+        # Clicking elsewhere keeps valid text and drops invalid text
+        iid, column = self.editing
+        _, field, kind = self.columns[column]
+        try:
+            value = parse_cell(kind, self.editor.get(), self.tool_ids)
+        except ValueError as e:
+            self.cancel_edit()
+            self.show_hint(f"Not changed: {e}", error=True)
+        else:
+            self.cancel_edit()
+            row = self.rows.get(iid)
+            if row is None or row.values[field] != value:
+                self.set_values(iid, {field: value})
+        self.check_focus()
+    
+    def has_focus(self, widget):
+        """Whether keyboard focus is in a widget or one of its children, such as a drop-down list"""
+        try:
+            focus = self.tree.focus_get()
+        except KeyError:
+            # Tk cannot name some platform widgets, such as an open drop-down
+            return True
+        return focus is not None and str(focus).startswith(str(widget))
+    
+    def check_focus(self):
+        """Save held edits once focus has moved to another widget of the same window"""
+        def check():
+            if self.editor is not None or self.has_focus(self.tree):
+                return
+            try:
+                focus = self.tree.focus_get()
+            except KeyError:
+                return
+            # Message boxes and other windows taking focus do not count as leaving
+            if focus is None or focus.winfo_toplevel() is not self.tree.winfo_toplevel():
+                return
+            if self.on_leave is not None and self.has_edits():
+                self.on_leave(self)
+        self.tree.after_idle(check)
+    
+    # Paste
+    
+    def paste(self, event=None):
+        """Paste tab-separated rows from the clipboard at the selected cell, adding lines as needed"""
+        if self.project_id is None:
+            return 'break'
+        try:
+            lines = parse_clipboard(self.tree.clipboard_get())
+        except tk.TclError:
+            return 'break'
+        if not lines:
+            return 'break'
+        
+        # Check every cell first so a bad paste changes nothing
+        changes = []
+        for number, cells in enumerate(lines, 1):
+            change = {}
+            for offset, text in enumerate(cells[:len(self.columns) - self.column]):
+                heading, field, kind = self.columns[self.column + offset]
+                try:
+                    change[field] = parse_cell(kind, text, self.tool_ids)
+                except ValueError as e:
+                    self.show_hint(f"Nothing pasted. Line {number}, {heading}: {e}", error=True)
+                    return 'break'
+            changes.append(change)
+        
+        items = list(self.tree.get_children())
+        start = items.index(self.focus_row())
+        targets = [iid for iid in items[start:] if iid != NEW_ROW][:len(changes)]
+        targets += [NEW_ROW] * (len(changes) - len(targets))
+        for iid, change in zip(targets, changes):
+            last = self.set_values(iid, change)
+        self.tree.focus(last)
+        self.tree.selection_set(last)
+        self.tree.see(last)
+        self.show_hint(f"Pasted {len(changes)} line{'s' if len(changes) != 1 else ''}")
+        return 'break'
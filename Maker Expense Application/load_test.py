@@ -0,0 +1,147 @@
+"""
+Load test for the Project Pricer HTTP API
+Opens a number of concurrent keep-alive connections, issues pricing
+requests as fast as the server answers, and reports requests/sec and
+latency percentiles.
+
+Usage:
+    python pricing_api.py &
+    python load_test.py [--concurrency 16] [--requests 5000] [--write-ratio 0.1]
+"""
+import asyncio
+import json
+import random
+import time
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+class Client:
+    """A single keep-alive HTTP/1.1 connection"""
+    
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+    
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+    
+    async def request(self, method, path, payload=None):
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        head = (f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+        
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value.strip())
+        data = await self.reader.readexactly(length) if length else b''
+        return status, json.loads(data) if data else None
+    
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+async def worker(client, project_ids, count, write_ratio, latencies, errors, rng):
+    for _ in range(count):
+        project_id = rng.choice(project_ids)
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                # Add a labor line and remove it again so the data is unchanged
+                status, created = await client.request(
+                    'POST', f'/projects/{project_id}/labor', {'description': 'load test', 'hours': 1.0}
+                )
+                if status == 201:
+                    status, _ = await client.request('DELETE', f"/labor/{created['id']}")
+            elif rng.random() < 0.5:
+                status, _ = await client.request('GET', f'/projects/{project_id}/price')
+            else:
+                status, _ = await client.request('GET', f'/projects/{project_id}')
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            status = None
+        latencies.append(time.perf_counter() - started)
+        if status not in (200, 201, 204):
+            errors.append(status)
+
+async def run(host, port, concurrency, total_requests, write_ratio, seed):
+    setup = Client(host, port)
+    await setup.connect()
+    status, projects = await setup.request('GET', '/projects')
+    await setup.close()
+    if status != 200 or not projects:
+        raise SystemExit("The database has no projects to price; create one first")
+    project_ids = [project['id'] for project in projects]
+    
+    clients = [Client(host, port) for _ in range(concurrency)]
+    await asyncio.gather(*(client.connect() for client in clients))
+    
+    latencies = []
+    errors = []
+    per_worker = [total_requests // concurrency] * concurrency
+    for i in range(total_requests % concurrency):
+        per_worker[i] += 1
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(client, project_ids, count, write_ratio, latencies, errors, random.Random(seed + i))
+        for i, (client, count) in enumerate(zip(clients, per_worker))
+    ))
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*(client.close() for client in clients))
+    
+    latencies.sort()
+    print(f"Requests:      {len(latencies)} ({len(errors)} errors)")
+    print(f"Concurrency:   {concurrency}")
+    print(f"Elapsed:       {elapsed:.2f} s")
+    print(f"Requests/sec:  {len(latencies) / elapsed:.1f}")
+    print(f"Latency p50:   {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"Latency p90:   {percentile(latencies, 90) * 1000:.2f} ms")
+    print(f"Latency p99:   {percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"Latency max:   {latencies[-1] * 1000:.2f} ms")
+    return 1 if errors else 0
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Load test the Project Pricer HTTP API")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent connections")
+    parser.add_argument('--requests', type=int, default=5000, help="Total requests")
+    parser.add_argument('--write-ratio', type=float, default=0.0,
+                        help="Share of requests that add and remove a labor line")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    return asyncio.run(run(args.host, args.port, args.concurrency, args.requests,
+                           args.write_ratio, args.seed))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
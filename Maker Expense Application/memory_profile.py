@@ -0,0 +1,353 @@
+"""
+Memory profiling for Project Pricer
+While profiling is on, tracemalloc records where each allocation was made.
+The application calls checkpoint() after operations such as switching tabs,
+refreshing the open project and finishing an export; the memory traced at
+each checkpoint is compared with the one before it, so growth is charged to
+the operation that just ran. Checkpoints only run the garbage collector and
+read tracemalloc's running total, so they are cheap enough for every tab
+switch. The report compares a
+snapshot with the one taken when profiling started to list the allocation
+sites that have grown the most, and counts live objects such as line items,
+openpyxl workbooks and cells, and Toplevel windows.
+
+Run as a script, this is a soak test: it generates a database and repeats
+the application's headless paths (opening projects, editing line items with
+undo, paging the project list, change events and Excel export) many times,
+then fails if memory is still growing once the caches have warmed up.
+
+Usage:
+    python memory_profile.py [--projects 200] [--cycles 300] [--warmup 50] [--max-growth 2048]
+"""
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+# Stack depth recorded per allocation
+TRACE_FRAMES = 10
+# Allocation sites listed in a report
+TOP_SITES = 15
+# The profiler's own allocations and the import machinery's are not the application's
+IGNORED_FILES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>', '<unknown>')
+# Classes whose live instances are counted in a report, by name
+COUNTED_TYPES = ('Project', 'Material', 'LaborEntry', 'ToolUsage', 'GridRow', 'ChangeEvent',
+                 'Workbook', 'Worksheet', 'Cell', 'Toplevel')
+
+DEFAULT_PROJECTS = 200
+DEFAULT_CYCLES = 300
+DEFAULT_WARMUP = 50
+# Bytes a soak cycle may add on average after warm-up
+DEFAULT_MAX_GROWTH = 2048
+# Excel exports are slow; one cycle in this many includes one
+EXPORT_EVERY = 10
+
+def count_objects(type_names=COUNTED_TYPES):
+    """
+    Count live objects by class name
+    
+    Walks every object the garbage collector tracks, so it takes a moment
+    on a large heap; only used while profiling.
+    
+    Returns:
+        Dictionary of class name -> count
+    """
+    gc.collect()
+    counts = dict.fromkeys(type_names, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+def format_size(size):
+    """Format a byte count as B, KB or MB, signed for differences"""
+    sign = '-' if size < 0 else ''
+    size = abs(size)
+    if size < 1024:
+        return f"{sign}{size} B"
+    if size < 1024 * 1024:
+        return f"{sign}{size / 1024:.1f} KB"
+    return f"{sign}{size / (1024 * 1024):.1f} MB"
+
+class MemoryProfiler:
+    """tracemalloc snapshots at checkpoints, with growth charged to the operation before each"""
+    
+    def __init__(self, frames=TRACE_FRAMES, counters=None):
+        """
+        Set up a profiler; nothing is traced until start()
+        
+        Args:
+            frames: Stack depth recorded per allocation
+            counters: Optional function returning a dictionary of extra
+                name -> count for the report, e.g. Treeview items
+        """
+        self.frames = frames
+        self.counters = counters
+        self.started_at = None
+        self.baseline = None
+        self.baseline_size = 0
+        self.previous_size = 0
+        self.first_counts = {}
+        # Operation -> [checkpoints, bytes grown]; nothing else is kept per
+        # checkpoint, so profiling does not itself look like growth
+        self.operations = {}
+        self.checkpoints = 0
+        self._owns_tracing = False
+    
+    @property
+    def running(self):
+        return self.baseline is not None
+    
+    def start(self):
+        """Start tracing allocations and take the baseline snapshot"""
+        if self.running:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracing = True
+        self.started_at = time.time()
+        self.first_counts = self._counts()
+        # Taken after the collection in _counts() and before the first reading, so the memory it holds is never counted as growth
+        self.baseline = tracemalloc.take_snapshot()
+        self.baseline_size = self.previous_size = tracemalloc.get_traced_memory()[0]
+        self.operations = {}
+        self.checkpoints = 0
+    
+    def stop(self):
+        """Stop tracing and forget the snapshots"""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        self.baseline = None
+    
+    def _counts(self):
+        counts = count_objects()
+        if self.counters is not None:
+            counts.update(self.counters())
+        return counts
+    
+    def checkpoint(self, operation):
+        """
+        Snapshot after an operation and charge the growth since the last checkpoint to it
+        
+        Args:
+            operation: Name of what just ran, e.g. 'refresh' or 'export'
+        
+        Returns:
+            Bytes grown since the previous checkpoint (0 while not running)
+        """
+        if not self.running:
+            return 0
+        # Garbage waiting for the cycle collector, such as openpyxl's trees, is not growth
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        grown = size - self.previous_size
+        self.previous_size = size
+        
+        totals = self.operations.setdefault(operation, [0, 0])
+        totals[0] += 1
+        totals[1] += grown
+        self.checkpoints += 1
+        return grown
+    
+    def top_sites(self, limit=TOP_SITES):
+        """
+        Allocation sites that grew the most since profiling started
+        
+        Returns:
+            tracemalloc.StatisticDiff objects, largest growth first
+        """
+        if not self.running:
+            return []
+        stats = tracemalloc.take_snapshot().compare_to(self.baseline, 'lineno')
+        # Dropped after grouping; Snapshot.filter_traces is far slower on a large heap
+        return [stat for stat in stats
+                if stat.size_diff > 0 and stat.traceback[0].filename not in IGNORED_FILES][:limit]
+    
+    def report(self, limit=TOP_SITES):
+        """
+        Build a text report
+        
+        Returns:
+            List of lines
+        """
+        if not self.running:
+            return ["Memory profiling is off."]
+        counts = self._counts()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Memory profile over {time.time() - self.started_at:.0f} s, {self.checkpoints} checkpoint(s)",
+            f"Traced now: {format_size(current)} ({format_size(current - self.baseline_size)} "
+            f"since profiling started), peak {format_size(peak)}",
+            "",
+            "Growth by operation:",
+        ]
+        for operation, (calls, grown) in sorted(self.operations.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {operation:<24} {calls:>6} x  {format_size(grown):>10} total  "
+                         f"{format_size(grown // calls):>10} each")
+        if not self.operations:
+            lines.append("  (no checkpoints yet)")
+        
+        lines += ["", "Top allocation sites since profiling started:"]
+        for stat in self.top_sites(limit):
+            frame = stat.traceback[0]
+            lines.append(f"  {format_size(stat.size_diff):>10}  {stat.count_diff:>+8} blocks  "
+                         f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        
+        lines += ["", "Live objects (at start -> now):"]
+        for name in sorted(set(self.first_counts) | set(counts)):
+            before = self.first_counts.get(name, 0)
+            now = counts.get(name, 0)
+            lines.append(f"  {name:<24} {before:>8} -> {now:<8} {now - before:>+8}")
+        return lines
+    
+    def write_report(self, path):
+        """Write the report to a text file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.report()) + '\n')
+
+def soak_cycle(conn, cycle, project_ids, state):
+    """
+    Run one round of the application's headless paths on a project
+    
+    Args:
+        conn: SQLite connection to the generated database
+        cycle: Cycle number, used to pick the project and the optional steps
+        project_ids: Projects to cycle through
+        state: Dictionary of objects that live as long as the session, as in the application
+    
+    Yields:
+        Operation names, after each operation has run
+    """
+    from db_locking import write_transaction
+    from line_item_grid import GridRow, save_line_items
+    from models import load_labor, load_materials, load_project, load_tool_usage
+    from pricing import calculate_project_cost, page_projects
+    
+    cursor = conn.cursor()
+    project_id = project_ids[cycle % len(project_ids)]
+    identity_map = state['identity_map']
+    
+    project = load_project(cursor, project_id, identity_map)
+    state['line_items'] = {
+        'materials': load_materials(cursor, project_id, identity_map=identity_map),
+        'labor': load_labor(cursor, project_id, identity_map=identity_map),
+        'tool_usage': load_tool_usage(cursor, project_id, identity_map=identity_map),
+    }
+    state['profile_cache'].tools(cursor, project.profile_id)
+    calculate_project_cost(cursor, project_id)
+    yield 'open project'
+    
+    material = state['line_items']['materials'][0]
+    values = {'name': material.name, 'quantity': material.quantity + 1, 'unit_cost_cents': material.unit_cost_cents}
+    row = GridRow(material.id, material.row_version, values, 0)
+    row.saved_values['quantity'] = material.quantity
+    with write_transaction(conn) as write, state['undo'].record("Edit Material"):
+        save_line_items(write, 'materials', project_id, [row])
+    state['events'].publish('materials', 'update', (material.id,), project_id)
+    if cycle % 2:
+        state['undo'].undo()
+    yield 'edit line items'
+    
+    page_projects(cursor, limit=100)
+    yield 'project list'
+    
+    if cycle % EXPORT_EVERY == 0:
+        from excel_export import export_project_to_excel
+        
+        export_project_to_excel(cursor, project_id, state['export_path'])
+        yield 'export'
+
+def soak(db_path, cycles, warmup, profiler):
+    """
+    Repeat soak_cycle against a database under the profiler
+    
+    Returns:
+        Average bytes grown per cycle after warm-up
+    """
+    from events import EventBus
+    from models import IdentityMap, ProfileCache
+    from schema import connect
+    from undo import UndoJournal
+    
+    conn = connect(db_path)
+    try:
+        project_ids = [row[0] for row in conn.execute('SELECT id FROM projects ORDER BY id')]
+        fd, export_path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        events = EventBus()
+        events.subscribe(lambda batch: None, tables=('materials',))
+        identity_map = IdentityMap()
+        state = {
+            'identity_map': identity_map,
+            'profile_cache': ProfileCache(identity_map),
+            'undo': UndoJournal(conn),
+            'events': events,
+            'export_path': export_path,
+        }
+        try:
+            for cycle in range(cycles):
+                if cycle == warmup:
+                    # Imports and caches filled during warm-up are not growth
+                    profiler.stop()
+                    profiler.start()
+                for operation in soak_cycle(conn, cycle, project_ids, state):
+                    profiler.checkpoint(operation)
+        finally:
+            os.remove(export_path)
+    finally:
+        conn.close()
+    if cycles <= warmup:
+        return 0
+    return (profiler.previous_size - profiler.baseline_size) / (cycles - warmup)
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Soak test Project Pricer's headless paths for memory growth")
+    parser.add_argument('--projects', type=int, default=DEFAULT_PROJECTS, help="Projects to generate")
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES, help="Rounds of operations")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP,
+                        help="Rounds run before growth is measured, while caches fill")
+    parser.add_argument('--max-growth', type=int, default=DEFAULT_MAX_GROWTH,
+                        help="Bytes a round may add on average after warm-up")
+    parser.add_argument('--report', help="Also write the report to this file")
+    args = parser.parse_args()
+    
+    from query_plan_check import generate
+    from schema import connect
+    
+    temp_dir = tempfile.mkdtemp(prefix='memory_profile_')
+    db_path = os.path.join(temp_dir, 'soak.db')
+    profiler = MemoryProfiler()
+    try:
+        conn = connect(db_path)
+        generate(conn, args.projects)
+        conn.close()
+        
+        started = time.perf_counter()
+        profiler.start()
+        growth = soak(db_path, args.cycles, args.warmup, profiler)
+        elapsed = time.perf_counter() - started
+        report = profiler.report()
+        if args.report:
+            profiler.write_report(args.report)
+    finally:
+        profiler.stop()
+        for name in os.listdir(temp_dir):
+            os.remove(os.path.join(temp_dir, name))
+        os.rmdir(temp_dir)
+    
+    print('\n'.join(report))
+    print(f"\n{args.cycles} rounds in {elapsed:.1f} s; {format_size(int(growth))} per round after warm-up")
+    if growth > args.max_growth:
+        print(f"FAIL  memory grew by more than {format_size(args.max_growth)} per round")
+        return 1
+    print("No memory growth")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
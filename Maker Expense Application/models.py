@@ -0,0 +1,221 @@
+"""
+Domain model for Project Pricer
+Profiles, tools, projects and their line items as slotted objects built
+directly from query rows by a cursor row factory.
+
+An IdentityMap keeps one object per row while anything still holds it, so
+reloading a project refreshes the objects already in use instead of
+allocating new ones. Money fields are integer cents; row_version is the
+version the row was loaded at, for edits checked with db_locking.
+"""
+import weakref
+
+from money import line_cost
+
+class Model:
+    """Base for row objects; subclasses name their columns in FIELDS"""
+    
+    # __weakref__ lets the identity map hold objects without keeping them alive
+    __slots__ = ('__weakref__',)
+    FIELDS = ()
+    # SELECT of FIELDS in order; loaders append WHERE and ORDER BY
+    SELECT = ''
+    
+    def __init__(self, *values):
+        if len(values) != len(self.FIELDS):
+            raise TypeError(f"{type(self).__name__} takes {len(self.FIELDS)} values, got {len(values)}")
+        for name, value in zip(self.FIELDS, values):
+            setattr(self, name, value)
+    
+    def update(self, values):
+        """Overwrite the fields from a fresh row"""
+        for name, value in zip(self.FIELDS, values):
+            setattr(self, name, value)
+    
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.FIELDS)
+    
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+class Profile(Model):
+    FIELDS = ('id', 'name', 'hourly_rate_cents', 'created_date')
+    __slots__ = FIELDS
+    SELECT = 'SELECT id, name, hourly_rate_cents, created_date FROM profiles'
+
+class Tool(Model):
+    FIELDS = ('id', 'profile_id', 'name', 'cost_per_hour_cents')
+    __slots__ = FIELDS
+    SELECT = 'SELECT id, profile_id, name, cost_per_hour_cents FROM tools'
+
+class Project(Model):
+    FIELDS = ('id', 'profile_id', 'name', 'description', 'created_date', 'row_version')
+    __slots__ = FIELDS
+    SELECT = 'SELECT id, profile_id, name, description, created_date, row_version FROM projects'
+
+class Material(Model):
+    FIELDS = ('id', 'project_id', 'name', 'quantity', 'unit_cost_cents', 'catalog_id', 'row_version')
+    __slots__ = FIELDS
+    SELECT = 'SELECT id, project_id, name, quantity, unit_cost_cents, catalog_id, row_version FROM materials'
+    
+    @property
+    def total_cents(self):
+        return line_cost(self.quantity, self.unit_cost_cents)
+
+class LaborEntry(Model):
+    """A labor line with the hourly rate of its project's profile"""
+    
+    FIELDS = ('id', 'project_id', 'description', 'hours', 'hourly_rate_cents', 'row_version')
+    __slots__ = FIELDS
+    SELECT = '''
+        SELECT l.id, l.project_id, l.description, l.hours, p.hourly_rate_cents, l.row_version
+        FROM labor l
+        JOIN projects pr ON l.project_id = pr.id
+        LEFT JOIN profiles p ON pr.profile_id = p.id
+    '''
+    
+    @property
+    def total_cents(self):
+        return line_cost(self.hours, self.hourly_rate_cents)
+
+class ToolUsage(Model):
+    """A tool usage line with its tool's name and rate"""
+    
+    FIELDS = ('id', 'project_id', 'tool_id', 'tool_name', 'hours', 'cost_per_hour_cents', 'row_version')
+    __slots__ = FIELDS
+    SELECT = '''
+        SELECT tu.id, tu.project_id, tu.tool_id, t.name, tu.hours, t.cost_per_hour_cents, tu.row_version
+        FROM tool_usage tu
+        JOIN tools t ON tu.tool_id = t.id
+    '''
+    
+    @property
+    def total_cents(self):
+        return line_cost(self.hours, self.cost_per_hour_cents)
+
+class IdentityMap:
+    """One object per (model, id) for as long as something references it"""
+    
+    def __init__(self):
+        self._objects = weakref.WeakValueDictionary()
+    
+    def __len__(self):
+        return len(self._objects)
+    
+    def get(self, model, values):
+        """Return the object for a row, refreshing it if it is already loaded"""
+        key = (model, values[0])
+        obj = self._objects.get(key)
+        if obj is None:
+            obj = model(*values)
+            self._objects[key] = obj
+        else:
+            obj.update(values)
+        return obj
+
+class ProfileCache:
+    """
+    Profiles and each profile's tools, loaded once and kept until invalidated
+    
+    Callers that change profiles or tools call invalidate() after committing.
+    """
+    
+    def __init__(self, identity_map=None):
+        self.identity_map = identity_map
+        self._profiles = None
+        self._by_id = {}
+        self._tools = {}
+    
+    def profiles(self, cursor):
+        """All profiles in ID order"""
+        if self._profiles is None:
+            self._profiles = select(cursor, Profile, order_by='ORDER BY id',
+                                    identity_map=self.identity_map).fetchall()
+            self._by_id = {profile.id: profile for profile in self._profiles}
+        return self._profiles
+    
+    def profile(self, cursor, profile_id):
+        """A profile by ID, or None"""
+        self.profiles(cursor)
+        return self._by_id.get(profile_id)
+    
+    def tools(self, cursor, profile_id):
+        """A profile's tools in ID order"""
+        tools = self._tools.get(profile_id)
+        if tools is None:
+            tools = self._tools[profile_id] = load_tools(cursor, profile_id, self.identity_map)
+        return tools
+    
+    def tool_rates(self, cursor, profile_id):
+        """Dictionary of tool ID -> cost per hour in cents for a profile"""
+        return {tool.id: tool.cost_per_hour_cents or 0 for tool in self.tools(cursor, profile_id)}
+    
+    def invalidate(self, profile_id=None):
+        """
+        Forget cached rows
+        
+        Args:
+            profile_id: Profile whose tools changed, or None to forget everything
+        """
+        if profile_id is None:
+            self._profiles = None
+            self._by_id = {}
+            self._tools.clear()
+        else:
+            self._tools.pop(profile_id, None)
+
+def row_factory(model, identity_map=None):
+    """
+    Build a cursor row_factory that turns rows into model objects
+    
+    Args:
+        model: Model subclass matching the query's columns
+        identity_map: Optional IdentityMap to share objects through
+    
+    Returns:
+        Function suitable for sqlite3 Cursor.row_factory
+    """
+    if identity_map is None:
+        return lambda cursor, row: model(*row)
+    return lambda cursor, row: identity_map.get(model, row)
+
+def select(cursor, model, where='', params=(), order_by='', identity_map=None):
+    """
+    Run a model's SELECT on a new cursor of the same connection
+    
+    Args:
+        cursor: SQLite cursor (its own row_factory is left alone)
+        model: Model subclass
+        where: Optional WHERE clause
+        params: Query parameters
+        order_by: Optional ORDER BY clause
+        identity_map: Optional IdentityMap
+    
+    Returns:
+        Cursor yielding model objects
+    """
+    query = cursor.connection.cursor()
+    query.row_factory = row_factory(model, identity_map)
+    query.execute(f'{model.SELECT} {where} {order_by}', params)
+    return query
+
+def load_profile(cursor, profile_id, identity_map=None):
+    return select(cursor, Profile, 'WHERE id = ?', (profile_id,), identity_map=identity_map).fetchone()
+
+def load_project(cursor, project_id, identity_map=None):
+    return select(cursor, Project, 'WHERE id = ?', (project_id,), identity_map=identity_map).fetchone()
+
+def load_tools(cursor, profile_id, identity_map=None):
+    return select(cursor, Tool, 'WHERE profile_id = ?', (profile_id,), 'ORDER BY id',
+                  identity_map).fetchall()
+
+def load_materials(cursor, project_id, order_by='ORDER BY id', identity_map=None):
+    return select(cursor, Material, 'WHERE project_id = ?', (project_id,), order_by, identity_map).fetchall()
+
+def load_labor(cursor, project_id, order_by='ORDER BY l.id', identity_map=None):
+    return select(cursor, LaborEntry, 'WHERE l.project_id = ?', (project_id,), order_by, identity_map).fetchall()
+
+def load_tool_usage(cursor, project_id, order_by='ORDER BY tu.id', identity_map=None):
+    return select(cursor, ToolUsage, 'WHERE tu.project_id = ?', (project_id,), order_by,
+                  identity_map).fetchall()
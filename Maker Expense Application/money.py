@@ -0,0 +1,86 @@
+"""
+Money handling for Project Pricer
+Amounts are stored and summed as integer cents so totals are exact. Rates
+and unit costs are cents per hour or per unit; a line item's cost is its
+quantity times the rate, rounded to the cent once, half away from zero, in
+exactly the same way in Python and in SQL.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Excel number format for amounts written as dollars
+CURRENCY_FORMAT = '"$"#,##0.00'
+
+def to_cents(amount):
+    """
+    Convert a dollar amount to integer cents
+    
+    Args:
+        amount: Number or string such as 12.5, '12.50' or '$1,234.5'; None or '' gives None
+    
+    Returns:
+        Integer cents, or None
+    
+    Raises:
+        ValueError: If the amount is not a number
+    """
+    if amount is None or amount == '':
+        return None
+    text = str(amount).strip().replace('$', '').replace(',', '')
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Not an amount: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Not an amount: {amount!r}")
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Convert integer cents to dollars as a float, e.g. for Excel cells; None gives None"""
+    if cents is None:
+        return None
+    return cents / 100
+
+def format_money(cents, suffix='', signed=False):
+    """
+    Format integer cents as '$1,234.50'
+    
+    Args:
+        cents: Integer cents (None counts as zero)
+        suffix: Optional text to append, e.g. '/hr'
+        signed: Prefix positive amounts with '+', for differences
+    
+    Returns:
+        Formatted string
+    """
+    cents = int(cents or 0)
+    sign = '-' if cents < 0 else ('+' if signed else '')
+    dollars, remainder = divmod(abs(cents), 100)
+    return f"{sign}${dollars:,}.{remainder:02d}{suffix}"
+
+def line_cost(quantity, rate_cents):
+    """
+    Cost in cents of a quantity at a rate, rounded like line_cost_sql
+    
+    Args:
+        quantity: Quantity or hours (None counts as zero)
+        rate_cents: Unit cost or hourly rate in cents (None counts as zero)
+    
+    Returns:
+        Integer cents
+    """
+    amount = float(quantity or 0) * (rate_cents or 0)
+    # SQLite's ROUND(x) is (sqlite3_int64)(x + 0.5) for positive x
+    return int(amount + 0.5) if amount >= 0 else -int(-amount + 0.5)
+
+def line_cost_sql(quantity_sql, rate_sql):
+    """
+    Build an SQL expression for a line item's cost in cents
+    
+    Args:
+        quantity_sql: SQL expression for the quantity or hours
+        rate_sql: SQL expression for the rate in cents
+    
+    Returns:
+        SQL expression string giving an INTEGER
+    """
+    return f'CAST(ROUND(IFNULL({quantity_sql}, 0) * IFNULL({rate_sql}, 0)) AS INTEGER)'
@@ -0,0 +1,344 @@
+"""
+Material price history for Project Pricer
+Keeps every unit cost a material has had, keyed by material and effective
+date, so old quotes can be repriced at any date and price trends reported.
+Costs are stored in integer cents; the CSV import reads dollars.
+
+Materials are matched by name, ignoring case and surrounding spaces. The
+(material_key, effective_date) index answers an as-of lookup with a single
+index seek, so lookups stay fast with millions of price points.
+
+Command line usage:
+    python price_history.py import prices.csv      (name,unit_cost,effective_date)
+    python price_history.py asof "Pine 1x4" 2024-01-31
+    python price_history.py trend "Pine 1x4"
+    python price_history.py reprice 12 2024-01-31
+"""
+import csv
+import os
+import sqlite3
+import string
+from datetime import date
+
+from money import format_money, line_cost, to_cents
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+
+IMPORT_BATCH_SIZE = 100000
+
+TREND_BUCKETS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'year': '%Y',
+}
+
+# SQLite's lower() folds only ASCII letters, so 'É' stays upper case
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def material_key(name):
+    """Key a material name the same way as the SQL expression lower(trim(name))"""
+    return (name or '').strip(' ').translate(ASCII_LOWER)
+
+def material_key_sql(column):
+    """SQL expression keying a name column exactly as material_key does"""
+    return f'lower(trim({column}))'
+
+def today():
+    return date.today().isoformat()
+
+def record_price(cursor, name, unit_cost_cents, effective_date=None, source='entry'):
+    """
+    Record a material's unit cost from a date onwards
+    
+    A second price for the same material and date replaces the first.
+    
+    Args:
+        cursor: SQLite cursor
+        name: Material name
+        unit_cost_cents: Unit cost in cents
+        effective_date: ISO date the price applies from (default: today)
+        source: Where the price came from, e.g. 'entry' or 'import'
+    """
+    record_prices(cursor, [(name, unit_cost_cents, effective_date)], source)
+
+def record_prices(cursor, rows, source='import'):
+    """
+    Record many prices in one statement
+    
+    Args:
+        cursor: SQLite cursor
+        rows: Iterable of (name, unit_cost_cents, effective_date or None)
+        source: Where the prices came from
+    
+    Returns:
+        Number of rows written
+    """
+    fallback = today()
+    params = [(material_key(name), (effective_date or fallback)[:10], int(unit_cost_cents), source)
+              for name, unit_cost_cents, effective_date in rows if unit_cost_cents is not None]
+    # Inserting in index order touches each index page once instead of at random
+    params.sort(key=lambda row: (row[0], row[1]))
+    cursor.executemany('''
+        INSERT INTO material_prices (material_key, effective_date, unit_cost_cents, source)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (material_key, effective_date)
+        DO UPDATE SET unit_cost_cents = excluded.unit_cost_cents, source = excluded.source
+    ''', params)
+    return cursor.rowcount
+
+def import_prices_csv(cursor, path, source='import'):
+    """
+    Import a price history CSV with name, unit_cost (dollars) and effective_date columns
+    
+    Args:
+        cursor: SQLite cursor
+        path: CSV file
+        source: Source label for the rows
+    
+    Returns:
+        Number of rows imported
+    """
+    total = 0
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = {'name', 'unit_cost'} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV is missing column(s): {', '.join(sorted(missing))}")
+        batch = []
+        for row in reader:
+            batch.append((row['name'], to_cents(row['unit_cost']), row.get('effective_date') or None))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                total += record_prices(cursor, batch, source)
+                batch = []
+        if batch:
+            total += record_prices(cursor, batch, source)
+    return total
+
+def as_of_sql(key_sql, date_sql, column='unit_cost_cents'):
+    """
+    Build a correlated subquery for a material's price on a date
+    
+    Args:
+        key_sql: SQL expression giving the material key
+        date_sql: SQL expression giving the as-of date
+        column: Column of material_prices to return
+    
+    Returns:
+        SQL expression string
+    """
+    return f'''(
+        SELECT mp.{column} FROM material_prices mp
+        WHERE mp.material_key = {key_sql} AND mp.effective_date <= {date_sql}
+        ORDER BY mp.effective_date DESC LIMIT 1
+    )'''
+
+def price_as_of(cursor, name, as_of=None):
+    """
+    Look up a material's unit cost on a date
+    
+    Args:
+        cursor: SQLite cursor
+        name: Material name
+        as_of: ISO date (default: today)
+    
+    Returns:
+        (unit_cost_cents, effective_date) or None if no price is known by then
+    """
+    cursor.execute('''
+        SELECT unit_cost_cents, effective_date FROM material_prices
+        WHERE material_key = ? AND effective_date <= ?
+        ORDER BY effective_date DESC LIMIT 1
+    ''', (material_key(name), (as_of or today())[:10]))
+    return cursor.fetchone()
+
+def reprice_project(cursor, project_id, as_of=None):
+    """
+    Price a project's materials at a date in a single query
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of the project
+        as_of: ISO date (default: today)
+    
+    Returns:
+        Dictionary with 'items' (list of dictionaries with id, name, quantity,
+        unit_cost_cents, as_of_cost_cents and price_date), 'current_total' and
+        'as_of_total' in cents, and 'unpriced' (names with no price by that date)
+    """
+    as_of = (as_of or today())[:10]
+    cursor.execute(f'''
+        SELECT m.id, m.name, m.quantity, m.unit_cost_cents,
+               {as_of_sql('lower(trim(m.name))', ':as_of')},
+               {as_of_sql('lower(trim(m.name))', ':as_of', 'effective_date')}
+        FROM materials m
+        WHERE m.project_id = :project_id
+        ORDER BY m.id
+    ''', {'project_id': project_id, 'as_of': as_of})
+    
+    items = []
+    current_total = 0
+    as_of_total = 0
+    unpriced = []
+    for material_id, name, quantity, unit_cost_cents, as_of_cost_cents, price_date in cursor.fetchall():
+        quantity = quantity or 0
+        current_total += line_cost(quantity, unit_cost_cents)
+        if as_of_cost_cents is None:
+            # Keep the current cost so the totals stay comparable
+            unpriced.append(name)
+            as_of_total += line_cost(quantity, unit_cost_cents)
+        else:
+            as_of_total += line_cost(quantity, as_of_cost_cents)
+        items.append({'id': material_id, 'name': name, 'quantity': quantity,
+                      'unit_cost_cents': unit_cost_cents,
+                      'as_of_cost_cents': as_of_cost_cents, 'price_date': price_date})
+    return {'as_of': as_of, 'items': items, 'current_total': current_total,
+            'as_of_total': as_of_total, 'unpriced': unpriced}
+
+def apply_reprice(cursor, project_id, as_of=None):
+    """
+    Set a project's material costs to their prices on a date
+    
+    Materials with no price by that date keep their current cost.
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of the project
+        as_of: ISO date (default: today)
+    
+    Returns:
+        Number of materials changed
+    """
+    price = as_of_sql('lower(trim(materials.name))', ':as_of')
+    cursor.execute(f'''
+        UPDATE materials SET unit_cost_cents = {price}
+        WHERE project_id = :project_id
+          AND {price} IS NOT NULL
+          AND {price} IS NOT unit_cost_cents
+    ''', {'project_id': project_id, 'as_of': (as_of or today())[:10]})
+    return cursor.rowcount
+
+def price_trend(cursor, name, start=None, end=None, bucket='month'):
+    """
+    Summarize a material's price changes per period
+    
+    Args:
+        cursor: SQLite cursor
+        name: Material name
+        start: Optional first ISO date
+        end: Optional last ISO date
+        bucket: 'day', 'month' or 'year'
+    
+    Returns:
+        List of (period, changes, min, avg, max, last) tuples in date order, in
+        cents (avg may be fractional)
+    """
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"Bucket must be one of {', '.join(TREND_BUCKETS)}")
+    cursor.execute(f'''
+        SELECT period, COUNT(*), MIN(unit_cost_cents), AVG(unit_cost_cents), MAX(unit_cost_cents),
+               MAX(last_cost)
+        FROM (
+            SELECT strftime('{TREND_BUCKETS[bucket]}', effective_date) AS period, unit_cost_cents,
+                   LAST_VALUE(unit_cost_cents) OVER (
+                       PARTITION BY strftime('{TREND_BUCKETS[bucket]}', effective_date)
+                       ORDER BY effective_date
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                   ) AS last_cost
+            FROM material_prices
+            WHERE material_key = :key
+              AND effective_date >= :start AND effective_date <= :end
+        )
+        GROUP BY period
+        ORDER BY period
+    ''', {'key': material_key(name), 'start': start or '0000-00-00', 'end': end or '9999-12-31'})
+    return cursor.fetchall()
+
+def price_movers(cursor, start, end=None, limit=20):
+    """
+    Find the materials used in projects whose prices changed most between two dates
+    
+    Args:
+        cursor: SQLite cursor
+        start: ISO date to compare from
+        end: ISO date to compare to (default: today)
+        limit: Maximum rows
+    
+    Returns:
+        List of (material_key, start_cost, end_cost, change_ratio) with costs in
+        cents, largest change first
+    """
+    cursor.execute(f'''
+        SELECT material_key, start_cost, end_cost, (end_cost - start_cost) * 1.0 / start_cost AS change
+        FROM (
+            SELECT k.material_key,
+                   {as_of_sql('k.material_key', ':start')} AS start_cost,
+                   {as_of_sql('k.material_key', ':end')} AS end_cost
+            FROM (SELECT DISTINCT lower(trim(name)) AS material_key FROM materials) k
+        )
+        WHERE start_cost > 0 AND end_cost IS NOT NULL
+        ORDER BY abs(change) DESC
+        LIMIT :limit
+    ''', {'start': start[:10], 'end': (end or today())[:10], 'limit': limit})
+    return cursor.fetchall()
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer material price history")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    import_parser = subparsers.add_parser('import', help="Import a name,unit_cost,effective_date CSV")
+    import_parser.add_argument('csv_file')
+    
+    asof_parser = subparsers.add_parser('asof', help="Show a material's price on a date")
+    asof_parser.add_argument('name')
+    asof_parser.add_argument('date', nargs='?')
+    
+    trend_parser = subparsers.add_parser('trend', help="Show a material's price per period")
+    trend_parser.add_argument('name')
+    trend_parser.add_argument('--bucket', choices=sorted(TREND_BUCKETS), default='month')
+    
+    reprice_parser = subparsers.add_parser('reprice', help="Price a project's materials at a date")
+    reprice_parser.add_argument('project_id', type=int)
+    reprice_parser.add_argument('date', nargs='?')
+    
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} not found")
+    
+    from schema import connect
+    conn = connect(args.db)
+    cursor = conn.cursor()
+    try:
+        if args.command == 'import':
+            count = import_prices_csv(cursor, args.csv_file)
+            conn.commit()
+            print(f"Imported {count} prices")
+        elif args.command == 'asof':
+            price = price_as_of(cursor, args.name, args.date)
+            if not price:
+                print(f"No price for {args.name} by {args.date or today()}")
+                return 1
+            print(f"{format_money(price[0])} (since {price[1]})")
+        elif args.command == 'trend':
+            for period, changes, low, avg, high, last in price_trend(cursor, args.name, bucket=args.bucket):
+                print(f"{period}  {changes:>4} prices  min {format_money(low)}  avg {format_money(round(avg))}  "
+                      f"max {format_money(high)}  last {format_money(last)}")
+        else:
+            report = reprice_project(cursor, args.project_id, args.date)
+            for item in report['items']:
+                as_of_cost = ('no price' if item['as_of_cost_cents'] is None
+                              else format_money(item['as_of_cost_cents']))
+                print(f"{item['name']:<30} {format_money(item['unit_cost_cents'])} -> {as_of_cost}")
+            print(f"Materials total: {format_money(report['current_total'])} now, "
+                  f"{format_money(report['as_of_total'])} at {report['as_of']}")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
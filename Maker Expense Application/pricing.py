@@ -0,0 +1,327 @@
+"""
+Pricing queries for Project Pricer
+Headless functions shared by the desktop application, the HTTP API and
+the reporting tools. All amounts are integer cents (see money.py).
+"""
+from money import line_cost_sql
+
+def cost_component_sql(schema='main', alias='p'):
+    """
+    Build SQL expressions for a project's materials, labor and tools costs
+    
+    Each expression is correlated on {alias}.id and {alias}.profile_id and
+    sums the rounded line item costs, so it is an exact integer.
+    
+    Args:
+        schema: Database schema holding the tables, or None for unqualified
+            names (required inside triggers)
+        alias: Alias of the projects table in the outer query
+    
+    Returns:
+        Dictionary with materials, labor and tools SQL expressions
+    """
+    prefix = f'{schema}.' if schema else ''
+    return {
+        'materials': f'''IFNULL((SELECT SUM({line_cost_sql('m.quantity', 'm.unit_cost_cents')})
+                FROM {prefix}materials m WHERE m.project_id = {alias}.id), 0)''',
+        'labor': f'''IFNULL((SELECT SUM({line_cost_sql('l.hours', 'pr.hourly_rate_cents')})
+                FROM {prefix}labor l JOIN {prefix}profiles pr ON pr.id = {alias}.profile_id
+                WHERE l.project_id = {alias}.id), 0)''',
+        'tools': f'''IFNULL((SELECT SUM({line_cost_sql('tu.hours', 't.cost_per_hour_cents')})
+                FROM {prefix}tool_usage tu JOIN {prefix}tools t ON tu.tool_id = t.id
+                WHERE tu.project_id = {alias}.id), 0)''',
+    }
+
+def project_total_sql(schema='main', alias='p'):
+    """
+    Build an SQL expression for a project's total cost in cents
+    
+    The expression is correlated on {alias}.id and {alias}.profile_id, so it
+    can be used in the select list of any query over the projects table.
+    
+    Args:
+        schema: Database schema holding the tables, or None for unqualified
+            names (required inside triggers)
+        alias: Alias of the projects table in the outer query
+    
+    Returns:
+        SQL expression string
+    """
+    return '(' + ' + '.join(cost_component_sql(schema, alias).values()) + ')'
+
+def line_item_cost_sql(table, row):
+    """
+    Build an SQL expression for the cost in cents one line item row adds to its project
+    
+    Args:
+        table: 'materials', 'labor' or 'tool_usage'
+        row: Row reference, e.g. 'NEW' or 'OLD' inside a trigger
+    
+    Returns:
+        SQL expression string
+    """
+    if table == 'materials':
+        return line_cost_sql(f'{row}.quantity', f'{row}.unit_cost_cents')
+    if table == 'labor':
+        return line_cost_sql(f'{row}.hours', f'''(
+            SELECT pr.hourly_rate_cents FROM projects p JOIN profiles pr ON pr.id = p.profile_id
+            WHERE p.id = {row}.project_id)''')
+    if table == 'tool_usage':
+        return line_cost_sql(f'{row}.hours', f'''(
+            SELECT t.cost_per_hour_cents FROM tools t WHERE t.id = {row}.tool_id)''')
+    raise ValueError(f"Unknown line item table: {table}")
+
+def install_project_totals(cursor):
+    """
+    Create the project_totals rollup and the triggers that keep it current
+    
+    Line item changes adjust a project's total by the difference they make;
+    rate changes and profile moves recompute the affected projects. Totals
+    are sums of integer cents, so the adjustments never drift.
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_totals (
+            project_id INTEGER PRIMARY KEY,
+            total_cents INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_project_totals_total ON project_totals (total_cents)')
+    
+    recompute = f'''
+        INSERT OR REPLACE INTO project_totals (project_id, total_cents)
+        SELECT p.id, {project_total_sql(None)} FROM projects p WHERE p.id IN ({{ids}});
+    '''
+    triggers = {
+        'project_totals_projects_insert': ('AFTER INSERT ON projects', recompute.format(ids='NEW.id')),
+        'project_totals_projects_profile': ('AFTER UPDATE OF profile_id ON projects',
+                                            recompute.format(ids='NEW.id')),
+        'project_totals_projects_delete': ('AFTER DELETE ON projects', '''
+            DELETE FROM project_totals WHERE project_id = OLD.id;
+        '''),
+    }
+    # Rate rows are recomputed on insert too, since replicas apply updates as INSERT OR REPLACE
+    for table, ids in (('profiles', 'SELECT id FROM projects WHERE profile_id = {row}.id'),
+                       ('tools', 'SELECT project_id FROM tool_usage WHERE tool_id = {row}.id')):
+        rate = 'hourly_rate_cents' if table == 'profiles' else 'cost_per_hour_cents'
+        triggers[f'project_totals_{table}_insert'] = (f'AFTER INSERT ON {table}',
+                                                      recompute.format(ids=ids.format(row='NEW')))
+        triggers[f'project_totals_{table}_rate'] = (f'AFTER UPDATE OF {rate} ON {table}',
+                                                    recompute.format(ids=ids.format(row='NEW')))
+        triggers[f'project_totals_{table}_delete'] = (f'AFTER DELETE ON {table}',
+                                                      recompute.format(ids=ids.format(row='OLD')))
+    
+    for table in ('materials', 'labor', 'tool_usage'):
+        add = f'''
+            UPDATE project_totals SET total_cents = total_cents + {line_item_cost_sql(table, 'NEW')}
+            WHERE project_id = NEW.project_id;
+        '''
+        subtract = f'''
+            UPDATE project_totals SET total_cents = total_cents - {line_item_cost_sql(table, 'OLD')}
+            WHERE project_id = OLD.project_id;
+        '''
+        triggers[f'project_totals_{table}_insert'] = (f'AFTER INSERT ON {table}', add)
+        triggers[f'project_totals_{table}_update'] = (f'AFTER UPDATE ON {table}', subtract + add)
+        triggers[f'project_totals_{table}_delete'] = (f'AFTER DELETE ON {table}', subtract)
+    
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+    
+    rebuild_project_totals(cursor)
+
+def rebuild_project_totals(cursor):
+    """Recompute every project total from its line items"""
+    cursor.execute('DELETE FROM project_totals')
+    cursor.execute(f'''
+        INSERT INTO project_totals (project_id, total_cents)
+        SELECT p.id, {project_total_sql()} FROM projects p
+    ''')
+
+def calculate_project_cost(cursor, project_id):
+    """Calculate total cost for a project in cents"""
+    costs = project_costs(cursor, project_id)
+    return costs['total']
+
+def project_costs(cursor, project_id):
+    """
+    Calculate the cost breakdown for a project in one query
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of the project
+    
+    Returns:
+        Dictionary with materials, labor, tools and total costs in cents
+        (all zero if the project does not exist)
+    """
+    components = cost_component_sql()
+    cursor.execute(f'''
+        SELECT {components['materials']}, {components['labor']}, {components['tools']}
+        FROM projects p
+        WHERE p.id = ?
+    ''', (project_id,))
+    materials, labor, tools = cursor.fetchone() or (0, 0, 0)
+    return {'materials': materials, 'labor': labor, 'tools': tools, 'total': materials + labor + tools}
+
+def list_projects(cursor, profile_id=None):
+    """
+    List projects with their totals from the project_totals rollup
+    
+    Args:
+        cursor: SQLite cursor
+        profile_id: Optional profile to restrict the list to
+    
+    Returns:
+        List of (id, profile_id, name, description, created_date, total_cents)
+    """
+    cursor.execute('''
+        SELECT p.id, p.profile_id, p.name, p.description, p.created_date, IFNULL(t.total_cents, 0)
+        FROM projects p
+        LEFT JOIN project_totals t ON t.project_id = p.id
+        WHERE ? IS NULL OR p.profile_id = ?
+        ORDER BY p.created_date DESC
+    ''', (profile_id, profile_id))
+    return cursor.fetchall()
+
+def project_line_items(cursor, project_id):
+    """
+    Load the line items of a project
+    
+    Args:
+        cursor: SQLite cursor
+        project_id: ID of the project
+    
+    Returns:
+        Dictionary with materials, labor and tool_usage lists of dictionaries;
+        rates and totals are in cents, and row_version is each row's version
+    """
+    cursor.execute(f'''
+        SELECT id, name, quantity, unit_cost_cents, {line_cost_sql('quantity', 'unit_cost_cents')}, row_version
+        FROM materials WHERE project_id = ?
+    ''', (project_id,))
+    materials = [{'id': row[0], 'name': row[1], 'quantity': row[2], 'unit_cost_cents': row[3],
+                  'total_cents': row[4], 'row_version': row[5]}
+                 for row in cursor.fetchall()]
+    
+    cursor.execute(f'''
+        SELECT l.id, l.description, l.hours, p.hourly_rate_cents,
+               {line_cost_sql('l.hours', 'p.hourly_rate_cents')}, l.row_version
+        FROM labor l
+        JOIN projects pr ON l.project_id = pr.id
+        JOIN profiles p ON pr.profile_id = p.id
+        WHERE l.project_id = ?
+    ''', (project_id,))
+    labor = [{'id': row[0], 'description': row[1], 'hours': row[2], 'rate_cents': row[3],
+              'total_cents': row[4], 'row_version': row[5]}
+             for row in cursor.fetchall()]
+    
+    cursor.execute(f'''
+        SELECT tu.id, tu.tool_id, t.name, tu.hours, t.cost_per_hour_cents,
+               {line_cost_sql('tu.hours', 't.cost_per_hour_cents')}, tu.row_version
+        FROM tool_usage tu
+        JOIN tools t ON tu.tool_id = t.id
+        WHERE tu.project_id = ?
+    ''', (project_id,))
+    tool_usage = [{'id': row[0], 'tool_id': row[1], 'tool': row[2], 'hours': row[3], 'rate_cents': row[4],
+                   'total_cents': row[5], 'row_version': row[6]}
+                  for row in cursor.fetchall()]
+    
+    return {'materials': materials, 'labor': labor, 'tool_usage': tool_usage}
+
+# Sortable project list columns: (sort expression, tie-breaking id) pairs.
+# The id is taken from the same table as the sort expression so each order
+# is read straight from one index. Nullable columns are sorted through
+# IFNULL: a NULL sort key would fail every keyset comparison, so those
+# projects would never appear on a later page.
+PROJECT_SORT_COLUMNS = {
+    'ID': ('p.id', 'p.id'),
+    'Name': ('p.name COLLATE NOCASE', 'p.id'),
+    'Description': ("IFNULL(p.description, '')", 'p.id'),
+    'Date': ("IFNULL(p.created_date, '')", 'p.id'),
+    'Total Cost': ('t.total_cents', 't.project_id'),
+}
+
+def project_filter_sql(filters, total_sql='t.total_cents'):
+    """
+    Build a WHERE clause for project list filters
+    
+    Args:
+        filters: Dictionary with any of name, date_from, date_to, min_total and max_total
+            (totals in cents)
+        total_sql: SQL expression for the project total in cents
+    
+    Returns:
+        (sql, params) where sql starts with 'WHERE' or is empty
+    """
+    clauses = []
+    params = []
+    filters = filters or {}
+    if filters.get('name'):
+        clauses.append("p.name LIKE '%' || ? || '%'")
+        params.append(filters['name'])
+    if filters.get('date_from'):
+        clauses.append('p.created_date >= ?')
+        params.append(filters['date_from'])
+    if filters.get('date_to'):
+        # Dates are stored as ISO timestamps; include the whole end day
+        clauses.append("p.created_date < date(?, '+1 day')")
+        params.append(filters['date_to'])
+    if filters.get('min_total') is not None:
+        clauses.append(f'{total_sql} >= ?')
+        params.append(filters['min_total'])
+    if filters.get('max_total') is not None:
+        clauses.append(f'{total_sql} <= ?')
+        params.append(filters['max_total'])
+    if filters.get('profile_id') is not None:
+        clauses.append('p.profile_id = ?')
+        params.append(filters['profile_id'])
+    return ('WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+def count_projects(cursor, filters=None):
+    """Count the projects matching a set of filters"""
+    where, params = project_filter_sql(filters)
+    cursor.execute(f'''
+        SELECT COUNT(*) FROM projects p
+        JOIN project_totals t ON t.project_id = p.id
+        {where}
+    ''', params)
+    return cursor.fetchone()[0]
+
+def page_projects(cursor, filters=None, sort='Date', descending=True, limit=100, after=None):
+    """
+    Fetch one page of the project list using keyset pagination
+    
+    Each page continues from the sort key of the previous page's last row,
+    so every page is an index range scan however far into the list it is.
+    
+    Args:
+        cursor: SQLite cursor
+        filters: Optional filters for project_filter_sql
+        sort: Key of PROJECT_SORT_COLUMNS
+        descending: Sort direction
+        limit: Page size
+        after: (sort_value, id) of the previous page's last row, or None for the first page
+    
+    Returns:
+        List of (id, name, description, created_date, total_cents, sort_value)
+    """
+    sort_sql, id_sql = PROJECT_SORT_COLUMNS[sort]
+    where, params = project_filter_sql(filters)
+    direction = 'DESC' if descending else 'ASC'
+    if after is not None:
+        comparison = '<' if descending else '>'
+        where += (' AND ' if where else 'WHERE ') + f'({sort_sql}, {id_sql}) {comparison} (?, ?)'
+        params.extend(after)
+    
+    cursor.execute(f'''
+        SELECT p.id, p.name, p.description, p.created_date, t.total_cents, {sort_sql}
+        FROM projects p
+        JOIN project_totals t ON t.project_id = p.id
+        {where}
+        ORDER BY {sort_sql} {direction}, {id_sql} {direction}
+        LIMIT ?
+    ''', params + [limit])
+    return cursor.fetchall()
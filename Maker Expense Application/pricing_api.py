@@ -0,0 +1,504 @@
+"""
+Local HTTP/JSON pricing API for Project Pricer
+Lets shop-floor tablets and quoting scripts list projects, get prices and
+edit line items without the desktop application. Runs on asyncio with a
+small pool of SQLite connections: several read-only readers plus one
+writer that serializes all changes.
+
+Usage:
+    python pricing_api.py [--host 127.0.0.1] [--port 8765] [--readers 4]
+
+Endpoints:
+    GET    /projects[?profile_id=N]     Project list with totals
+    GET    /projects/{id}               Project with line items and costs
+    GET    /projects/{id}/price         Cost breakdown
+    POST   /projects/{id}/materials     {"name", "quantity", "unit_cost_cents"}
+    POST   /projects/{id}/labor         {"description", "hours"}
+    POST   /projects/{id}/tool_usage    {"tool_id", "hours"}
+    PUT    /materials/{id}, /labor/{id}, /tool_usage/{id}   Partial update
+    DELETE /materials/{id}, /labor/{id}, /tool_usage/{id}[?row_version=N]
+
+All amounts, including the cost breakdown, are integer cents.
+
+Line items carry a row_version. A PUT body or DELETE query that includes
+the row_version the client loaded only succeeds if nobody has changed the
+item since; otherwise the response is 409 Conflict with the current version.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import pathname2url
+
+from db_locking import ConflictError, begin_write, configure, row_version, update_versioned
+from price_history import record_price
+from pricing import list_projects, project_costs, project_line_items
+from schema import init_schema
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_READERS = 4
+MAX_BODY_BYTES = 1024 * 1024
+# SQLite stores integers in 64 bits
+MIN_INTEGER = -2 ** 63
+MAX_INTEGER = 2 ** 63 - 1
+
+STATUS_TEXT = {
+    200: 'OK',
+    201: 'Created',
+    204: 'No Content',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+# Editable fields of each line item table and their types
+LINE_ITEM_FIELDS = {
+    'materials': {'name': str, 'quantity': float, 'unit_cost_cents': int},
+    'labor': {'description': str, 'hours': float},
+    'tool_usage': {'tool_id': int, 'hours': float},
+}
+
+class HttpError(Exception):
+    """Error returned to the client as a JSON response"""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class ConnectionPool:
+    """Read-only reader connections plus a single serialized writer"""
+    
+    def __init__(self, db_path, readers=DEFAULT_READERS):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=readers + 1, thread_name_prefix='pricing-db')
+        
+        self.writer = configure(sqlite3.connect(db_path, check_same_thread=False), busy_timeout_ms=30000)
+        begin_write(self.writer)
+        init_schema(self.writer.cursor())
+        self.writer.commit()
+        self.write_lock = asyncio.Lock()
+        
+        uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+        self.readers = asyncio.Queue()
+        for _ in range(readers):
+            self.readers.put_nowait(sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30))
+    
+    async def read(self, func, *args):
+        """Run func(cursor, *args) on a free reader connection"""
+        conn = await self.readers.get()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._run, conn, False, func, args)
+        finally:
+            self.readers.put_nowait(conn)
+    
+    async def write(self, func, *args):
+        """Run func(cursor, *args) on the writer connection and commit"""
+        async with self.write_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._run, self.writer, True, func, args)
+    
+    @staticmethod
+    def _run(conn, commit, func, args):
+        cursor = conn.cursor()
+        try:
+            if commit:
+                # Checks and writes see the same data under the write lock
+                begin_write(conn)
+            result = func(cursor, *args)
+            if commit:
+                conn.commit()
+            return result
+        except Exception:
+            if commit:
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    
+    def close(self):
+        self.executor.shutdown(wait=True)
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
+        self.writer.close()
+
+# Database operations, run on pool threads
+
+def fetch_project(cursor, project_id):
+    cursor.execute('''
+        SELECT p.id, p.profile_id, p.name, p.description, p.created_date, pr.name, pr.hourly_rate_cents
+        FROM projects p
+        LEFT JOIN profiles pr ON p.profile_id = pr.id
+        WHERE p.id = ?
+    ''', (project_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    
+    project = {
+        'id': row[0],
+        'profile_id': row[1],
+        'name': row[2],
+        'description': row[3],
+        'created_date': row[4],
+        'profile': row[5],
+        'hourly_rate_cents': row[6],
+    }
+    project.update(project_line_items(cursor, project_id))
+    project['costs'] = project_costs(cursor, project_id)
+    return project
+
+def fetch_costs(cursor, project_id):
+    cursor.execute('SELECT 1 FROM projects WHERE id = ?', (project_id,))
+    if not cursor.fetchone():
+        return None
+    return project_costs(cursor, project_id)
+
+def fetch_projects(cursor, profile_id):
+    return [
+        {'id': row[0], 'profile_id': row[1], 'name': row[2], 'description': row[3],
+         'created_date': row[4], 'total_cost_cents': row[5]}
+        for row in list_projects(cursor, profile_id)
+    ]
+
+def insert_line_item(cursor, table, project_id, fields):
+    cursor.execute('SELECT 1 FROM projects WHERE id = ?', (project_id,))
+    if not cursor.fetchone():
+        raise HttpError(404, "Project not found")
+    
+    if table == 'tool_usage':
+        # Only tools from the project's profile can be used
+        cursor.execute('''
+            SELECT 1
+            FROM tools t
+            JOIN projects p ON t.profile_id = p.profile_id
+            WHERE p.id = ? AND t.id = ?
+        ''', (project_id, fields['tool_id']))
+        if not cursor.fetchone():
+            raise HttpError(400, "Tool does not belong to the project's profile")
+    
+    columns = ['project_id'] + list(fields)
+    placeholders = ', '.join('?' for _ in columns)
+    cursor.execute(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})',
+                   [project_id] + list(fields.values()))
+    item_id = cursor.lastrowid
+    if table == 'materials':
+        record_price(cursor, fields['name'], fields['unit_cost_cents'])
+    return item_id
+
+def check_version(cursor, table, item_id, version):
+    """Current version of a line item, or None if it does not exist; raises ConflictError on a mismatch"""
+    current = row_version(cursor, table, item_id)
+    if current is not None and version is not None and version != current:
+        raise ConflictError(table, item_id)
+    return current
+
+def update_line_item(cursor, table, item_id, fields, version=None):
+    current = check_version(cursor, table, item_id, version)
+    if current is None:
+        return None
+    
+    if table == 'tool_usage' and 'tool_id' in fields:
+        cursor.execute('''
+            SELECT 1
+            FROM tool_usage tu
+            JOIN projects p ON tu.project_id = p.id
+            JOIN tools t ON t.profile_id = p.profile_id
+            WHERE tu.id = ? AND t.id = ?
+        ''', (item_id, fields['tool_id']))
+        if not cursor.fetchone():
+            raise HttpError(400, "Tool does not belong to the project's profile")
+    
+    new_version = update_versioned(cursor, table, item_id, current, fields)
+    if table == 'materials' and 'unit_cost_cents' in fields:
+        cursor.execute('SELECT name, unit_cost_cents FROM materials WHERE id = ?', (item_id,))
+        record_price(cursor, *cursor.fetchone())
+    return new_version
+
+def delete_line_item(cursor, table, item_id, version=None):
+    if check_version(cursor, table, item_id, version) is None:
+        return 0
+    if table == 'materials':
+        cursor.execute('DELETE FROM cut_parts WHERE material_id = ?', (item_id,))
+    cursor.execute(f'DELETE FROM {table} WHERE id = ?', (item_id,))
+    return cursor.rowcount
+
+def parse_fields(table, data, partial):
+    """
+    Validate a JSON body against the editable fields of a line item table
+    
+    Args:
+        table: Line item table name
+        data: Decoded JSON body
+        partial: True for updates, where any subset of fields may be given
+    
+    Returns:
+        Dictionary of validated field values
+    """
+    if not isinstance(data, dict):
+        raise HttpError(400, "Request body must be a JSON object")
+    
+    spec = LINE_ITEM_FIELDS[table]
+    unknown = set(data) - set(spec)
+    if unknown:
+        raise HttpError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    
+    fields = {}
+    for name, field_type in spec.items():
+        if name not in data:
+            if not partial:
+                raise HttpError(400, f"Missing field: {name}")
+            continue
+        
+        value = data[name]
+        if field_type is str:
+            if not isinstance(value, str) or not value.strip():
+                raise HttpError(400, f"{name} must be a non-empty string")
+            value = value.strip()
+        else:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise HttpError(400, f"{name} must be a number")
+            # Overflowing literals such as 1e400 decode to infinity
+            if not math.isfinite(value):
+                raise HttpError(400, f"{name} must be a finite number")
+            if field_type is int and value != int(value):
+                raise HttpError(400, f"{name} must be a whole number")
+            value = field_type(value)
+            if not MIN_INTEGER <= value <= MAX_INTEGER:
+                raise HttpError(400, f"{name} is out of range")
+        fields[name] = value
+    
+    if not fields:
+        raise HttpError(400, "No fields to update")
+    return fields
+
+def parse_version(value):
+    """Validate an optional row_version from a request body or query"""
+    if isinstance(value, str):
+        if not value.isdigit():
+            raise HttpError(400, "row_version must be an integer")
+        value = int(value)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int)
+                              or not MIN_INTEGER <= value <= MAX_INTEGER):
+        raise HttpError(400, "row_version must be an integer")
+    return value
+
+def parse_id(value):
+    """Convert an ID matched in the path, rejecting ones SQLite cannot store"""
+    value = int(value)
+    if value > MAX_INTEGER:
+        raise HttpError(404, "Not found")
+    return value
+
+class PricingServer:
+    """Minimal HTTP/1.1 server routing JSON requests to the connection pool"""
+    
+    def __init__(self, pool):
+        self.pool = pool
+        self.routes = [
+            ('GET', r'/health', self.health),
+            ('GET', r'/projects', self.get_projects),
+            ('GET', r'/projects/(\d+)', self.get_project),
+            ('GET', r'/projects/(\d+)/price', self.get_price),
+            ('POST', r'/projects/(\d+)/(materials|labor|tool_usage)', self.post_line_item),
+            ('PUT', r'/(materials|labor|tool_usage)/(\d+)', self.put_line_item),
+            ('DELETE', r'/(materials|labor|tool_usage)/(\d+)', self.delete_line_item),
+        ]
+        self.routes = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in self.routes]
+    
+    # Handlers return (status, payload)
+    
+    async def health(self, query, body):
+        return 200, {'status': 'ok'}
+    
+    async def get_projects(self, query, body):
+        profile_id = query.get('profile_id', [None])[0]
+        if profile_id is not None:
+            if not profile_id.isdigit() or int(profile_id) > MAX_INTEGER:
+                raise HttpError(400, "profile_id must be an integer")
+            profile_id = int(profile_id)
+        return 200, await self.pool.read(fetch_projects, profile_id)
+    
+    async def get_project(self, query, body, project_id):
+        project = await self.pool.read(fetch_project, parse_id(project_id))
+        if project is None:
+            raise HttpError(404, "Project not found")
+        return 200, project
+    
+    async def get_price(self, query, body, project_id):
+        costs = await self.pool.read(fetch_costs, parse_id(project_id))
+        if costs is None:
+            raise HttpError(404, "Project not found")
+        return 200, costs
+    
+    async def post_line_item(self, query, body, project_id, table):
+        fields = parse_fields(table, self.decode(body), partial=False)
+        item_id = await self.pool.write(insert_line_item, table, parse_id(project_id), fields)
+        return 201, {'id': item_id}
+    
+    async def put_line_item(self, query, body, table, item_id):
+        data = self.decode(body)
+        version = parse_version(data.pop('row_version', None) if isinstance(data, dict) else None)
+        fields = parse_fields(table, data, partial=True)
+        item_id = parse_id(item_id)
+        new_version = await self.pool.write(update_line_item, table, item_id, fields, version)
+        if new_version is None:
+            raise HttpError(404, "Line item not found")
+        return 200, {'id': item_id, 'row_version': new_version}
+    
+    async def delete_line_item(self, query, body, table, item_id):
+        version = parse_version(query.get('row_version', [None])[0])
+        if not await self.pool.write(delete_line_item, table, parse_id(item_id), version):
+            raise HttpError(404, "Line item not found")
+        return 204, None
+    
+    @staticmethod
+    def reject_constant(name):
+        raise ValueError(f"{name} is not allowed")
+    
+    @staticmethod
+    def decode(body):
+        try:
+            # NaN and Infinity are not JSON, though json.loads accepts them by default
+            return json.loads(body or b'null', parse_constant=PricingServer.reject_constant)
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+    
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+        path_matched = False
+        
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            path_matched = True
+            if route_method != method:
+                continue
+            try:
+                return await handler(parse_qs(url.query), body, *match.groups())
+            except HttpError as e:
+                return e.status, {'error': e.message}
+            except ConflictError as e:
+                current = await self.pool.read(row_version, e.table, e.row_id)
+                return 409, {'error': str(e), 'row_version': current}
+            except sqlite3.Error as e:
+                return 500, {'error': f"Database error: {e}"}
+            except Exception as e:
+                # Answer rather than dropping the connection
+                return 500, {'error': f"Internal error: {e}"}
+        
+        if path_matched:
+            return 405, {'error': "Method not allowed"}
+        return 404, {'error': "Not found"}
+    
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one client connection, honouring keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self.send(writer, 400, {'error': "Malformed request line"}, False)
+                    break
+                method, target, version = parts
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    status = 413 if length > MAX_BODY_BYTES else 400
+                    await self.send(writer, status, {'error': "Invalid request body length"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                
+                status, payload = await self.dispatch(method.upper(), target, body)
+                await self.send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    @staticmethod
+    async def send(writer, status, payload, keep_alive):
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        head = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+async def serve(db_path=DEFAULT_DB_PATH, host=DEFAULT_HOST, port=DEFAULT_PORT, readers=DEFAULT_READERS,
+                ready=None):
+    """
+    Run the API server until cancelled
+    
+    Args:
+        db_path: Database file
+        host: Interface to listen on
+        port: TCP port
+        readers: Number of read-only connections
+        ready: Optional callback(server) called once listening
+    """
+    pool = ConnectionPool(db_path, readers)
+    api = PricingServer(pool)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    try:
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.close()
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer HTTP pricing API")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Interface to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port")
+    parser.add_argument('--readers', type=int, default=DEFAULT_READERS, help="Read-only connections")
+    args = parser.parse_args()
+    
+    def ready(server):
+        print(f"Serving Project Pricer API on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.readers, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
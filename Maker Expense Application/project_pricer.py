@@ -2,10 +2,64 @@
 Project Pricer - A tool for makers and DIYers to price out projects
 """
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import sqlite3
 from datetime import datetime
 import json
+import multiprocessing
+import os
+import threading
+
+from db_backup import BackupScheduler, create_snapshot, list_snapshots, restore_snapshot
+from db_replication import ReplicationScheduler, Replicator, install_change_log, stop_change_log
+from db_archive import archive_projects, attach_archives, detach_archives, list_archived_projects
+from db_locking import ConflictError, configure, delete_versioned, row_version, write_transaction
+from db_maintenance import MaintenanceScheduler, format_report, format_table_stats, table_stats
+from money import format_money, line_cost_sql, to_cents
+from pricing import calculate_project_cost, count_projects, page_projects, project_filter_sql
+from price_history import apply_reprice, price_trend, record_price, reprice_project
+from supplier_prices import update_from_price_list
+from excel_import import import_workbooks
+from federated_report import TOP_MATERIALS, FederatedReport
+from line_item_grid import LineItemGrid, save_line_items
+from memory_profile import MemoryProfiler
+from export_cache import ExportCache
+from cutlist import apply_plan, load_parts, load_stock, optimize
+from schema import init_schema
+from time_tracking import TimeTracker, TimeTrackingScheduler, compact_timer_events
+from undo import UndoConflict, UndoJournal
+from events import ALL_TABLES, EventBus
+from models import IdentityMap, ProfileCache, load_labor, load_materials, load_project, load_tool_usage
+
+DB_PATH = 'project_pricer.db'
+BACKUP_DIR = 'backups'
+ARCHIVE_DIR = 'archives'
+EXPORT_CACHE_DIR = 'export_cache'
+EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+PROJECTS_PAGE_SIZE = 100
+
+# Line item tables as named in undo step labels
+LINE_ITEM_NAMES = {'materials': "Material", 'labor': "Labor", 'tool_usage': "Tool Usage"}
+
+# ORDER BY expressions for the Current Project line item headings
+MATERIAL_SORT_COLUMNS = {
+    'Name': 'name COLLATE NOCASE',
+    'Quantity': 'quantity',
+    'Unit Cost': 'unit_cost_cents',
+    'Total': line_cost_sql('quantity', 'unit_cost_cents'),
+}
+LABOR_SORT_COLUMNS = {
+    'Description': 'l.description COLLATE NOCASE',
+    'Hours': 'l.hours',
+    'Rate': 'p.hourly_rate_cents',
+    'Total': line_cost_sql('l.hours', 'p.hourly_rate_cents'),
+}
+TOOL_USAGE_SORT_COLUMNS = {
+    'Tool': 't.name COLLATE NOCASE',
+    'Hours': 'tu.hours',
+    'Rate': 't.cost_per_hour_cents',
+    'Total': line_cost_sql('tu.hours', 't.cost_per_hour_cents'),
+}
 
 class ProjectPricerApp:
     def __init__(self, root):
@@ -16,88 +70,79 @@ class ProjectPricerApp:
         # Initialize database
         self.init_database()
         
+        # Periodic snapshots of the database
+        self.backup_scheduler = BackupScheduler(self.root, DB_PATH, BACKUP_DIR)
+        self.backup_scheduler.start()
+        
+        # Continuous replication to a secondary database file, when configured
+        self.replication_scheduler = None
+        self.start_replication()
+        
+        # ANALYZE and incremental vacuum while the app is idle
+        self.maintenance_scheduler = MaintenanceScheduler(self.root, DB_PATH)
+        self.maintenance_scheduler.start()
+        
+        # Workbooks of unchanged projects are copied instead of regenerated
+        self.export_cache = ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+        
+        # Allocation tracing, started from the Help menu
+        self.memory_profiler = None
+        
         # Current selections
         self.current_profile_id = None
         self.current_project_id = None
+        self.current_project = None
+        
+        # Rows loaded as model objects, one per row while they are in use
+        self.identity_map = IdentityMap()
+        # Profiles and tools change rarely; served from memory until edited
+        self.profile_cache = ProfileCache(self.identity_map)
+        
+        # Writes publish change events; views redraw once per burst while visible
+        self.events = EventBus(self.root)
+        self.events.subscribe(self.on_profiles_changed, tables=('profiles', 'tools'))
+        self.line_items = {'materials': [], 'labor': [], 'tool_usage': []}
+        # Project total as last saved; the label adds the grids' unsaved edits
+        self.saved_total_cents = 0
+        
+        # Labor timers; events are written in batches and compacted into labor rows
+        self.time_tracker = TimeTracker(self.conn)
+        self.time_tracking_scheduler = TimeTrackingScheduler(self.root, self.time_tracker, DB_PATH,
+                                                             on_compacted=self.on_timer_compacted)
+        self.timer_after_id = None
         
         # Create UI
         self.create_menu()
         self.create_main_layout()
+        self.time_tracking_scheduler.start()
+        
+        # Closing the window saves running timers like File > Exit
+        self.root.protocol("WM_DELETE_WINDOW", self.shutdown)
         
     def init_database(self):
         """Initialize SQLite database with required tables"""
-        self.conn = sqlite3.connect('project_pricer.db')
+        # URI filenames are needed to attach archives read-only; other copies
+        # of the application may share the file, so writes wait for its lock
+        self.conn = configure(sqlite3.connect(DB_PATH, uri=True))
         self.cursor = self.conn.cursor()
         
-        # User Profile table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS profiles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                hourly_rate REAL NOT NULL,
-                created_date TEXT
-            )
-        ''')
-        
-        # Tools/Machines table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tools (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                profile_id INTEGER,
-                name TEXT NOT NULL,
-                cost_per_hour REAL,
-                FOREIGN KEY (profile_id) REFERENCES profiles (id)
-            )
-        ''')
-        
-        # Projects table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS projects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                profile_id INTEGER,
-                name TEXT NOT NULL,
-                description TEXT,
-                created_date TEXT,
-                FOREIGN KEY (profile_id) REFERENCES profiles (id)
-            )
-        ''')
-        
-        # Materials table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS materials (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER,
-                name TEXT NOT NULL,
-                quantity REAL,
-                unit_cost REAL,
-                FOREIGN KEY (project_id) REFERENCES projects (id)
-            )
-        ''')
-        
-        # Labor entries table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS labor (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER,
-                description TEXT,
-                hours REAL,
-                FOREIGN KEY (project_id) REFERENCES projects (id)
-            )
-        ''')
-        
-        # Tool usage table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tool_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER,
-                tool_id INTEGER,
-                hours REAL,
-                FOREIGN KEY (project_id) REFERENCES projects (id),
-                FOREIGN KEY (tool_id) REFERENCES tools (id)
-            )
-        ''')
+        with write_transaction(self.conn):
+            init_schema(self.cursor)
         
-        self.conn.commit()
+        # Edits recorded for Edit > Undo and Redo
+        self.undo_journal = UndoJournal(self.conn)
+    
+    def get_setting(self, key, default=None):
+        """Read an application setting"""
+        self.cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+        result = self.cursor.fetchone()
+        return result[0] if result else default
+    
+    def set_setting(self, key, value):
+        """Store an application setting"""
+        with write_transaction(self.conn) as cursor:
+            cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
+        self.events.publish('settings', 'update')
     
     def create_menu(self):
         """Create application menu bar"""
@@ -110,17 +155,45 @@ class ProjectPricerApp:
         file_menu.add_command(label="New Profile", command=self.show_profile_dialog)
         file_menu.add_command(label="New Project", command=self.show_project_dialog)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Backup Now", command=self.backup_now)
+        file_menu.add_command(label="Restore Backup...", command=self.restore_backup)
+        file_menu.add_command(label="Set Replica File...", command=self.set_replica_file)
+        file_menu.add_command(label="Replicate Now", command=self.replicate_now)
+        file_menu.add_command(label="Stop Replicating", command=self.stop_replicating)
+        file_menu.add_separator()
+        file_menu.add_command(label="Archive Old Projects...", command=self.archive_old_projects)
+        file_menu.add_command(label="Import Supplier Prices...", command=self.import_supplier_prices)
+        file_menu.add_command(label="Import Excel Estimates...", command=self.import_excel_estimates)
+        file_menu.add_command(label="Combined Report...", command=self.show_combined_report)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.shutdown)
+        
+        # Edit menu; the entries name the step they would undo or redo
+        self.edit_menu = tk.Menu(menubar, tearoff=0, postcommand=self.update_edit_menu)
+        menubar.add_cascade(label="Edit", menu=self.edit_menu)
+        self.edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo_last)
+        self.edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=lambda: self.undo_last(redo=True))
+        self.root.bind('<Control-z>', lambda e: self.undo_last())
+        self.root.bind('<Control-y>', lambda e: self.undo_last(redo=True))
+        self.root.bind('<Control-s>', lambda e: self.save_line_item_edits())
         
         # Export menu
         export_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Export", menu=export_menu)
         export_menu.add_command(label="Export to Excel", command=self.export_to_excel)
+        export_menu.add_command(label="Export Listed Projects...", command=self.export_listed_projects)
+        export_menu.add_separator()
+        export_menu.add_command(label="Export Quote (HTML)...", command=self.export_quote)
+        export_menu.add_command(label="Export Listed Quotes...", command=self.export_listed_quotes)
         
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help_menu)
         help_menu.add_command(label="Check Environment", command=self.check_environment)
+        self.memory_profiling = tk.BooleanVar(value=False)
+        help_menu.add_checkbutton(label="Profile Memory", variable=self.memory_profiling,
+                                  command=self.toggle_memory_profiling)
+        help_menu.add_command(label="Memory Report...", command=self.show_memory_report)
         help_menu.add_command(label="About", command=self.show_about)
     
     def create_main_layout(self):
@@ -143,6 +216,93 @@ class ProjectPricerApp:
         self.current_project_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.current_project_frame, text='Current Project')
         self.create_current_project_tab()
+        
+        # Views hold back updates while hidden and catch up when their tab is shown
+        self.events.subscribe(lambda events: self.refresh_profiles(), tables=('profiles',),
+                              is_visible=lambda: self.tab_visible(self.profile_frame))
+        self.events.subscribe(lambda events: self.refresh_tools(), tables=('profiles', 'tools'),
+                              accepts=lambda e: e.profile_id in (None, self.current_profile_id),
+                              is_visible=lambda: self.tab_visible(self.profile_frame))
+        self.events.subscribe(lambda events: self.refresh_projects_list(),
+                              tables=('projects', 'materials', 'labor', 'tool_usage', 'profiles', 'tools'),
+                              is_visible=lambda: self.tab_visible(self.projects_frame))
+        self.events.subscribe(self.on_current_project_changed,
+                              tables=('projects', 'materials', 'labor', 'tool_usage', 'profiles', 'tools'),
+                              accepts=self.affects_current_project,
+                              is_visible=lambda: self.tab_visible(self.current_project_frame))
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+    
+    def update_edit_menu(self):
+        """Label Undo and Redo with their steps, or disable them"""
+        for index, (action, label) in enumerate((("Undo", self.undo_journal.undo_label()),
+                                                 ("Redo", self.undo_journal.redo_label()))):
+            self.edit_menu.entryconfig(index, label=f"{action} {label}" if label else action,
+                                       state='normal' if label else 'disabled')
+    
+    def undo_last(self, redo=False):
+        """Undo the last recorded step, or redo the last undone one"""
+        action = "Redo" if redo else "Undo"
+        # Edits still held in a grid become a step of their own first
+        if not self.save_line_item_edits():
+            return
+        try:
+            result = self.undo_journal.redo() if redo else self.undo_journal.undo()
+        except UndoConflict as e:
+            if messagebox.askyesno(f"Cannot {action}", f"{e}.\n\nClear the undo history?"):
+                self.undo_journal.clear()
+            return
+        except sqlite3.Error as e:
+            messagebox.showerror(f"{action} Error", f"Failed to {action.lower()}:\n{str(e)}")
+            return
+        if result is None:
+            return
+        
+        label, tables = result
+        for table in tables:
+            self.events.publish(table, 'update')
+    
+    def tab_visible(self, frame):
+        return self.notebook.select() == str(frame)
+    
+    def on_tab_changed(self, event):
+        # Views that held back updates while hidden catch up now
+        self.events.flush()
+        self.memory_checkpoint('switch tab')
+    
+    def on_profiles_changed(self, events):
+        """Drop cached profiles and tools touched by a write"""
+        for event in events:
+            if event.table == 'tools' and event.profile_id is not None:
+                self.profile_cache.invalidate(event.profile_id)
+            else:
+                self.profile_cache.invalidate()
+    
+    def affects_current_project(self, event):
+        """Whether a change event can alter the open project's view"""
+        if not self.current_project_id:
+            return False
+        if event.source is not None and event.source is self.line_item_grids.get(event.table):
+            # The grid already shows its own saved edits
+            return False
+        if event.table == 'projects':
+            return not event.row_ids or self.current_project_id in event.row_ids
+        if event.table in ('profiles', 'tools'):
+            return event.profile_id is None or (self.current_project is not None and
+                                                event.profile_id == self.current_project.profile_id)
+        return event.project_id in (None, self.current_project_id)
+    
+    def on_current_project_changed(self, events):
+        """Redraw the open project, or close it if it was deleted or archived"""
+        if not self.current_project_id:
+            return
+        if any(event.table in ('projects', ALL_TABLES) for event in events):
+            project = load_project(self.cursor, self.current_project_id, self.identity_map)
+            if project is None:
+                self.clear_current_project()
+                return
+            self.current_project = project
+            self.project_name_label.config(text=project.name)
+        self.refresh_current_project()
     
     def create_profile_tab(self):
         """Create profile management tab"""
@@ -192,21 +352,43 @@ class ProjectPricerApp:
     
     def create_projects_tab(self):
         """Create projects list tab"""
+        # Filters, applied in SQL
+        filter_frame = ttk.LabelFrame(self.projects_frame, text="Filter", padding=5)
+        filter_frame.pack(fill='x', padx=10, pady=(10, 0))
+        
+        self.project_filter_entries = {}
+        for key, label, width in (('name', "Name:", 20), ('date_from', "From (YYYY-MM-DD):", 11),
+                                  ('date_to', "To:", 11), ('min_total', "Min $:", 8),
+                                  ('max_total', "Max $:", 8)):
+            ttk.Label(filter_frame, text=label).pack(side='left', padx=(5, 2))
+            entry = ttk.Entry(filter_frame, width=width)
+            entry.pack(side='left')
+            entry.bind('<Return>', lambda e: self.apply_project_filters())
+            self.project_filter_entries[key] = entry
+        ttk.Button(filter_frame, text="Clear", command=self.clear_project_filters).pack(side='right', padx=2)
+        ttk.Button(filter_frame, text="Apply", command=self.apply_project_filters).pack(side='right', padx=2)
+        
         # Projects list
         list_frame = ttk.LabelFrame(self.projects_frame, text="All Projects", padding=10)
         list_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Treeview for projects
+        # Treeview for projects; headings sort the list
         columns = ('Name', 'Description', 'Date', 'Total Cost')
         self.projects_tree = ttk.Treeview(list_frame, columns=columns, show='tree headings', height=15)
         
-        self.projects_tree.heading('#0', text='ID')
+        self.projects_tree.heading('#0', text='ID', command=lambda: self.sort_projects('ID'))
         self.projects_tree.column('#0', width=50)
         
         for col in columns:
-            self.projects_tree.heading(col, text=col)
+            self.projects_tree.heading(col, text=col, command=lambda c=col: self.sort_projects(c))
             self.projects_tree.column(col, width=150)
         
+        self.project_filters = {}
+        self.project_sort = ('Date', True)
+        # Keyset of each page start; the last entry is the page shown
+        self.project_page_keys = [None]
+        self.project_next_key = None
+        
         # Scrollbar
         scrollbar = ttk.Scrollbar(list_frame, orient='vertical', command=self.projects_tree.yview)
         self.projects_tree.configure(yscrollcommand=scrollbar.set)
@@ -222,6 +404,21 @@ class ProjectPricerApp:
         ttk.Button(button_frame, text="Open Project", command=self.open_selected_project).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Project", command=self.delete_selected_project).pack(side='left', padx=5)
         
+        self.show_archived_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Show archived projects", variable=self.show_archived_var,
+                        command=self.toggle_archived).pack(side='right', padx=5)
+        self.projects_tree.tag_configure('archived', foreground='gray')
+        
+        # Paging
+        page_frame = ttk.Frame(self.projects_frame)
+        page_frame.pack(fill='x', padx=10, pady=(0, 5))
+        self.prev_page_button = ttk.Button(page_frame, text="< Previous", command=self.previous_projects_page)
+        self.prev_page_button.pack(side='left', padx=5)
+        self.next_page_button = ttk.Button(page_frame, text="Next >", command=self.next_projects_page)
+        self.next_page_button.pack(side='left', padx=5)
+        self.page_label = ttk.Label(page_frame, text="")
+        self.page_label.pack(side='left', padx=10)
+        
         self.refresh_projects_list()
     
     def create_current_project_tab(self):
@@ -242,7 +439,7 @@ class ProjectPricerApp:
         self.materials_tree = ttk.Treeview(materials_frame, columns=mat_columns, show='headings', height=6)
         
         for col in mat_columns:
-            self.materials_tree.heading(col, text=col)
+            self.materials_tree.heading(col, text=col, command=lambda c=col: self.sort_line_items('materials', c))
             self.materials_tree.column(col, width=120)
         
         self.materials_tree.pack(fill='both', expand=True)
@@ -251,6 +448,10 @@ class ProjectPricerApp:
         mat_buttons.pack(fill='x', pady=5)
         ttk.Button(mat_buttons, text="Add Material", command=self.add_material).pack(side='left', padx=2)
         ttk.Button(mat_buttons, text="Remove Material", command=self.remove_material).pack(side='left', padx=2)
+        ttk.Button(mat_buttons, text="Cut List...", command=self.show_cut_list_dialog).pack(side='left', padx=2)
+        ttk.Button(mat_buttons, text="Price History...", command=self.show_price_history).pack(side='left', padx=2)
+        mat_status = ttk.Label(mat_buttons)
+        mat_status.pack(side='right', padx=2)
         
         # Labor section
         labor_frame = ttk.LabelFrame(self.current_project_frame, text="Labor", padding=10)
@@ -260,7 +461,7 @@ class ProjectPricerApp:
         self.labor_tree = ttk.Treeview(labor_frame, columns=labor_columns, show='headings', height=4)
         
         for col in labor_columns:
-            self.labor_tree.heading(col, text=col)
+            self.labor_tree.heading(col, text=col, command=lambda c=col: self.sort_line_items('labor', c))
             self.labor_tree.column(col, width=120)
         
         self.labor_tree.pack(fill='both', expand=True)
@@ -269,6 +470,16 @@ class ProjectPricerApp:
         labor_buttons.pack(fill='x', pady=5)
         ttk.Button(labor_buttons, text="Add Labor", command=self.add_labor).pack(side='left', padx=2)
         ttk.Button(labor_buttons, text="Remove Labor", command=self.remove_labor).pack(side='left', padx=2)
+        # Timed work is added to a labor row per description and day
+        ttk.Label(labor_buttons, text="Timer:").pack(side='left', padx=(15, 2))
+        self.timer_description = ttk.Entry(labor_buttons, width=18)
+        self.timer_description.pack(side='left', padx=2)
+        self.timer_button = ttk.Button(labor_buttons, text="Start", command=self.toggle_timer, width=6)
+        self.timer_button.pack(side='left', padx=2)
+        self.timer_label = ttk.Label(labor_buttons)
+        self.timer_label.pack(side='left', padx=2)
+        labor_status = ttk.Label(labor_buttons)
+        labor_status.pack(side='right', padx=2)
         
         # Tool usage section
         tool_usage_frame = ttk.LabelFrame(self.current_project_frame, text="Tool & Machine Usage", padding=10)
@@ -278,15 +489,32 @@ class ProjectPricerApp:
         self.tool_usage_tree = ttk.Treeview(tool_usage_frame, columns=tool_columns, show='headings', height=4)
         
         for col in tool_columns:
-            self.tool_usage_tree.heading(col, text=col)
+            self.tool_usage_tree.heading(col, text=col, command=lambda c=col: self.sort_line_items('tool_usage', c))
             self.tool_usage_tree.column(col, width=120)
         
         self.tool_usage_tree.pack(fill='both', expand=True, pady=(0, 5))
         
+        # (column, descending) per line item tree; None keeps entry order
+        self.line_item_sort = {'materials': None, 'labor': None, 'tool_usage': None}
+        
         tool_buttons = ttk.Frame(tool_usage_frame)
         tool_buttons.pack(fill='x', pady=5)
         ttk.Button(tool_buttons, text="Add Tool Usage", command=self.add_tool_usage, width=15).pack(side='left', padx=5)
         ttk.Button(tool_buttons, text="Remove Tool Usage", command=self.remove_tool_usage, width=18).pack(side='left', padx=5)
+        tool_status = ttk.Label(tool_buttons)
+        tool_status.pack(side='right', padx=2)
+        
+        # Cells are edited in place; edits are saved together when focus leaves a grid
+        self.line_item_grids = {
+            table: LineItemGrid(tree, table, status, on_change=self.update_total_label,
+                                on_leave=lambda grid: self.save_line_item_edits())
+            for table, tree, status in (('materials', self.materials_tree, mat_status),
+                                        ('labor', self.labor_tree, labor_status),
+                                        ('tool_usage', self.tool_usage_tree, tool_status))
+        }
+        self.materials_tree.bind('<Delete>', lambda e: self.remove_material())
+        self.labor_tree.bind('<Delete>', lambda e: self.remove_labor())
+        self.tool_usage_tree.bind('<Delete>', lambda e: self.remove_tool_usage())
         
         # Total cost
         total_frame = ttk.Frame(self.current_project_frame)
@@ -295,6 +523,9 @@ class ProjectPricerApp:
         ttk.Label(total_frame, text="Total Project Cost:", font=('TkDefaultFont', 12, 'bold')).pack(side='left')
         self.total_cost_label = ttk.Label(total_frame, text="$0.00", font=('TkDefaultFont', 14, 'bold'), foreground='green')
         self.total_cost_label.pack(side='left', padx=10)
+        ttk.Button(total_frame, text="What-If Pricing...", command=self.show_what_if_dialog).pack(side='right')
+        ttk.Button(total_frame, text="Reprice at Date...", command=self.reprice_at_date).pack(side='right', padx=5)
+        ttk.Button(total_frame, text="Save Edits", command=self.save_line_item_edits).pack(side='right')
     
     def show_profile_dialog(self):
         """Show dialog to create new profile"""
@@ -321,15 +552,15 @@ class ProjectPricerApp:
                 return
             
             try:
-                rate = float(rate)
-                self.cursor.execute(
-                    'INSERT INTO profiles (name, hourly_rate, created_date) VALUES (?, ?, ?)',
-                    (name, rate, datetime.now().isoformat())
-                )
-                self.conn.commit()
+                rate = to_cents(rate)
+                with write_transaction(self.conn) as cursor, self.undo_journal.record("New Profile"):
+                    cursor.execute(
+                        'INSERT INTO profiles (name, hourly_rate_cents, created_date) VALUES (?, ?, ?)',
+                        (name, rate, datetime.now().isoformat())
+                    )
+                self.events.publish('profiles', 'insert', (cursor.lastrowid,))
                 messagebox.showinfo("Success", "Profile created successfully!")
                 dialog.destroy()
-                self.refresh_profiles()
             except ValueError:
                 messagebox.showerror("Error", "Hourly rate must be a number")
         
@@ -363,23 +594,22 @@ class ProjectPricerApp:
                 messagebox.showerror("Error", "Please enter a project name")
                 return
             
-            self.cursor.execute(
-                'INSERT INTO projects (profile_id, name, description, created_date) VALUES (?, ?, ?, ?)',
-                (self.current_profile_id, name, description, datetime.now().isoformat())
-            )
-            self.conn.commit()
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("New Project"):
+                cursor.execute(
+                    'INSERT INTO projects (profile_id, name, description, created_date) VALUES (?, ?, ?, ?)',
+                    (self.current_profile_id, name, description, datetime.now().isoformat())
+                )
+            self.events.publish('projects', 'insert', (cursor.lastrowid,), profile_id=self.current_profile_id)
             messagebox.showinfo("Success", "Project created successfully!")
             dialog.destroy()
-            self.refresh_projects_list()
         
         ttk.Button(dialog, text="Save", command=save_project).grid(row=2, column=0, columnspan=2, pady=20)
     
     def refresh_profiles(self):
         """Refresh profile dropdown"""
-        self.cursor.execute('SELECT id, name FROM profiles')
-        profiles = self.cursor.fetchall()
+        profiles = self.profile_cache.profiles(self.cursor)
         
-        profile_names = [f"{p[1]} (ID: {p[0]})" for p in profiles]
+        profile_names = [f"{p.name} (ID: {p.id})" for p in profiles]
         self.profile_combo['values'] = profile_names
         
         if profiles and not self.current_profile_id:
@@ -397,11 +627,10 @@ class ProjectPricerApp:
         self.current_profile_id = profile_id
         
         # Load profile details
-        self.cursor.execute('SELECT hourly_rate FROM profiles WHERE id = ?', (profile_id,))
-        result = self.cursor.fetchone()
+        profile = self.profile_cache.profile(self.cursor, profile_id)
         
-        if result:
-            self.hourly_rate_label.config(text=f"{result[0]:.2f}")
+        if profile:
+            self.hourly_rate_label.config(text=format_money(profile.hourly_rate_cents))
         
         # Load tools
         self.refresh_tools()
@@ -411,11 +640,9 @@ class ProjectPricerApp:
         self.tools_listbox.delete(0, tk.END)
         
         if self.current_profile_id:
-            self.cursor.execute('SELECT id, name, cost_per_hour FROM tools WHERE profile_id = ?', (self.current_profile_id,))
-            tools = self.cursor.fetchall()
-            
-            for tool in tools:
-                self.tools_listbox.insert(tk.END, f"{tool[1]} - ${tool[2]:.2f}/hr (ID: {tool[0]})")
+            for tool in self.profile_cache.tools(self.cursor, self.current_profile_id):
+                self.tools_listbox.insert(tk.END, f"{tool.name} - {format_money(tool.cost_per_hour_cents, '/hr')} "
+                                                  f"(ID: {tool.id})")
     
     def add_tool(self):
         """Add a tool to the current profile"""
@@ -446,15 +673,15 @@ class ProjectPricerApp:
                 return
             
             try:
-                cost = float(cost)
-                self.cursor.execute(
-                    'INSERT INTO tools (profile_id, name, cost_per_hour) VALUES (?, ?, ?)',
-                    (self.current_profile_id, name, cost)
-                )
-                self.conn.commit()
+                cost = to_cents(cost)
+                with write_transaction(self.conn) as cursor, self.undo_journal.record("Add Tool"):
+                    cursor.execute(
+                        'INSERT INTO tools (profile_id, name, cost_per_hour_cents) VALUES (?, ?, ?)',
+                        (self.current_profile_id, name, cost)
+                    )
+                self.events.publish('tools', 'insert', (cursor.lastrowid,), profile_id=self.current_profile_id)
                 messagebox.showinfo("Success", "Tool added successfully!")
                 dialog.destroy()
-                self.refresh_tools()
             except ValueError:
                 messagebox.showerror("Error", "Cost must be a number")
         
@@ -471,65 +698,398 @@ class ProjectPricerApp:
         tool_id = int(tool_text.split('ID: ')[1].rstrip(')'))
         
         if messagebox.askyesno("Confirm", "Are you sure you want to remove this tool?"):
-            self.cursor.execute('DELETE FROM tools WHERE id = ?', (tool_id,))
-            self.conn.commit()
-            self.refresh_tools()
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("Remove Tool"):
+                cursor.execute('DELETE FROM tools WHERE id = ?', (tool_id,))
+            self.events.publish('tools', 'delete', (tool_id,), profile_id=self.current_profile_id)
     
     def refresh_projects_list(self):
-        """Refresh projects treeview"""
+        """Refresh projects treeview with the current page, filters and sort"""
         # Clear existing items
         for item in self.projects_tree.get_children():
             self.projects_tree.delete(item)
         
-        # Load all projects
-        self.cursor.execute('''
-            SELECT id, name, description, created_date 
-            FROM projects 
-            ORDER BY created_date DESC
-        ''')
-        projects = self.cursor.fetchall()
-        
-        for project in projects:
-            # Calculate total cost
-            total_cost = self.calculate_project_cost(project[0])
+        # One page sorted and filtered in SQL, with totals from the project_totals rollup
+        sort, descending = self.project_sort
+        projects = page_projects(self.cursor, self.project_filters, sort, descending,
+                                 PROJECTS_PAGE_SIZE + 1, self.project_page_keys[-1])
+        if not projects and len(self.project_page_keys) > 1:
+            # The page emptied, e.g. after deleting its last project
+            self.project_page_keys.pop()
+            return self.refresh_projects_list()
+        
+        has_next = len(projects) > PROJECTS_PAGE_SIZE
+        projects = projects[:PROJECTS_PAGE_SIZE]
+        self.project_next_key = (projects[-1][5], projects[-1][0]) if has_next else None
+        
+        for project_id, name, description, created_date, total_cents, _ in projects:
+            self.projects_tree.insert('', 'end', text=str(project_id),
+                                    values=(name, (description or '')[:50], (created_date or '')[:10],
+                                            format_money(total_cents)))
+        
+        # Archived projects are listed read-only after the last page, with totals computed in the archive
+        if self.show_archived_var.get() and not has_next:
+            schemas = attach_archives(self.conn, ARCHIVE_DIR)
+            for schema, project_id, name, description, created_date, total_cents in \
+                    list_archived_projects(self.cursor, schemas, filters=self.project_filters,
+                                           sort=sort, descending=descending):
+                self.projects_tree.insert('', 'end', iid=f"{schema}:{project_id}", text=str(project_id),
+                                        values=(name, (description or '')[:50], created_date[:10],
+                                                format_money(total_cents)),
+                                        tags=('archived',))
+        
+        count = count_projects(self.cursor, self.project_filters)
+        pages = max(1, -(-count // PROJECTS_PAGE_SIZE))
+        self.page_label.config(text=f"Page {len(self.project_page_keys)} of {pages} ({count} projects)")
+        self.prev_page_button.config(state='normal' if len(self.project_page_keys) > 1 else 'disabled')
+        self.next_page_button.config(state='normal' if has_next else 'disabled')
+        
+        # Mark the sorted column
+        headings = {'ID': '#0', 'Name': 'Name', 'Description': 'Description', 'Date': 'Date',
+                    'Total Cost': 'Total Cost'}
+        for key, column in headings.items():
+            arrow = (' \u25bc' if descending else ' \u25b2') if key == sort else ''
+            self.projects_tree.heading(column, text=key + arrow)
+        self.memory_checkpoint('refresh project list')
+    
+    def sort_projects(self, column):
+        """Sort the projects list by a column, toggling direction on a second click"""
+        sort, descending = self.project_sort
+        self.project_sort = (column, not descending if column == sort else column in ('Date', 'Total Cost'))
+        self.project_page_keys = [None]
+        self.refresh_projects_list()
+    
+    def next_projects_page(self):
+        if self.project_next_key is not None:
+            self.project_page_keys.append(self.project_next_key)
+            self.refresh_projects_list()
+    
+    def previous_projects_page(self):
+        if len(self.project_page_keys) > 1:
+            self.project_page_keys.pop()
+            self.refresh_projects_list()
+    
+    def apply_project_filters(self):
+        """Read the filter fields and reload the projects list from the first page"""
+        values = {key: entry.get().strip() for key, entry in self.project_filter_entries.items()}
+        filters = {}
+        try:
+            if values['name']:
+                filters['name'] = values['name']
+            for key in ('date_from', 'date_to'):
+                if values[key]:
+                    filters[key] = datetime.strptime(values[key], '%Y-%m-%d').date().isoformat()
+            for key in ('min_total', 'max_total'):
+                if values[key]:
+                    filters[key] = to_cents(values[key])
+        except ValueError:
+            messagebox.showerror("Error", "Dates must be YYYY-MM-DD and costs must be numbers")
+            return
+        
+        self.project_filters = filters
+        self.project_page_keys = [None]
+        self.refresh_projects_list()
+    
+    def clear_project_filters(self):
+        for entry in self.project_filter_entries.values():
+            entry.delete(0, 'end')
+        self.project_filters = {}
+        self.project_page_keys = [None]
+        self.refresh_projects_list()
+    
+    def toggle_archived(self):
+        """Attach or detach archive databases for the projects list"""
+        if not self.show_archived_var.get():
+            detach_archives(self.conn)
+        self.refresh_projects_list()
+    
+    def is_archived_selection(self, item):
+        """Archived projects are read-only"""
+        if 'archived' in self.projects_tree.item(item, 'tags'):
+            messagebox.showerror("Error", "Archived projects are read-only")
+            return True
+        return False
+    
+    def archive_old_projects(self):
+        """Move old projects into per-year archive databases"""
+        default_cutoff = f"{datetime.now().year - 1}-01-01"
+        cutoff = simpledialog.askstring("Archive Old Projects",
+                                        "Archive projects created before (YYYY-MM-DD):",
+                                        initialvalue=default_cutoff, parent=self.root)
+        if not cutoff:
+            return
+        
+        try:
+            datetime.strptime(cutoff.strip(), '%Y-%m-%d')
+        except ValueError:
+            messagebox.showerror("Error", "Date must be in YYYY-MM-DD format")
+            return
+        cutoff = cutoff.strip()
+        
+        self.cursor.execute('SELECT COUNT(*) FROM projects WHERE created_date < ?', (cutoff,))
+        count = self.cursor.fetchone()[0]
+        if not count:
+            messagebox.showinfo("Archive", "No projects were created before that date")
+            return
+        
+        if not messagebox.askyesno("Confirm", f"Move {count} projects created before {cutoff} to the archive?"):
+            return
+        
+        try:
+            self.conn.commit()
+            # Tracked time becomes labor rows before its project moves
+            self.time_tracker.flush()
+            self.on_timer_compacted(compact_timer_events(self.conn), None)
+            detach_archives(self.conn)
+            counts = archive_projects(self.conn, cutoff, ARCHIVE_DIR)
+        except (sqlite3.Error, OSError) as e:
+            messagebox.showerror("Archive Error", f"Failed to archive projects:\n{str(e)}")
+            return
+        
+        # The open project is closed by its view if it was archived
+        self.events.publish('projects', 'delete')
+        summary = '\n'.join(f"{year}: {n} projects" for year, n in counts.items())
+        messagebox.showinfo("Success", f"Projects archived:\n{summary}")
+    
+    def import_supplier_prices(self):
+        """Reprice materials in every project from a supplier CSV"""
+        filename = filedialog.askopenfilename(
+            title="Supplier Price List",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        try:
+            result = update_from_price_list(self.conn, filename, apply=False)
+        except (OSError, ValueError, UnicodeDecodeError, sqlite3.Error) as e:
+            messagebox.showerror("Import Error", f"Could not read the price list:\n{str(e)}")
+            return
+        
+        if not result['report']:
+            messagebox.showinfo("Supplier Prices",
+                                f"{result['loaded']} price list rows, {result['matched']} materials matched.\n\n"
+                                f"No material costs would change.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Supplier Price Update")
+        dialog.geometry("640x440")
+        dialog.transient(self.root)
+        
+        columns = ('Project', 'Materials', 'Old Cost', 'New Cost', 'Change')
+        tree = ttk.Treeview(dialog, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=110)
+        tree.column('Project', width=200)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        for project_id, name, changed, old_total, new_total in result['report']:
+            tree.insert('', 'end', text=str(project_id), values=(
+                name, changed, format_money(old_total), format_money(new_total),
+                format_money(new_total - old_total, signed=True)
+            ))
+        
+        summary = (f"{result['loaded']} price list rows, {result['matched']} materials matched, "
+                   f"{len(result['unmatched'])} rows matched no material.\n"
+                   f"{len(result['report'])} project(s) would change.")
+        ttk.Label(dialog, text=summary, justify='left').pack(fill='x', padx=10)
+        
+        def apply_prices():
+            try:
+                applied = update_from_price_list(self.conn, filename, apply=True, undo=self.undo_journal)
+            except (OSError, ValueError, UnicodeDecodeError, sqlite3.Error) as e:
+                messagebox.showerror("Import Error", f"Failed to update prices:\n{str(e)}", parent=dialog)
+                return
+            dialog.destroy()
+            self.events.publish('materials', 'update')
+            messagebox.showinfo("Success", f"Updated {applied['updated']} material cost(s)")
+        
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill='x', padx=10, pady=10)
+        ttk.Button(buttons, text="Apply New Prices", command=apply_prices).pack(side='left', padx=2)
+        ttk.Button(buttons, text="Cancel", command=dialog.destroy).pack(side='right', padx=2)
+    
+    def import_excel_estimates(self):
+        """Import every estimate workbook in a folder as new projects"""
+        folder = filedialog.askdirectory(title="Folder of Excel Estimates")
+        if not folder:
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Import Excel Estimates")
+        dialog.geometry("560x360")
+        dialog.transient(self.root)
+        
+        status_var = tk.StringVar(value="Reading workbooks...")
+        ttk.Label(dialog, textvariable=status_var).pack(fill='x', padx=10, pady=(10, 0))
+        result_text = tk.Text(dialog, height=14, wrap='word')
+        result_text.pack(fill='both', expand=True, padx=10, pady=10)
+        close_button = ttk.Button(dialog, text="Close", command=dialog.destroy, state='disabled')
+        close_button.pack(side='right', padx=10, pady=(0, 10))
+        
+        import_state = {'done': 0, 'total': 0, 'result': None, 'error': None}
+        
+        def progress(done, total):
+            import_state['done'] = done
+            import_state['total'] = total
+        
+        def work():
+            # Workbooks are parsed in worker processes; this thread writes them
+            conn = configure(sqlite3.connect(DB_PATH))
+            try:
+                import_state['result'] = import_workbooks(conn, [folder], progress=progress)
+            except (ImportError, OSError, sqlite3.Error) as e:
+                import_state['error'] = e
+            finally:
+                conn.close()
+        
+        def show_result():
+            if thread.is_alive():
+                if import_state['total']:
+                    status_var.set(f"Imported {import_state['done']} of {import_state['total']} workbooks...")
+                dialog.after(200, show_result)
+                return
+            close_button.config(state='normal')
+            if import_state['error'] is not None:
+                status_var.set("Import failed")
+                result_text.insert('end', str(import_state['error']))
+                return
             
-            self.projects_tree.insert('', 'end', text=str(project[0]),
-                                    values=(project[1], project[2][:50], project[3][:10], f"${total_cost:.2f}"))
+            result = import_state['result']
+            status_var.set(f"{len(result['imported'])} of {result['files']} workbooks imported, "
+                           f"{len(result['failures'])} failed")
+            for path, message in result['failures']:
+                result_text.insert('end', f"{os.path.basename(path)}: {message}\n")
+            if result['imported']:
+                # Profiles and tools missing from this database were created
+                self.events.publish('profiles', 'insert')
+                self.events.publish('projects', 'insert', [project_id for _, project_id in result['imported']])
+        
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        dialog.after(200, show_result)
+    
+    def show_combined_report(self):
+        """Report on this and other Project Pricer databases together"""
+        paths = json.loads(self.get_setting('report_databases', 'null')) or [os.path.abspath(DB_PATH)]
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Combined Report")
+        dialog.geometry("860x620")
+        dialog.transient(self.root)
+        
+        files_frame = ttk.LabelFrame(dialog, text="Databases", padding="5")
+        files_frame.pack(fill='x', padx=10, pady=(10, 0))
+        files_list = tk.Listbox(files_frame, height=5, selectmode='extended')
+        files_list.pack(side='left', fill='x', expand=True)
+        for path in paths:
+            files_list.insert('end', path)
+        
+        def save_paths():
+            self.set_setting('report_databases', json.dumps(list(files_list.get(0, 'end'))))
+        
+        def add_files():
+            filenames = filedialog.askopenfilenames(parent=dialog, title="Add Databases",
+                                                    filetypes=[("Database files", "*.db"), ("All files", "*.*")])
+            listed = set(files_list.get(0, 'end'))
+            for filename in filenames:
+                filename = os.path.abspath(filename)
+                if filename not in listed:
+                    files_list.insert('end', filename)
+            save_paths()
+        
+        def remove_files():
+            for index in reversed(files_list.curselection()):
+                files_list.delete(index)
+            save_paths()
+        
+        files_buttons = ttk.Frame(files_frame)
+        files_buttons.pack(side='right', fill='y', padx=(5, 0))
+        ttk.Button(files_buttons, text="Add...", command=add_files).pack(fill='x', pady=2)
+        ttk.Button(files_buttons, text="Remove", command=remove_files).pack(fill='x', pady=2)
+        
+        options_frame = ttk.Frame(dialog)
+        options_frame.pack(fill='x', padx=10, pady=5)
+        ttk.Label(options_frame, text="Totals by:").pack(side='left')
+        period_var = tk.StringVar(value='month')
+        ttk.Combobox(options_frame, textvariable=period_var, values=['day', 'month', 'year'], state='readonly',
+                     width=8).pack(side='left', padx=5)
+        status_var = tk.StringVar()
+        ttk.Label(options_frame, textvariable=status_var).pack(side='left', padx=10)
+        
+        frame = ttk.Frame(dialog)
+        frame.pack(fill='both', expand=True, padx=10, pady=5)
+        scrollbar = ttk.Scrollbar(frame)
+        scrollbar.pack(side='right', fill='y')
+        text_widget = tk.Text(frame, wrap='none', yscrollcommand=scrollbar.set, font=('Courier', 10),
+                              state='disabled')
+        text_widget.pack(side='left', fill='both', expand=True)
+        scrollbar.config(command=text_widget.yview)
+        
+        report_state = {'done': 0, 'total': 0, 'result': None, 'lines': None, 'error': None}
+        
+        def progress(done, total):
+            report_state['done'] = done
+            report_state['total'] = total
+        
+        def work(selected, period):
+            # The cache connection belongs to this thread; unchanged files are not attached
+            report = None
+            try:
+                report = FederatedReport()
+                report_state['result'] = report.refresh(selected, progress=progress)
+                report_state['lines'] = report.report(period, TOP_MATERIALS)
+            except sqlite3.Error as e:
+                report_state['error'] = e
+            finally:
+                if report is not None:
+                    report.close()
+        
+        def show_result(thread):
+            if thread.is_alive():
+                if report_state['total']:
+                    status_var.set(f"Scanned {report_state['done']} of {report_state['total']} databases...")
+                dialog.after(200, show_result, thread)
+                return
+            run_button.config(state='normal')
+            text_widget.config(state='normal')
+            text_widget.delete('1.0', 'end')
+            if report_state['error'] is not None:
+                status_var.set("Report failed")
+                text_widget.insert('1.0', str(report_state['error']))
+            else:
+                result = report_state['result']
+                status_var.set(f"{len(result['scanned'])} scanned, {len(result['cached'])} unchanged, "
+                               f"{len(result['failures'])} failed")
+                for path, message in result['failures']:
+                    text_widget.insert('end', f"FAILED  {path}: {message}\n")
+                if result['failures']:
+                    text_widget.insert('end', '\n')
+                text_widget.insert('end', '\n'.join(report_state['lines']))
+            text_widget.config(state='disabled')
+        
+        def run_report():
+            selected = list(files_list.get(0, 'end'))
+            if not selected:
+                messagebox.showwarning("Warning", "Add at least one database file", parent=dialog)
+                return
+            report_state.update(done=0, total=0, result=None, lines=None, error=None)
+            run_button.config(state='disabled')
+            status_var.set("Reading databases...")
+            thread = threading.Thread(target=work, args=(selected, period_var.get()), daemon=True)
+            thread.start()
+            dialog.after(200, show_result, thread)
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill='x', padx=10, pady=(0, 10))
+        run_button = ttk.Button(button_frame, text="Run Report", command=run_report)
+        run_button.pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side='right', padx=5)
     
     def calculate_project_cost(self, project_id):
-        """Calculate total cost for a project"""
-        total = 0.0
-        
-        # Materials cost
-        self.cursor.execute('SELECT quantity, unit_cost FROM materials WHERE project_id = ?', (project_id,))
-        materials = self.cursor.fetchall()
-        for mat in materials:
-            total += (mat[0] or 0) * (mat[1] or 0)
-        
-        # Labor cost
-        self.cursor.execute('''
-            SELECT l.hours, p.hourly_rate 
-            FROM labor l
-            JOIN projects pr ON l.project_id = pr.id
-            JOIN profiles p ON pr.profile_id = p.id
-            WHERE l.project_id = ?
-        ''', (project_id,))
-        labor = self.cursor.fetchall()
-        for lab in labor:
-            total += (lab[0] or 0) * (lab[1] or 0)
-        
-        # Tool usage cost
-        self.cursor.execute('''
-            SELECT tu.hours, t.cost_per_hour
-            FROM tool_usage tu
-            JOIN tools t ON tu.tool_id = t.id
-            WHERE tu.project_id = ?
-        ''', (project_id,))
-        tools = self.cursor.fetchall()
-        for tool in tools:
-            total += (tool[0] or 0) * (tool[1] or 0)
-        
-        return total
+        """Calculate total cost for a project in cents"""
+        return calculate_project_cost(self.cursor, project_id)
     
     def open_selected_project(self):
         """Open selected project for editing"""
@@ -537,16 +1097,18 @@ class ProjectPricerApp:
         if not selection:
             messagebox.showerror("Error", "Please select a project to open")
             return
+        if self.is_archived_selection(selection[0]):
+            return
         
         project_id = int(self.projects_tree.item(selection[0], 'text'))
         self.current_project_id = project_id
         
         # Load project details
-        self.cursor.execute('SELECT name, description FROM projects WHERE id = ?', (project_id,))
-        project = self.cursor.fetchone()
+        project = load_project(self.cursor, project_id, self.identity_map)
+        self.current_project = project
         
         if project:
-            self.project_name_label.config(text=project[0])
+            self.project_name_label.config(text=project.name)
             self.refresh_current_project()
             self.notebook.select(self.current_project_frame)
     
@@ -556,72 +1118,181 @@ class ProjectPricerApp:
         if not selection:
             messagebox.showerror("Error", "Please select a project to delete")
             return
+        if self.is_archived_selection(selection[0]):
+            return
         
         if messagebox.askyesno("Confirm", "Are you sure you want to delete this project?"):
             project_id = int(self.projects_tree.item(selection[0], 'text'))
             
             # Delete related records
-            self.cursor.execute('DELETE FROM materials WHERE project_id = ?', (project_id,))
-            self.cursor.execute('DELETE FROM labor WHERE project_id = ?', (project_id,))
-            self.cursor.execute('DELETE FROM tool_usage WHERE project_id = ?', (project_id,))
-            self.cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
-            self.conn.commit()
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("Delete Project"):
+                cursor.execute('DELETE FROM materials WHERE project_id = ?', (project_id,))
+                cursor.execute('DELETE FROM labor WHERE project_id = ?', (project_id,))
+                cursor.execute('DELETE FROM tool_usage WHERE project_id = ?', (project_id,))
+                cursor.execute('DELETE FROM cut_parts WHERE project_id = ?', (project_id,))
+                cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
             
-            self.refresh_projects_list()
+            self.time_tracker.stop(project_id)
+            self.events.publish('projects', 'delete', (project_id,))
             messagebox.showinfo("Success", "Project deleted successfully")
     
+    def toggle_timer(self):
+        """Start or stop the current project's labor timer"""
+        project_id = self.current_project_id
+        if not project_id:
+            messagebox.showerror("Error", "No project selected")
+            return
+        if self.time_tracker.is_running(project_id):
+            self.time_tracker.stop(project_id)
+            # The stopped time appears as labor once compacted
+            self.time_tracking_scheduler.compact_now()
+        else:
+            self.time_tracker.start(project_id, self.timer_description.get().strip() or None)
+        self.update_timer_display()
+    
+    def update_timer_display(self):
+        """Show whether the current project's timer runs, updating its elapsed time every second"""
+        if self.timer_after_id:
+            self.root.after_cancel(self.timer_after_id)
+            self.timer_after_id = None
+        running = self.current_project_id is not None and self.time_tracker.is_running(self.current_project_id)
+        self.timer_button.config(text="Stop" if running else "Start")
+        self.timer_description.config(state='disabled' if running else 'normal')
+        if running:
+            seconds = int(self.time_tracker.elapsed_seconds(self.current_project_id))
+            self.timer_label.config(text=f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}")
+            self.timer_after_id = self.root.after(1000, self.update_timer_display)
+        else:
+            self.timer_label.config(text="")
+    
+    def on_timer_compacted(self, result, error):
+        """Show labor rows that timer compaction wrote"""
+        if error is not None or not result:
+            return
+        labor_ids = {}
+        for project_id, labor_id in result['labor']:
+            labor_ids.setdefault(project_id, []).append(labor_id)
+        for project_id, ids in labor_ids.items():
+            self.events.publish('labor', 'update', ids, project_id)
+    
+    def clear_current_project(self):
+        """Close the current project and empty its views"""
+        self.current_project_id = None
+        self.current_project = None
+        self.project_name_label.config(text="No project selected")
+        for grid in self.line_item_grids.values():
+            grid.clear()
+        self.saved_total_cents = 0
+        self.total_cost_label.config(text="$0.00")
+        self.update_timer_display()
+    
     def refresh_current_project(self):
         """Refresh current project view"""
         if not self.current_project_id:
             return
+        self.update_timer_display()
+        
+        # Edits held in the grids are saved to the project they were made in before reloading
+        self.save_line_item_edits()
+        
+        # Load line items; the lists keep their objects alive in the identity map
+        project_id = self.current_project_id
+        self.line_items = {
+            'materials': load_materials(self.cursor, project_id,
+                                        self.line_item_order('materials', MATERIAL_SORT_COLUMNS, 'id'),
+                                        self.identity_map),
+            'labor': load_labor(self.cursor, project_id,
+                                self.line_item_order('labor', LABOR_SORT_COLUMNS, 'l.id'),
+                                self.identity_map),
+            'tool_usage': load_tool_usage(self.cursor, project_id,
+                                          self.line_item_order('tool_usage', TOOL_USAGE_SORT_COLUMNS, 'tu.id'),
+                                          self.identity_map),
+        }
+        
+        profile_id = self.current_project.profile_id
+        profile = self.profile_cache.profile(self.cursor, profile_id)
+        grids = self.line_item_grids
+        grids['materials'].load(project_id, self.line_items['materials'])
+        grids['labor'].load(project_id, self.line_items['labor'],
+                            hourly_rate_cents=profile.hourly_rate_cents if profile else None)
+        grids['tool_usage'].load(project_id, self.line_items['tool_usage'],
+                                 tools=self.profile_cache.tools(self.cursor, profile_id))
+        
+        # Update total, summed exactly in SQL
+        self.saved_total_cents = self.calculate_project_cost(self.current_project_id)
+        self.update_total_label()
+        self.memory_checkpoint('refresh project')
+    
+    def update_total_label(self):
+        """Show the saved project total plus the cost change of edits still held in the grids"""
+        pending_cents = sum(grid.pending_cents for grid in self.line_item_grids.values())
+        self.total_cost_label.config(text=format_money(self.saved_total_cents + pending_cents) +
+                                     (" (unsaved)" if pending_cents else ""))
+    
+    def save_line_item_edits(self):
+        """
+        Save the edits held in the line item grids as one transaction and one undo step
         
-        # Clear all trees
-        for item in self.materials_tree.get_children():
-            self.materials_tree.delete(item)
-        for item in self.labor_tree.get_children():
-            self.labor_tree.delete(item)
-        for item in self.tool_usage_tree.get_children():
-            self.tool_usage_tree.delete(item)
-        
-        # Load materials
-        self.cursor.execute('SELECT id, name, quantity, unit_cost FROM materials WHERE project_id = ?',
-                          (self.current_project_id,))
-        materials = self.cursor.fetchall()
-        for mat in materials:
-            total = (mat[2] or 0) * (mat[3] or 0)
-            self.materials_tree.insert('', 'end', text=str(mat[0]),
-                                      values=(mat[1], mat[2], f"${mat[3]:.2f}", f"${total:.2f}"))
-        
-        # Load labor
-        self.cursor.execute('''
-            SELECT l.id, l.description, l.hours, p.hourly_rate
-            FROM labor l
-            JOIN projects pr ON l.project_id = pr.id
-            JOIN profiles p ON pr.profile_id = p.id
-            WHERE l.project_id = ?
-        ''', (self.current_project_id,))
-        labor = self.cursor.fetchall()
-        for lab in labor:
-            total = (lab[2] or 0) * (lab[3] or 0)
-            self.labor_tree.insert('', 'end', text=str(lab[0]),
-                                  values=(lab[1], lab[2], f"${lab[3]:.2f}/hr", f"${total:.2f}"))
-        
-        # Load tool usage
-        self.cursor.execute('''
-            SELECT tu.id, t.name, tu.hours, t.cost_per_hour
-            FROM tool_usage tu
-            JOIN tools t ON tu.tool_id = t.id
-            WHERE tu.project_id = ?
-        ''', (self.current_project_id,))
-        tools = self.cursor.fetchall()
-        for tool in tools:
-            total = (tool[2] or 0) * (tool[3] or 0)
-            self.tool_usage_tree.insert('', 'end', text=str(tool[0]),
-                                       values=(tool[1], tool[2], f"${tool[3]:.2f}/hr", f"${total:.2f}"))
-        
-        # Update total
-        total_cost = self.calculate_project_cost(self.current_project_id)
-        self.total_cost_label.config(text=f"${total_cost:.2f}")
+        Returns:
+            False if they could not be saved
+        """
+        pending = [(grid, grid.pending()) for grid in self.line_item_grids.values()]
+        pending = [(grid, rows) for grid, rows in pending if rows]
+        if not pending:
+            return True
+        
+        names = [LINE_ITEM_NAMES[grid.table] for grid, rows in pending]
+        label = f"Edit {names[0]}" if len(names) == 1 else "Edit Line Items"
+        try:
+            with write_transaction(self.conn) as cursor, self.undo_journal.record(label):
+                saved = [save_line_items(cursor, grid.table, grid.project_id, rows) for grid, rows in pending]
+        except ConflictError as e:
+            for grid in self.line_item_grids.values():
+                grid.clear()
+            self.events.publish(e.table, 'update', project_id=self.current_project_id)
+            messagebox.showwarning("Changed Elsewhere",
+                                   "A line you edited was changed or removed in another window or on "
+                                   "another computer, so your edits were not saved.\n\n"
+                                   "The project has been reloaded.")
+            return False
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Failed to save edits:\n{str(e)}")
+            return False
+        
+        for (grid, rows), versions in zip(pending, saved):
+            inserted = [row_id for row, (row_id, version) in zip(rows, versions) if row.id is None]
+            updated = [row.id for row in rows if row.id is not None]
+            grid.mark_saved(rows, versions)
+            if inserted:
+                self.events.publish(grid.table, 'insert', inserted, grid.project_id, source=grid)
+            if updated:
+                self.events.publish(grid.table, 'update', updated, grid.project_id, source=grid)
+        if self.current_project_id:
+            self.saved_total_cents = self.calculate_project_cost(self.current_project_id)
+            self.update_total_label()
+        return True
+    
+    def line_item_order(self, table, columns, id_column):
+        """Build the ORDER BY clause for a line item tree from its whitelisted sort columns"""
+        sort = self.line_item_sort[table]
+        if sort is None:
+            return f'ORDER BY {id_column}'
+        column, descending = sort
+        direction = 'DESC' if descending else 'ASC'
+        return f'ORDER BY {columns[column]} {direction}, {id_column} {direction}'
+    
+    def sort_line_items(self, table, column):
+        """Sort a line item tree by a heading, toggling direction on a second click"""
+        current = self.line_item_sort[table]
+        descending = not current[1] if current and current[0] == column else False
+        self.line_item_sort[table] = (column, descending)
+        
+        tree = {'materials': self.materials_tree, 'labor': self.labor_tree,
+                'tool_usage': self.tool_usage_tree}[table]
+        for col in tree['columns']:
+            arrow = (' \u25bc' if descending else ' \u25b2') if col == column else ''
+            tree.heading(col, text=col + arrow)
+        self.refresh_current_project()
     
     def add_material(self):
         """Add material to current project"""
@@ -631,7 +1302,7 @@ class ProjectPricerApp:
         
         dialog = tk.Toplevel(self.root)
         dialog.title("Add Material")
-        dialog.geometry("400x250")
+        dialog.geometry("420x290")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -647,10 +1318,15 @@ class ProjectPricerApp:
         cost_entry = ttk.Entry(dialog, width=30)
         cost_entry.grid(row=2, column=1, padx=10, pady=10)
         
+        ttk.Label(dialog, text="Catalog ID (optional):").grid(row=3, column=0, padx=10, pady=10, sticky='w')
+        catalog_entry = ttk.Entry(dialog, width=30)
+        catalog_entry.grid(row=3, column=1, padx=10, pady=10)
+        
         def save_material():
             name = name_entry.get().strip()
             qty = qty_entry.get().strip()
             cost = cost_entry.get().strip()
+            catalog_id = catalog_entry.get().strip() or None
             
             if not name or not qty or not cost:
                 messagebox.showerror("Error", "Please fill in all fields")
@@ -658,19 +1334,22 @@ class ProjectPricerApp:
             
             try:
                 qty = float(qty)
-                cost = float(cost)
-                self.cursor.execute(
-                    'INSERT INTO materials (project_id, name, quantity, unit_cost) VALUES (?, ?, ?, ?)',
-                    (self.current_project_id, name, qty, cost)
-                )
-                self.conn.commit()
+                cost = to_cents(cost)
+                with write_transaction(self.conn) as cursor, self.undo_journal.record("Add Material"):
+                    cursor.execute(
+                        'INSERT INTO materials (project_id, name, quantity, unit_cost_cents, catalog_id) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (self.current_project_id, name, qty, cost, catalog_id)
+                    )
+                    material_id = cursor.lastrowid
+                    record_price(cursor, name, cost)
+                self.events.publish('materials', 'insert', (material_id,), self.current_project_id)
                 messagebox.showinfo("Success", "Material added successfully!")
                 dialog.destroy()
-                self.refresh_current_project()
             except ValueError:
                 messagebox.showerror("Error", "Quantity and cost must be numbers")
         
-        ttk.Button(dialog, text="Save", command=save_material).grid(row=3, column=0, columnspan=2, pady=20)
+        ttk.Button(dialog, text="Save", command=save_material).grid(row=4, column=0, columnspan=2, pady=20)
     
     def remove_material(self):
         """Remove selected material"""
@@ -679,10 +1358,311 @@ class ProjectPricerApp:
             messagebox.showerror("Error", "Please select a material to remove")
             return
         
-        material_id = int(self.materials_tree.item(selection[0], 'text'))
-        self.cursor.execute('DELETE FROM materials WHERE id = ?', (material_id,))
-        self.conn.commit()
-        self.refresh_current_project()
+        self.delete_line_item('materials', selection[0])
+    
+    def delete_line_item(self, table, iid):
+        """
+        Delete a line item of the open project unless another session changed it since it was loaded
+        
+        Args:
+            table: 'materials', 'labor' or 'tool_usage'
+            iid: The line's item in its grid
+        """
+        grid = self.line_item_grids[table]
+        item_id = grid.row_id(iid)
+        if item_id is None:
+            # Never saved; there is nothing to delete but the grid line
+            if iid in grid.rows:
+                grid.remove_row(iid)
+            return
+        version = grid.row_version(item_id)
+        if version is None:
+            version = row_version(self.cursor, table, item_id)
+        label = f"Remove {LINE_ITEM_NAMES[table]}"
+        try:
+            with write_transaction(self.conn) as cursor, self.undo_journal.record(label):
+                if table == 'materials':
+                    cursor.execute('DELETE FROM cut_parts WHERE material_id = ?', (item_id,))
+                delete_versioned(cursor, table, item_id, version)
+        except ConflictError:
+            # Reload so the user sees what the other session left
+            self.events.publish(table, 'update', project_id=self.current_project_id)
+            messagebox.showwarning("Changed Elsewhere",
+                                   "This entry was changed or removed in another window or on another "
+                                   "computer, so it was not deleted.\n\nThe project has been reloaded.")
+            return
+        grid.remove_row(iid)
+        self.events.publish(table, 'delete', (item_id,), self.current_project_id)
+    
+    def show_cut_list_dialog(self):
+        """Declare the parts cut from the selected material and work out the stock needed"""
+        selection = self.materials_tree.selection()
+        material_id = self.line_item_grids['materials'].row_id(selection[0]) if selection else None
+        if material_id is None:
+            messagebox.showerror("Error", "Please select the stock material to cut parts from")
+            return
+        
+        material_name = self.materials_tree.item(selection[0], 'values')[0]
+        stock_length, stock_width, kerf = load_stock(self.cursor, material_id)
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Cut List - {material_name}")
+        dialog.geometry("700x620")
+        dialog.transient(self.root)
+        
+        stock_frame = ttk.LabelFrame(dialog, text="Stock (leave width empty for boards)", padding=10)
+        stock_frame.pack(fill='x', padx=10, pady=10)
+        
+        stock_entries = []
+        for col, (label, value) in enumerate((("Length:", stock_length), ("Width:", stock_width),
+                                             ("Saw Kerf:", kerf))):
+            ttk.Label(stock_frame, text=label).grid(row=0, column=col * 2, padx=5, sticky='w')
+            entry = ttk.Entry(stock_frame, width=10)
+            if value:
+                entry.insert(0, f"{value:g}")
+            entry.grid(row=0, column=col * 2 + 1, padx=5)
+            stock_entries.append(entry)
+        
+        rotate_var = tk.BooleanVar(value=True)
+        exact_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(stock_frame, text="Allow rotating sheet parts", variable=rotate_var).grid(
+            row=1, column=0, columnspan=3, padx=5, pady=5, sticky='w')
+        ttk.Checkbutton(stock_frame, text="Exact mode (slower)", variable=exact_var).grid(
+            row=1, column=3, columnspan=3, padx=5, pady=5, sticky='w')
+        
+        parts_frame = ttk.LabelFrame(dialog, text="Parts", padding=10)
+        parts_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        part_columns = ('Name', 'Length', 'Width', 'Count')
+        parts_tree = ttk.Treeview(parts_frame, columns=part_columns, show='headings', height=8)
+        for col in part_columns:
+            parts_tree.heading(col, text=col)
+            parts_tree.column(col, width=120)
+        parts_tree.pack(fill='both', expand=True)
+        
+        entry_frame = ttk.Frame(parts_frame)
+        entry_frame.pack(fill='x', pady=5)
+        part_entries = []
+        for label, width in (("Name:", 16), ("Length:", 8), ("Width:", 8), ("Count:", 5)):
+            ttk.Label(entry_frame, text=label).pack(side='left', padx=2)
+            entry = ttk.Entry(entry_frame, width=width)
+            entry.pack(side='left', padx=2)
+            part_entries.append(entry)
+        part_entries[3].insert(0, "1")
+        
+        def refresh_parts():
+            for item in parts_tree.get_children():
+                parts_tree.delete(item)
+            for part_id, name, length, width, count in load_parts(self.cursor, material_id):
+                parts_tree.insert('', 'end', text=str(part_id),
+                                  values=(name, f"{length:g}", f"{width:g}" if width else "", count))
+        
+        def add_part():
+            name = part_entries[0].get().strip()
+            try:
+                length = float(part_entries[1].get())
+                width = float(part_entries[2].get()) if part_entries[2].get().strip() else None
+                count = int(part_entries[3].get())
+            except ValueError:
+                messagebox.showerror("Error", "Length and width must be numbers and count a whole number",
+                                     parent=dialog)
+                return
+            if not name or length <= 0 or count < 1 or (width is not None and width <= 0):
+                messagebox.showerror("Error", "Please enter a name, a positive size and a count of at least 1",
+                                     parent=dialog)
+                return
+            
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("Add Cut Part"):
+                cursor.execute(
+                    'INSERT INTO cut_parts (project_id, material_id, name, length, width, count) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (self.current_project_id, material_id, name, length, width, count)
+                )
+                part_id = cursor.lastrowid
+            self.events.publish('cut_parts', 'insert', (part_id,), self.current_project_id)
+            for entry in part_entries[:3]:
+                entry.delete(0, 'end')
+            part_entries[0].focus_set()
+            refresh_parts()
+        
+        def remove_part():
+            part_ids = [int(parts_tree.item(item, 'text')) for item in parts_tree.selection()]
+            if not part_ids:
+                return
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("Remove Cut Part"):
+                cursor.executemany('DELETE FROM cut_parts WHERE id = ?', [(part_id,) for part_id in part_ids])
+            self.events.publish('cut_parts', 'delete', part_ids, self.current_project_id)
+            refresh_parts()
+        
+        part_buttons = ttk.Frame(parts_frame)
+        part_buttons.pack(fill='x')
+        ttk.Button(part_buttons, text="Add Part", command=add_part).pack(side='left', padx=2)
+        ttk.Button(part_buttons, text="Remove Part", command=remove_part).pack(side='left', padx=2)
+        
+        result_text = tk.Text(dialog, height=8, wrap='word')
+        result_text.pack(fill='both', padx=10, pady=5)
+        
+        plan_state = {'plan': None, 'error': None, 'thread': None}
+        
+        def show_result():
+            if plan_state['thread'].is_alive():
+                dialog.after(100, show_result)
+                return
+            optimize_button.config(state='normal')
+            result_text.delete('1.0', 'end')
+            if plan_state['error']:
+                result_text.insert('end', str(plan_state['error']))
+                return
+            result_text.insert('end', '\n'.join(plan_state['plan'].describe()))
+            apply_button.config(state='normal')
+        
+        def run_optimizer():
+            try:
+                length = float(stock_entries[0].get())
+                width = float(stock_entries[1].get()) if stock_entries[1].get().strip() else None
+                saw_kerf = float(stock_entries[2].get()) if stock_entries[2].get().strip() else 0.0
+            except ValueError:
+                messagebox.showerror("Error", "Stock sizes must be numbers", parent=dialog)
+                return
+            
+            # Rerunning with the same sizes writes nothing and records no undo step
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("Set Stock Size"):
+                cursor.execute('''
+                    UPDATE materials SET stock_length = :length, stock_width = :width, kerf = :kerf
+                    WHERE id = :id AND (stock_length IS NOT :length OR stock_width IS NOT :width OR kerf IS NOT :kerf)
+                ''', {'length': length, 'width': width, 'kerf': saw_kerf, 'id': material_id})
+                changed = cursor.rowcount
+            if changed:
+                self.events.publish('materials', 'update', (material_id,), self.current_project_id)
+            parts = [row[1:] for row in load_parts(self.cursor, material_id)]
+            if not parts:
+                messagebox.showerror("Error", "Add the parts to cut first", parent=dialog)
+                return
+            
+            def work():
+                try:
+                    plan_state['plan'] = optimize(parts, length, width, saw_kerf, rotate_var.get(), exact_var.get())
+                    plan_state['error'] = None
+                except ValueError as e:
+                    plan_state['plan'] = None
+                    plan_state['error'] = e
+            
+            # The exact modes can search for a couple of seconds
+            optimize_button.config(state='disabled')
+            apply_button.config(state='disabled')
+            result_text.delete('1.0', 'end')
+            result_text.insert('end', "Optimizing...")
+            plan_state['thread'] = threading.Thread(target=work, daemon=True)
+            plan_state['thread'].start()
+            dialog.after(100, show_result)
+        
+        def apply_quantity():
+            with write_transaction(self.conn) as cursor, self.undo_journal.record("Apply Cut List Quantity"):
+                apply_plan(cursor, material_id, plan_state['plan'])
+            self.events.publish('materials', 'update', (material_id,), self.current_project_id)
+            messagebox.showinfo("Success", f"Quantity set to {plan_state['plan'].stock_count}", parent=dialog)
+        
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill='x', padx=10, pady=10)
+        optimize_button = ttk.Button(buttons, text="Optimize", command=run_optimizer)
+        optimize_button.pack(side='left', padx=2)
+        apply_button = ttk.Button(buttons, text="Apply Quantity", command=apply_quantity, state='disabled')
+        apply_button.pack(side='left', padx=2)
+        ttk.Button(buttons, text="Close", command=dialog.destroy).pack(side='right', padx=2)
+        
+        refresh_parts()
+    
+    def show_price_history(self):
+        """Show the monthly price history of the selected material"""
+        selection = self.materials_tree.selection()
+        if not selection or self.line_item_grids['materials'].row_id(selection[0]) is None:
+            messagebox.showerror("Error", "Please select a material")
+            return
+        
+        name = self.materials_tree.item(selection[0], 'values')[0]
+        trend = price_trend(self.cursor, name)
+        if not trend:
+            messagebox.showinfo("Price History", f"No price history for {name}")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Price History - {name}")
+        dialog.geometry("560x360")
+        dialog.transient(self.root)
+        
+        columns = ('Month', 'Changes', 'Min', 'Average', 'Max', 'Last')
+        tree = ttk.Treeview(dialog, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=85)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        for period, changes, low, avg, high, last in trend:
+            tree.insert('', 'end', values=(period, changes, format_money(low), format_money(round(avg)),
+                                           format_money(high), format_money(last)))
+        
+        ttk.Button(dialog, text="Close", command=dialog.destroy).pack(pady=10)
+    
+    def reprice_at_date(self):
+        """Compare the current project's material costs with their prices on a date"""
+        if not self.current_project_id:
+            messagebox.showerror("Error", "No project selected")
+            return
+        
+        as_of = simpledialog.askstring(
+            "Reprice at Date",
+            "Price materials as of (YYYY-MM-DD):",
+            initialvalue=datetime.now().strftime('%Y-%m-%d'),
+            parent=self.root
+        )
+        if not as_of:
+            return
+        try:
+            as_of = datetime.strptime(as_of.strip(), '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            messagebox.showerror("Error", "Please enter the date as YYYY-MM-DD")
+            return
+        
+        report = reprice_project(self.cursor, self.current_project_id, as_of)
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Reprice at {as_of}")
+        dialog.geometry("640x420")
+        dialog.transient(self.root)
+        
+        columns = ('Material', 'Quantity', 'Current Cost', f'Cost at {as_of}', 'Price Since')
+        tree = ttk.Treeview(dialog, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        for item in report['items']:
+            as_of_cost = "no price" if item['as_of_cost_cents'] is None else format_money(item['as_of_cost_cents'])
+            tree.insert('', 'end', values=(item['name'], item['quantity'], format_money(item['unit_cost_cents']),
+                                           as_of_cost, item['price_date'] or ""))
+        
+        difference = report['as_of_total'] - report['current_total']
+        summary = (f"Materials now: {format_money(report['current_total'])}    "
+                   f"At {as_of}: {format_money(report['as_of_total'])} ({format_money(difference, signed=True)})")
+        if report['unpriced']:
+            summary += f"\n{len(report['unpriced'])} material(s) have no price by then and keep their current cost"
+        ttk.Label(dialog, text=summary, justify='left').pack(fill='x', padx=10)
+        
+        def apply_prices():
+            if not messagebox.askyesno("Confirm", f"Set this project's material costs to their {as_of} prices?",
+                                       parent=dialog):
+                return
+            with write_transaction(self.conn) as cursor, self.undo_journal.record(f"Reprice at {as_of}"):
+                changed = apply_reprice(cursor, self.current_project_id, as_of)
+            self.events.publish('materials', 'update', project_id=self.current_project_id)
+            dialog.destroy()
+            messagebox.showinfo("Success", f"Updated {changed} material cost(s)")
+        
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill='x', padx=10, pady=10)
+        ttk.Button(buttons, text="Apply These Prices", command=apply_prices).pack(side='left', padx=2)
+        ttk.Button(buttons, text="Close", command=dialog.destroy).pack(side='right', padx=2)
     
     def add_labor(self):
         """Add labor entry to current project"""
@@ -714,14 +1694,14 @@ class ProjectPricerApp:
             
             try:
                 hours = float(hours)
-                self.cursor.execute(
-                    'INSERT INTO labor (project_id, description, hours) VALUES (?, ?, ?)',
-                    (self.current_project_id, desc, hours)
-                )
-                self.conn.commit()
+                with write_transaction(self.conn) as cursor, self.undo_journal.record("Add Labor"):
+                    cursor.execute(
+                        'INSERT INTO labor (project_id, description, hours) VALUES (?, ?, ?)',
+                        (self.current_project_id, desc, hours)
+                    )
+                self.events.publish('labor', 'insert', (cursor.lastrowid,), self.current_project_id)
                 messagebox.showinfo("Success", "Labor added successfully!")
                 dialog.destroy()
-                self.refresh_current_project()
             except ValueError:
                 messagebox.showerror("Error", "Hours must be a number")
         
@@ -734,10 +1714,7 @@ class ProjectPricerApp:
             messagebox.showerror("Error", "Please select a labor entry to remove")
             return
         
-        labor_id = int(self.labor_tree.item(selection[0], 'text'))
-        self.cursor.execute('DELETE FROM labor WHERE id = ?', (labor_id,))
-        self.conn.commit()
-        self.refresh_current_project()
+        self.delete_line_item('labor', selection[0])
     
     def add_tool_usage(self):
         """Add tool usage to current project"""
@@ -745,14 +1722,8 @@ class ProjectPricerApp:
             messagebox.showerror("Error", "No project selected")
             return
         
-        # Get available tools for current profile
-        self.cursor.execute('''
-            SELECT t.id, t.name, t.cost_per_hour
-            FROM tools t
-            JOIN projects p ON t.profile_id = p.profile_id
-            WHERE p.id = ?
-        ''', (self.current_project_id,))
-        tools = self.cursor.fetchall()
+        # Get available tools for the project's profile
+        tools = self.profile_cache.tools(self.cursor, self.current_project.profile_id)
         
         if not tools:
             messagebox.showerror("Error", "No tools available. Please add tools to your profile first.")
@@ -767,7 +1738,7 @@ class ProjectPricerApp:
         ttk.Label(dialog, text="Tool:").grid(row=0, column=0, padx=10, pady=10, sticky='w')
         tool_var = tk.StringVar()
         tool_combo = ttk.Combobox(dialog, textvariable=tool_var, state='readonly', width=27)
-        tool_combo['values'] = [f"{t[1]} (${t[2]:.2f}/hr)" for t in tools]
+        tool_combo['values'] = [f"{t.name} ({format_money(t.cost_per_hour_cents, '/hr')})" for t in tools]
         tool_combo.grid(row=0, column=1, padx=10, pady=10)
         tool_combo.current(0)
         
@@ -785,16 +1756,16 @@ class ProjectPricerApp:
             try:
                 hours = float(hours)
                 tool_index = tool_combo.current()
-                tool_id = tools[tool_index][0]
+                tool_id = tools[tool_index].id
                 
-                self.cursor.execute(
-                    'INSERT INTO tool_usage (project_id, tool_id, hours) VALUES (?, ?, ?)',
-                    (self.current_project_id, tool_id, hours)
-                )
-                self.conn.commit()
+                with write_transaction(self.conn) as cursor, self.undo_journal.record("Add Tool Usage"):
+                    cursor.execute(
+                        'INSERT INTO tool_usage (project_id, tool_id, hours) VALUES (?, ?, ?)',
+                        (self.current_project_id, tool_id, hours)
+                    )
+                self.events.publish('tool_usage', 'insert', (cursor.lastrowid,), self.current_project_id)
                 messagebox.showinfo("Success", "Tool usage added successfully!")
                 dialog.destroy()
-                self.refresh_current_project()
             except ValueError:
                 messagebox.showerror("Error", "Hours must be a number")
         
@@ -807,10 +1778,7 @@ class ProjectPricerApp:
             messagebox.showerror("Error", "Please select a tool usage entry to remove")
             return
         
-        usage_id = int(self.tool_usage_tree.item(selection[0], 'text'))
-        self.cursor.execute('DELETE FROM tool_usage WHERE id = ?', (usage_id,))
-        self.conn.commit()
-        self.refresh_current_project()
+        self.delete_line_item('tool_usage', selection[0])
     
     def export_to_excel(self):
         """Export current project to Excel"""
@@ -831,7 +1799,7 @@ class ProjectPricerApp:
         
         # Now try to import and use the export function
         try:
-            from excel_export import export_project_to_excel
+            from excel_export import ExportJob
             
             # Get project name for default filename
             self.cursor.execute('SELECT name FROM projects WHERE id = ?', (self.current_project_id,))
@@ -846,8 +1814,8 @@ class ProjectPricerApp:
             )
             
             if filename:
-                export_project_to_excel(self.cursor, self.current_project_id, filename)
-                messagebox.showinfo("Success", f"Project exported to:\n{filename}")
+                self.run_export(ExportJob(self.root, DB_PATH, self.current_project_id, filename,
+                                          cache=self.export_cache))
                 
         except ImportError as e:
             messagebox.showerror("Import Error", 
@@ -857,6 +1825,373 @@ class ProjectPricerApp:
         except Exception as e:
             messagebox.showerror("Export Error", f"Failed to export project:\n{str(e)}")
     
+    def export_listed_projects(self):
+        """Export every project matching the project list filters to a folder"""
+        try:
+            import openpyxl
+        except ImportError:
+            messagebox.showerror("Missing Dependency",
+                              "Excel export requires the 'openpyxl' library.\n\n"
+                              "Install it with:\n"
+                              "  pip install openpyxl")
+            return
+        from export_cache import BulkExportJob
+        
+        project_ids = self.listed_project_ids()
+        if not project_ids:
+            messagebox.showinfo("Export", "No projects match the current filters")
+            return
+        
+        folder = filedialog.askdirectory(title=f"Folder for {len(project_ids)} project workbooks")
+        if folder:
+            self.run_export(BulkExportJob(self.root, DB_PATH, project_ids, folder, self.export_cache))
+    
+    def listed_project_ids(self):
+        """IDs of every project matching the project list filters"""
+        where, params = project_filter_sql(self.project_filters)
+        self.cursor.execute(f'''
+            SELECT p.id FROM projects p
+            JOIN project_totals t ON t.project_id = p.id
+            {where}
+        ''', params)
+        return [row[0] for row in self.cursor.fetchall()]
+    
+    def export_quote(self):
+        """Save the current project as a printable HTML quote"""
+        if not self.current_project_id:
+            messagebox.showerror("Error", "No project selected")
+            return
+        from export_cache import export_filename
+        from html_quote import QuoteJob
+        
+        self.cursor.execute('SELECT name FROM projects WHERE id = ?', (self.current_project_id,))
+        project_name = self.cursor.fetchone()[0]
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".html",
+            filetypes=[("HTML files", "*.html"), ("All files", "*.*")],
+            initialfile=export_filename(self.current_project_id, project_name, 'quote.html')
+        )
+        if filename:
+            self.run_export(QuoteJob(self.root, DB_PATH, self.current_project_id, filename, cache=self.export_cache))
+    
+    def export_listed_quotes(self):
+        """Write an HTML quote for every project matching the project list filters to a folder"""
+        from html_quote import BulkQuoteJob
+        
+        project_ids = self.listed_project_ids()
+        if not project_ids:
+            messagebox.showinfo("Export", "No projects match the current filters")
+            return
+        
+        folder = filedialog.askdirectory(title=f"Folder for {len(project_ids)} quotes")
+        if folder:
+            self.run_export(BulkQuoteJob(self.root, DB_PATH, project_ids, folder, self.export_cache))
+    
+    def show_what_if_dialog(self):
+        """Price the current project across ranges of rates, inflation and markup"""
+        if not self.current_project_id:
+            messagebox.showerror("Error", "No project selected")
+            return
+        
+        try:
+            from scenarios import ProjectScenario, value_range
+            scenario = ProjectScenario.load(self.cursor, self.current_project_id)
+        except ImportError:
+            messagebox.showerror("Missing Dependency",
+                              "What-if pricing requires the 'numpy' library.\n\n"
+                              "Install it with:\n"
+                              "  pip install numpy\n\n"
+                              "Then restart the application.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"What-If Pricing - {scenario.project_name}")
+        dialog.geometry("820x600")
+        dialog.transient(self.root)
+        
+        ranges_frame = ttk.LabelFrame(dialog, text="Ranges", padding=10)
+        ranges_frame.pack(fill='x', padx=10, pady=10)
+        
+        ttk.Label(ranges_frame, text="From").grid(row=0, column=1, padx=5)
+        ttk.Label(ranges_frame, text="To").grid(row=0, column=2, padx=5)
+        ttk.Label(ranges_frame, text="Steps").grid(row=0, column=3, padx=5)
+        
+        rate = scenario.hourly_rate
+        range_specs = [
+            ('hourly_rate', "Hourly Rate ($):", rate * 0.8, rate * 1.2, 9),
+            ('tool_rate_factor', "Tool Rate Factor:", 0.8, 1.2, 5),
+            ('material_inflation', "Material Inflation (%):", 0, 20, 5),
+            ('markup', "Markup (%):", 0, 30, 7),
+        ]
+        range_entries = {}
+        for row, (key, label, start, stop, steps) in enumerate(range_specs, 1):
+            ttk.Label(ranges_frame, text=label).grid(row=row, column=0, padx=5, pady=2, sticky='w')
+            entries = []
+            for col, value in enumerate((f"{start:g}", f"{stop:g}", str(steps)), 1):
+                entry = ttk.Entry(ranges_frame, width=10)
+                entry.insert(0, value)
+                entry.grid(row=row, column=col, padx=5, pady=2)
+                entries.append(entry)
+            range_entries[key] = entries
+        
+        mc_frame = ttk.LabelFrame(dialog, text="Monte Carlo on Labor Hours", padding=10)
+        mc_frame.pack(fill='x', padx=10, pady=5)
+        
+        mc_specs = [("Runs:", '10000'), ("Underrun (%):", '10'), ("Overrun (%):", '50')]
+        mc_entries = []
+        for col, (label, value) in enumerate(mc_specs):
+            ttk.Label(mc_frame, text=label).grid(row=0, column=col * 2, padx=5, sticky='w')
+            entry = ttk.Entry(mc_frame, width=10)
+            entry.insert(0, value)
+            entry.grid(row=0, column=col * 2 + 1, padx=5)
+            mc_entries.append(entry)
+        
+        summary_label = ttk.Label(dialog, text="", justify='left')
+        summary_label.pack(fill='x', padx=10, pady=5)
+        
+        columns = ('Hourly Rate', 'Tool Factor', 'Inflation', 'Markup', 'Total')
+        results_tree = ttk.Treeview(dialog, columns=columns, show='headings', height=10)
+        for col in columns:
+            results_tree.heading(col, text=col)
+            results_tree.column(col, width=120)
+        results_tree.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        results = {}
+        
+        def calculate():
+            try:
+                axes = {}
+                for key, (start, stop, steps) in range_entries.items():
+                    values = value_range(float(start.get()), float(stop.get()), int(steps.get()))
+                    if key in ('material_inflation', 'markup'):
+                        values = values / 100.0
+                    axes[key] = values
+                runs = int(mc_entries[0].get())
+                under = float(mc_entries[1].get()) / 100.0
+                over = float(mc_entries[2].get()) / 100.0
+            except ValueError:
+                messagebox.showerror("Error", "Ranges must be numbers and steps at least 1", parent=dialog)
+                return
+            if runs < 1 or not 0 <= under <= 1 or over < 0:
+                messagebox.showerror("Error", "Runs must be positive, underrun 0-100% and overrun 0% or more",
+                                     parent=dialog)
+                return
+            
+            grid = scenario.evaluate(axes['hourly_rate'], axes['tool_rate_factor'],
+                                     axes['material_inflation'], axes['markup'])
+            simulation = scenario.monte_carlo(runs, under, over)
+            results['grid'] = grid
+            results['simulation'] = simulation
+            
+            summary = grid.summary()
+            summary_label.config(text=(
+                f"{summary['count']} combinations: "
+                f"${summary['min']:.2f} to ${summary['max']:.2f} (mean ${summary['mean']:.2f})\n"
+                f"Labor hours Monte Carlo ({runs} runs at ${rate:.2f}/hr): "
+                f"median ${simulation['p50']:.2f}, 5th-95th percentile "
+                f"${simulation['p5']:.2f} to ${simulation['p95']:.2f}"
+            ))
+            
+            results_tree.delete(*results_tree.get_children())
+            # A Treeview slows down badly with many rows; the export has them all
+            for values in grid.rows(order='asc')[:500]:
+                hourly_rate, factor, inflation, markup = values[:4]
+                results_tree.insert('', 'end', values=(
+                    f"${hourly_rate:.2f}", f"{factor:.2f}", f"{inflation * 100:.1f}%",
+                    f"{markup * 100:.1f}%", f"${values[-1]:.2f}"
+                ))
+        
+        def export():
+            if 'grid' not in results:
+                calculate()
+                if 'grid' not in results:
+                    return
+            try:
+                from excel_export import ExportJob
+            except ImportError:
+                messagebox.showerror("Missing Dependency",
+                                  "Excel export requires the 'openpyxl' library.\n\n"
+                                  "Install it with:\n"
+                                  "  pip install openpyxl", parent=dialog)
+                return
+            
+            default_filename = f"{scenario.project_name.replace(' ', '_')}_what_if.xlsx"
+            filename = filedialog.asksaveasfilename(
+                parent=dialog,
+                defaultextension=".xlsx",
+                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+                initialfile=default_filename
+            )
+            if not filename:
+                return
+            self.run_export(ExportJob(self.root, DB_PATH, self.current_project_id, filename,
+                                      scenarios=results['grid'], simulation=results['simulation']),
+                            parent=dialog)
+        
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill='x', padx=10, pady=10)
+        ttk.Button(buttons, text="Calculate", command=calculate).pack(side='left', padx=2)
+        ttk.Button(buttons, text="Export to Excel", command=export).pack(side='left', padx=2)
+        ttk.Button(buttons, text="Close", command=dialog.destroy).pack(side='right', padx=2)
+        
+        calculate()
+    
+    def run_export(self, job, parent=None):
+        """Run an export job in the background with a progress dialog"""
+        from excel_export import ExportCancelled
+        
+        parent = parent or self.root
+        dialog = tk.Toplevel(parent)
+        dialog.title("Exporting")
+        dialog.geometry("360x130")
+        dialog.transient(parent)
+        dialog.resizable(False, False)
+        
+        status_label = ttk.Label(dialog, text="Preparing export...")
+        status_label.pack(fill='x', padx=10, pady=(15, 5))
+        progress_bar = ttk.Progressbar(dialog, mode='determinate', maximum=1)
+        progress_bar.pack(fill='x', padx=10, pady=5)
+        cancel_button = ttk.Button(dialog, text="Cancel")
+        cancel_button.pack(pady=10)
+        
+        def cancel():
+            job.cancel()
+            cancel_button.config(state='disabled')
+            status_label.config(text="Cancelling...")
+        
+        def on_progress(done, total):
+            if total and not job.is_cancelled():
+                progress_bar.config(maximum=total, value=done)
+                status_label.config(text=job.PROGRESS_TEXT.format(done=done, total=total))
+        
+        def on_complete(filename, error):
+            dialog.destroy()
+            self.memory_checkpoint('export')
+            if error is None:
+                messagebox.showinfo("Success", job.message(), parent=parent)
+            elif isinstance(error, ExportCancelled):
+                messagebox.showinfo("Export Cancelled", job.CANCELLED_TEXT, parent=parent)
+            else:
+                messagebox.showerror("Export Error", f"Failed to export project:\n{str(error)}", parent=parent)
+        
+        cancel_button.config(command=cancel)
+        dialog.protocol("WM_DELETE_WINDOW", cancel)
+        job.start(on_progress, on_complete)
+    
+    def backup_now(self):
+        """Take a database snapshot in the background"""
+        def on_complete(path, error):
+            if error:
+                messagebox.showerror("Backup Error", f"Backup failed:\n{str(error)}")
+            else:
+                messagebox.showinfo("Success", f"Backup saved to:\n{path}")
+        
+        self.backup_scheduler.run_now(on_complete)
+    
+    def restore_backup(self):
+        """Restore the database from a snapshot"""
+        if not list_snapshots(BACKUP_DIR):
+            messagebox.showerror("Error", "No backups found")
+            return
+        
+        filename = filedialog.askopenfilename(
+            initialdir=BACKUP_DIR,
+            filetypes=[("Database files", "*.db"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        if not messagebox.askyesno("Confirm", "Replace all current data with this backup?\n\n"
+                                              "A backup of the current data is taken first."):
+            return
+        
+        try:
+            self.conn.commit()
+            create_snapshot(DB_PATH, BACKUP_DIR)
+            restore_snapshot(filename, conn=self.conn)
+        except (sqlite3.Error, OSError) as e:
+            messagebox.showerror("Restore Error", f"Failed to restore backup:\n{str(e)}")
+            return
+        # Recorded steps describe the data that was replaced
+        self.undo_journal.clear()
+        self.undo_journal.install()
+        
+        # Selections may no longer exist in the restored data
+        self.current_profile_id = None
+        self.clear_current_project()
+        self.profile_var.set('')
+        self.hourly_rate_label.config(text="--")
+        
+        self.events.publish(ALL_TABLES, 'update')
+        messagebox.showinfo("Success", "Backup restored successfully")
+    
+    def start_replication(self):
+        """Start periodic replication if a replica file is configured"""
+        if self.replication_scheduler:
+            self.replication_scheduler.stop()
+            self.replication_scheduler = None
+        
+        replica_path = self.get_setting('replica_path')
+        if replica_path:
+            self.replication_scheduler = ReplicationScheduler(self.root, DB_PATH, replica_path)
+            self.replication_scheduler.start()
+    
+    def set_replica_file(self):
+        """Choose the secondary database file that receives replicated changes"""
+        filename = filedialog.asksaveasfilename(
+            title="Replica Database",
+            defaultextension=".db",
+            filetypes=[("Database files", "*.db"), ("All files", "*.*")],
+            initialfile="project_pricer_replica.db",
+            confirmoverwrite=False
+        )
+        if not filename:
+            return
+        
+        with write_transaction(self.conn) as cursor:
+            install_change_log(cursor)
+            self.set_setting('replica_path', filename)
+        self.start_replication()
+        self.replicate_now()
+    
+    def stop_replicating(self):
+        """Forget the replica file and stop capturing changes for it"""
+        if not self.get_setting('replica_path'):
+            messagebox.showinfo("Replication", "No replica file configured.")
+            return
+        if not messagebox.askyesno("Stop Replicating",
+                                   "Stop keeping the replica file up to date?\n\n"
+                                   "The file is kept, and is rebuilt from a full copy if it is set again."):
+            return
+        
+        if self.replication_scheduler:
+            self.replication_scheduler.stop()
+            self.replication_scheduler = None
+        with write_transaction(self.conn) as cursor:
+            cursor.execute("DELETE FROM settings WHERE key = 'replica_path'")
+            stop_change_log(cursor)
+        self.events.publish('settings', 'delete')
+    
+    def replicate_now(self):
+        """Ship pending changes to the replica in the background"""
+        if not self.replication_scheduler:
+            messagebox.showerror("Error", "No replica file configured. Use File > Set Replica File... first.")
+            return
+        
+        def on_complete(stats, error):
+            if error:
+                messagebox.showerror("Replication Error", f"Replication failed:\n{str(error)}")
+            else:
+                message = f"Shipped {stats['shipped']} changes to the replica."
+                if stats['seeded']:
+                    message = "Replica rebuilt from a full copy.\n" + message
+                if stats['conflicts']:
+                    message += f"\n{stats['conflicts']} conflicts were recorded in the replica."
+                messagebox.showinfo("Replication", message)
+        
+        self.conn.commit()
+        self.replication_scheduler.run_now(on_complete)
+    
     def check_environment(self):
         """Check the environment and display diagnostic information"""
         import sys
@@ -886,6 +2221,16 @@ class ProjectPricerApp:
             openpyxl_ok = False
         report.append("")
         
+        # Check for numpy
+        report.append("Checking for numpy...")
+        try:
+            import numpy
+            report.append(f"✓ numpy is installed (version {numpy.__version__})")
+        except ImportError:
+            report.append("✗ numpy is NOT installed (needed for what-if pricing)")
+            report.append("  Install with: pip install numpy")
+        report.append("")
+        
         # Check for required files
         report.append("Checking for required files...")
         excel_export_exists = os.path.exists('excel_export.py')
@@ -909,6 +2254,40 @@ class ProjectPricerApp:
         else:
             module_ok = False
         
+        # Replication status
+        report.append("Checking replication...")
+        replica_path = self.get_setting('replica_path')
+        if replica_path:
+            report.append(f"Replica file: {replica_path}")
+            try:
+                pending, seconds = Replicator(DB_PATH, replica_path).lag()
+                report.append(f"  Pending changes: {pending}")
+                report.append(f"  Lag: {seconds:.1f} seconds")
+            except sqlite3.Error as e:
+                report.append(f"✗ Could not read replication status: {e}")
+        else:
+            report.append("No replica file configured")
+        report.append("")
+        
+        # Database statistics
+        report.append("Database statistics:")
+        # Exact counts scan every table, so planner estimates are shown until
+        # a worker thread has counted rows and pages
+        table_lines = None
+        table_at = None
+        try:
+            scheduler = self.maintenance_scheduler
+            table_lines = format_table_stats(table_stats(self.conn, exact=False), exact=False)
+            table_lines.append("  (counting rows and pages...)")
+            lines = format_report(self.conn, scheduler.last_run, scheduler.last_actions, table_lines=table_lines)
+            table_at = len(report) + lines.index(table_lines[0])
+            report.extend(lines)
+            if scheduler.last_error:
+                report.append(f"✗ Last maintenance failed: {scheduler.last_error}")
+        except sqlite3.Error as e:
+            report.append(f"✗ Could not read database statistics: {e}")
+        report.append("")
+        
         # Summary
         report.append("=" * 60)
         report.append("SUMMARY")
@@ -971,6 +2350,23 @@ class ProjectPricerApp:
         text_widget.insert('1.0', '\n'.join(report))
         text_widget.config(state='disabled')  # Make read-only
         
+        def on_table_stats(stats, error):
+            if not dialog.winfo_exists():
+                return
+            if error:
+                exact_lines = table_lines[:-1] + [f"  ✗ Could not count rows and pages: {error}"]
+            else:
+                exact_lines = format_table_stats(stats)
+            report[table_at:table_at + len(table_lines)] = exact_lines
+            text_widget.config(state='normal')
+            text_widget.delete('1.0', 'end')
+            text_widget.insert('1.0', '\n'.join(report))
+            text_widget.config(state='disabled')
+        
+        if table_at is not None:
+            self.conn.commit()
+            self.maintenance_scheduler.collect_table_stats(on_table_stats)
+        
         # Copy button
         def copy_to_clipboard():
             self.root.clipboard_clear()
@@ -979,8 +2375,94 @@ class ProjectPricerApp:
         
         button_frame = ttk.Frame(dialog)
         button_frame.pack(fill='x', padx=10, pady=5)
+        # Run maintenance on demand
+        def run_maintenance():
+            def on_complete(actions, error):
+                if error:
+                    messagebox.showerror("Maintenance Error", f"Maintenance failed:\n{str(error)}", parent=dialog)
+                else:
+                    messagebox.showinfo("Maintenance", '\n'.join(actions), parent=dialog)
+            
+            self.conn.commit()
+            self.maintenance_scheduler.run_now(on_complete)
+        
         ttk.Button(button_frame, text="Copy to Clipboard", command=copy_to_clipboard).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Run Maintenance", command=run_maintenance).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side='right', padx=5)
+    
+    def toggle_memory_profiling(self):
+        """Start or stop tracing allocations, following the Help menu check mark"""
+        if self.memory_profiling.get():
+            self.memory_profiler = MemoryProfiler(counters=self.widget_counts)
+            self.memory_profiler.start()
+        elif self.memory_profiler is not None:
+            self.memory_profiler.stop()
+            self.memory_profiler = None
+    
+    def memory_checkpoint(self, operation):
+        """Charge memory growth since the last checkpoint to an operation, while profiling"""
+        if self.memory_profiler is not None:
+            self.memory_profiler.checkpoint(operation)
+    
+    def widget_counts(self):
+        """Count Tk widgets, Toplevel windows and Treeview items, for memory reports"""
+        counts = {'Tk widgets': 0, 'Toplevel windows': 0, 'Treeview items': 0}
+        widgets = [self.root]
+        while widgets:
+            widget = widgets.pop()
+            counts['Tk widgets'] += 1
+            if isinstance(widget, tk.Toplevel):
+                counts['Toplevel windows'] += 1
+            elif isinstance(widget, ttk.Treeview):
+                items = list(widget.get_children())
+                while items:
+                    counts['Treeview items'] += 1
+                    items.extend(widget.get_children(items.pop()))
+            widgets.extend(widget.winfo_children())
+        return counts
+    
+    def show_memory_report(self):
+        """Show growth per operation, top allocation sites and live object counts"""
+        if self.memory_profiler is None:
+            messagebox.showinfo("Memory Report", "Turn on Help > Profile Memory, use the application "
+                                "for a while, then open this report.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Memory Report")
+        dialog.geometry("760x560")
+        dialog.transient(self.root)
+        
+        frame = ttk.Frame(dialog)
+        frame.pack(fill='both', expand=True, padx=10, pady=10)
+        scrollbar = ttk.Scrollbar(frame)
+        scrollbar.pack(side='right', fill='y')
+        text_widget = tk.Text(frame, wrap='none', yscrollcommand=scrollbar.set, font=('Courier', 10))
+        text_widget.pack(side='left', fill='both', expand=True)
+        scrollbar.config(command=text_widget.yview)
+        
+        def refresh():
+            text_widget.config(state='normal')
+            text_widget.delete('1.0', 'end')
+            text_widget.insert('1.0', '\n'.join(self.memory_profiler.report()))
+            text_widget.config(state='disabled')
+        
+        def save():
+            filename = filedialog.asksaveasfilename(parent=dialog, defaultextension=".txt",
+                                                    filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+                                                    initialfile="memory_report.txt")
+            if filename:
+                try:
+                    self.memory_profiler.write_report(filename)
+                except OSError as e:
+                    messagebox.showerror("Save Error", f"Failed to save the report:\n{str(e)}", parent=dialog)
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill='x', padx=10, pady=5)
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Save Report...", command=save).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side='right', padx=5)
+        refresh()
     
     def show_about(self):
         """Show about dialog"""
@@ -995,18 +2477,53 @@ Features:
 • User profile management
 • Project cost tracking
 • Excel export for professional quotes
+• What-if pricing scenarios
+• Cut-list optimizer for material quantities
+• Material price history
 • SQLite database storage
+• Automatic database backups
 
 Created with Python and Tkinter
         """
         messagebox.showinfo("About Project Pricer", about_text)
     
+    def shutdown(self):
+        """Save running timers, close the database and end the application"""
+        for scheduler in (self.backup_scheduler, self.replication_scheduler, self.maintenance_scheduler,
+                          self.time_tracking_scheduler):
+            if scheduler:
+                scheduler.stop()
+        self.close_database()
+        self.root.destroy()
+    
+    def close_database(self):
+        """Stop running timers, roll their events into labor rows and close the connection"""
+        conn = getattr(self, 'conn', None)
+        if conn is None:
+            return
+        if hasattr(self, 'time_tracker'):
+            # Running timers stop with the application
+            try:
+                self.time_tracker.stop_all()
+                self.time_tracker.flush()
+                compact_timer_events(conn)
+            except sqlite3.Error:
+                pass
+        try:
+            # Lets SQLite refresh statistics for the queries this session ran
+            conn.execute('PRAGMA optimize')
+        except sqlite3.Error:
+            pass
+        conn.close()
+        self.conn = None
+    
     def __del__(self):
-        """Close database connection"""
-        if hasattr(self, 'conn'):
-            self.conn.close()
+        """Close database connection if shutdown did not run"""
+        self.close_database()
 
 def main():
+    # Frozen Windows builds re-run this script in each import worker process
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ProjectPricerApp(root)
     root.mainloop()
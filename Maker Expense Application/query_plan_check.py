@@ -0,0 +1,340 @@
+"""
+Query plan regression check for Project Pricer
+Generates a large database, runs the queries behind the application's
+views, reports and exports, and fails when one of them scans a child
+table without an index or runs over its latency budget.
+
+Queries are captured with a trace callback while the real functions run,
+so the check follows the code rather than a copy of its SQL. Each captured
+statement is passed to EXPLAIN QUERY PLAN.
+
+Usage:
+    python query_plan_check.py [--projects 20000] [--budget-scale 1.0] [--verbose]
+"""
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+
+# Tables that hold many rows per project; a plain SCAN of one is a regression
+CHILD_TABLES = ('materials', 'labor', 'tool_usage', 'cut_parts', 'material_prices', 'project_totals')
+
+DEFAULT_PROJECTS = 20000
+MATERIALS_PER_PROJECT = 6
+LABOR_PER_PROJECT = 2
+TOOL_USAGE_PER_PROJECT = 2
+MATERIAL_NAMES = 400
+PROFILES = 5
+TOOLS_PER_PROFILE = 8
+# Timer events compacted by the time tracking case
+TIMER_EVENTS = 10000
+
+TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+PLAN_SCAN = re.compile(r'^SCAN (\w+)$')
+SQL_KEYWORDS = {'where', 'on', 'join', 'left', 'inner', 'group', 'order', 'limit', 'using', 'set', 'union'}
+
+def generate(conn, projects, seed=1):
+    """
+    Fill a schema-current database with generated profiles, tools, projects and line items
+    
+    Args:
+        conn: SQLite connection
+        projects: Number of projects
+        seed: Random seed
+    """
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    cursor.executemany('INSERT INTO profiles (id, name, hourly_rate_cents, created_date) VALUES (?, ?, ?, ?)',
+                       [(i, f"Profile {i}", 2000 + 500 * i, '2020-01-01') for i in range(1, PROFILES + 1)])
+    tools = [(profile * 100 + n, profile, f"Tool {n}", rng.randint(100, 3000))
+             for profile in range(1, PROFILES + 1) for n in range(TOOLS_PER_PROFILE)]
+    cursor.executemany('INSERT INTO tools (id, profile_id, name, cost_per_hour_cents) VALUES (?, ?, ?, ?)', tools)
+    
+    names = [f"Material {i}" for i in range(MATERIAL_NAMES)]
+    for start in range(1, projects + 1, 1000):
+        ids = range(start, min(start + 1000, projects + 1))
+        project_rows = []
+        materials = []
+        labor = []
+        usage = []
+        for project_id in ids:
+            profile = rng.randint(1, PROFILES)
+            created = f"{rng.randint(2018, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T09:00:00"
+            project_rows.append((project_id, profile, f"Project {rng.randint(0, 99999)}",
+                                 f"Generated project {project_id}", created))
+            for _ in range(MATERIALS_PER_PROJECT):
+                materials.append((project_id, rng.choice(names), rng.randint(1, 20), rng.randint(50, 8000)))
+            for _ in range(LABOR_PER_PROJECT):
+                labor.append((project_id, "Work", rng.uniform(0.5, 12)))
+            for _ in range(TOOL_USAGE_PER_PROJECT):
+                usage.append((project_id, profile * 100 + rng.randrange(TOOLS_PER_PROFILE), rng.uniform(0.1, 5)))
+        cursor.executemany('INSERT INTO projects (id, profile_id, name, description, created_date) '
+                           'VALUES (?, ?, ?, ?, ?)', project_rows)
+        cursor.executemany('INSERT INTO materials (project_id, name, quantity, unit_cost_cents) '
+                           'VALUES (?, ?, ?, ?)', materials)
+        cursor.executemany('INSERT INTO labor (project_id, description, hours) VALUES (?, ?, ?)', labor)
+        cursor.executemany('INSERT INTO tool_usage (project_id, tool_id, hours) VALUES (?, ?, ?)', usage)
+    
+    cursor.execute('''
+        INSERT INTO cut_parts (project_id, material_id, name, length, width, count)
+        SELECT project_id, id, 'Shelf', 30, 10, 2 FROM materials WHERE id % 10 = 0
+    ''')
+    cursor.executemany('''
+        INSERT OR IGNORE INTO material_prices (material_key, effective_date, unit_cost_cents, source)
+        VALUES (lower(?), ?, ?, 'import')
+    ''', [(name, f"{year}-{month:02d}-01", rng.randint(50, 8000))
+          for name in names for year in range(2018, 2026) for month in range(1, 13)])
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.commit()
+
+def table_aliases(sql):
+    """Map each table reference (alias or name) in a statement to its table"""
+    aliases = {}
+    for table, alias in TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+def child_table_scans(cursor, sql):
+    """
+    Find full scans of child tables in a statement's query plan
+    
+    Returns:
+        (scanned tables, plan detail lines)
+    """
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+    details = [row[3] for row in cursor.fetchall()]
+    aliases = table_aliases(sql)
+    scans = []
+    for detail in details:
+        match = PLAN_SCAN.match(detail)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in CHILD_TABLES:
+                scans.append(table)
+    return scans, details
+
+def build_cases(sample):
+    """
+    Name the production calls to check, with their latency budgets in ms
+    
+    Args:
+        sample: Dictionary of IDs from the generated data
+    
+    Returns:
+        List of (name, budget_ms, function(cursor))
+    """
+    from cutlist import load_parts, load_stock
+    from models import ProfileCache, load_labor, load_materials, load_project, load_tool_usage
+    from price_history import price_as_of, price_movers, price_trend, reprice_project
+    from pricing import (PROJECT_SORT_COLUMNS, count_projects, list_projects, page_projects, project_costs,
+                         project_line_items)
+    from project_pricer import LABOR_SORT_COLUMNS, MATERIAL_SORT_COLUMNS, TOOL_USAGE_SORT_COLUMNS
+    from time_tracking import START, TICK, compact_events
+    
+    project_id = sample['project_id']
+    material_id = sample['material_id']
+    filters = {'name': 'Project 12', 'date_from': '2020-01-01', 'date_to': '2022-12-31',
+               'min_total': 10000, 'max_total': 500000}
+    cases = []
+    
+    for sort in PROJECT_SORT_COLUMNS:
+        for descending in (True, False):
+            direction = 'desc' if descending else 'asc'
+            
+            def first_and_next(cursor, sort=sort, descending=descending):
+                rows = page_projects(cursor, None, sort, descending, 101)
+                page_projects(cursor, None, sort, descending, 101, (rows[-1][5], rows[-1][0]))
+            cases.append((f"projects page by {sort} {direction}", 50, first_and_next))
+    cases.append(("projects page filtered", 100, lambda c: page_projects(c, filters, 'Total Cost', True, 101)))
+    cases.append(("projects count", 50, lambda c: count_projects(c)))
+    cases.append(("projects count filtered", 100, lambda c: count_projects(c, filters)))
+    cases.append(("list projects for profile", 300, lambda c: list_projects(c, 1)))
+    
+    cases.append(("open project", 5, lambda c: load_project(c, project_id)))
+    for table, loader, columns in (('materials', load_materials, MATERIAL_SORT_COLUMNS),
+                                   ('labor', load_labor, LABOR_SORT_COLUMNS),
+                                   ('tool_usage', load_tool_usage, TOOL_USAGE_SORT_COLUMNS)):
+        cases.append((f"{table} in entry order", 5, lambda c, loader=loader: loader(c, project_id)))
+        for column, sql in columns.items():
+            cases.append((f"{table} by {column}", 5,
+                          lambda c, loader=loader, sql=sql: loader(c, project_id, f'ORDER BY {sql}')))
+    cases.append(("project costs", 5, lambda c: project_costs(c, project_id)))
+    cases.append(("project line items", 5, lambda c: project_line_items(c, project_id)))
+    cases.append(("profile tools", 5, lambda c: ProfileCache().tools(c, 1)))
+    cases.append(("profiles", 5, lambda c: ProfileCache().profiles(c)))
+    
+    cases.append(("cut list parts", 5, lambda c: (load_parts(c, material_id), load_stock(c, material_id))))
+    cases.append(("price as of", 5, lambda c: price_as_of(c, 'Material 7', '2022-06-15')))
+    cases.append(("price trend", 20, lambda c: price_trend(c, 'Material 7')))
+    cases.append(("reprice project", 10, lambda c: reprice_project(c, project_id, '2021-03-01')))
+    cases.append(("price movers", 500, lambda c: price_movers(c, '2020-01-01', '2024-01-01')))
+    
+    def delete_project(cursor):
+        # The application's delete statements, rolled back
+        cursor.execute('SAVEPOINT check_delete')
+        for table in ('materials', 'labor', 'tool_usage', 'cut_parts'):
+            cursor.execute(f'DELETE FROM {table} WHERE project_id = ?', (project_id,))
+        cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
+        cursor.execute('ROLLBACK TO check_delete')
+        cursor.execute('RELEASE check_delete')
+    cases.append(("delete project", 20, delete_project))
+    
+    def add_and_remove_line_items(cursor):
+        cursor.execute('SAVEPOINT check_write')
+        cursor.execute('INSERT INTO materials (project_id, name, quantity, unit_cost_cents) VALUES (?, ?, ?, ?)',
+                       (project_id, 'Check', 1, 100))
+        cursor.execute('DELETE FROM cut_parts WHERE material_id = ?', (cursor.lastrowid,))
+        cursor.execute('INSERT INTO labor (project_id, description, hours) VALUES (?, ?, ?)', (project_id, 'Check', 1))
+        cursor.execute('UPDATE tools SET cost_per_hour_cents = cost_per_hour_cents + 100 WHERE id = ?',
+                       (sample['tool_id'],))
+        cursor.execute('ROLLBACK TO check_write')
+        cursor.execute('RELEASE check_write')
+    cases.append(("line item writes", 200, add_and_remove_line_items))
+    
+    def compact_timer_events(cursor):
+        # A long timer's ticks rolled up into labor and priced, rolled back
+        cursor.execute('SAVEPOINT check_timer')
+        cursor.execute('''
+            WITH RECURSIVE n (i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+            INSERT INTO timer_events (project_id, kind, at_ms)
+            SELECT ?, CASE WHEN i = 0 THEN ? ELSE ? END, 1700000000000 + i * 1000 FROM n
+        ''', (TIMER_EVENTS, project_id, START, TICK))
+        compact_events(cursor, 1700000000000 + TIMER_EVENTS * 1000)
+        project_costs(cursor, project_id)
+        cursor.execute('ROLLBACK TO check_timer')
+        cursor.execute('RELEASE check_timer')
+    cases.append(("timer compaction", 250, compact_timer_events))
+    
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        from excel_export import export_project_to_excel
+        
+        def export(cursor):
+            fd, path = tempfile.mkstemp(suffix='.xlsx')
+            os.close(fd)
+            try:
+                export_project_to_excel(cursor, project_id, path)
+            finally:
+                os.remove(path)
+        cases.append(("excel export", 1000, export))
+    return cases
+
+def run_case(conn, function, repeat):
+    """
+    Run a case with its statements captured
+    
+    Returns:
+        (statements, best time in ms)
+    """
+    statements = []
+    
+    def trace(sql):
+        # Statements run by triggers are reported with a leading comment
+        if not sql.lstrip().startswith('--'):
+            statements.append(sql)
+    
+    conn.set_trace_callback(trace)
+    try:
+        function(conn.cursor())
+    finally:
+        conn.set_trace_callback(None)
+    # Trigger firings can report their statement again
+    statements = list(dict.fromkeys(statements))
+    
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(conn.cursor())
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return statements, best
+
+def check(db_path, budget_scale=1.0, repeat=3, verbose=False):
+    """
+    Check every case against a generated database
+    
+    Returns:
+        Number of failures
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    sample = {
+        'project_id': cursor.execute('SELECT project_id FROM materials ORDER BY id DESC LIMIT 1').fetchone()[0],
+        'material_id': cursor.execute('SELECT material_id FROM cut_parts LIMIT 1').fetchone()[0],
+        'tool_id': cursor.execute('SELECT tool_id FROM tool_usage LIMIT 1').fetchone()[0],
+    }
+    
+    failures = 0
+    plan_cursor = conn.cursor()
+    for name, budget, function in build_cases(sample):
+        statements, best = run_case(conn, function, repeat)
+        budget *= budget_scale
+        problems = []
+        for sql in statements:
+            if not re.match(r'\s*(SELECT|WITH|UPDATE|DELETE|INSERT)', sql, re.IGNORECASE):
+                continue
+            scans, details = child_table_scans(plan_cursor, sql)
+            if scans:
+                problems.append(f"full scan of {', '.join(sorted(set(scans)))} in: {' '.join(sql.split())[:160]}")
+            if verbose:
+                print(f"    {' '.join(sql.split())[:120]}")
+                for detail in details:
+                    print(f"        {detail}")
+        if best > budget:
+            problems.append(f"{best:.1f} ms over the {budget:.0f} ms budget")
+        
+        status = 'FAIL' if problems else 'ok'
+        print(f"{status:<4}  {name:<36} {best:>8.2f} ms  ({len(statements)} statements)")
+        for problem in problems:
+            print(f"      {problem}")
+        failures += bool(problems)
+    conn.close()
+    return failures
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Check Project Pricer queries for table scans and slow plans")
+    parser.add_argument('--projects', type=int, default=DEFAULT_PROJECTS, help="Projects to generate")
+    parser.add_argument('--db', help="Keep the generated database in this file instead of a temporary one")
+    parser.add_argument('--budget-scale', type=float, default=1.0, help="Multiply every latency budget")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (best is kept)")
+    parser.add_argument('--verbose', action='store_true', help="Print every statement and its plan")
+    args = parser.parse_args()
+    
+    from schema import connect
+    
+    temp_dir = None
+    db_path = args.db
+    if db_path is None:
+        temp_dir = tempfile.mkdtemp(prefix='query_plan_check_')
+        db_path = os.path.join(temp_dir, 'check.db')
+    elif os.path.exists(db_path):
+        parser.error(f"{db_path} already exists")
+    
+    try:
+        started = time.perf_counter()
+        conn = connect(db_path)
+        generate(conn, args.projects)
+        conn.close()
+        print(f"Generated {args.projects} projects in {time.perf_counter() - started:.1f} s\n")
+        failures = check(db_path, args.budget_scale, args.repeat, args.verbose)
+    finally:
+        if temp_dir:
+            for name in os.listdir(temp_dir):
+                os.remove(os.path.join(temp_dir, name))
+            os.rmdir(temp_dir)
+    
+    print(f"\n{failures} check(s) failed" if failures else "\nAll checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
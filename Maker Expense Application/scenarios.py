@@ -0,0 +1,250 @@
+"""
+What-if pricing scenarios for Project Pricer
+Requires: pip install numpy
+
+A project's line items are loaded into NumPy arrays once, then every
+combination of hourly rate, tool rate factor, material price inflation
+and markup is priced in a single vectorized pass. Monte Carlo simulation
+covers uncertain labor hours.
+
+Scenarios are projections rather than stored amounts, so they are priced
+in floating point dollars from the integer cents in the database.
+"""
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("numpy is required. Install with: pip install numpy")
+    return np
+
+def value_range(start, stop, steps):
+    """
+    Build an evenly spaced range of values
+    
+    Args:
+        start: First value
+        stop: Last value
+        steps: Number of values (1 gives just start)
+    
+    Returns:
+        NumPy array of values
+    """
+    np = _numpy()
+    steps = int(steps)
+    if steps < 1:
+        raise ValueError("Steps must be at least 1")
+    if steps == 1:
+        return np.array([float(start)])
+    return np.linspace(float(start), float(stop), steps)
+
+class ScenarioGrid:
+    """Priced combinations of rate, tool factor, inflation and markup"""
+    
+    AXES = ('hourly_rate', 'tool_rate_factor', 'material_inflation', 'markup')
+    
+    def __init__(self, axes, materials, labor, tools, totals):
+        self.axes = axes
+        # Component costs broadcast against the full grid shape
+        self.materials = materials
+        self.labor = labor
+        self.tools = tools
+        self.totals = totals
+    
+    def __len__(self):
+        return self.totals.size
+    
+    def summary(self):
+        """Return min, max and mean totals with the cheapest and dearest combination"""
+        np = _numpy()
+        flat = self.totals.ravel()
+        low = np.unravel_index(int(flat.argmin()), self.totals.shape)
+        high = np.unravel_index(int(flat.argmax()), self.totals.shape)
+        return {
+            'count': int(flat.size),
+            'min': float(flat.min()),
+            'max': float(flat.max()),
+            'mean': float(flat.mean()),
+            'min_at': {name: float(self.axes[name][i]) for name, i in zip(self.AXES, low)},
+            'max_at': {name: float(self.axes[name][i]) for name, i in zip(self.AXES, high)},
+        }
+    
+    def rows(self, order=None):
+        """
+        Flatten the grid into rows
+        
+        Args:
+            order: Optional 'asc' or 'desc' to sort by total
+        
+        Returns:
+            List of (hourly_rate, tool_rate_factor, material_inflation, markup,
+                     materials, labor, tools, total) tuples
+        """
+        np = _numpy()
+        shape = self.totals.shape
+        grids = np.meshgrid(*(self.axes[name] for name in self.AXES), indexing='ij')
+        columns = [g.ravel() for g in grids]
+        columns += [np.broadcast_to(part, shape).ravel()
+                    for part in (self.materials, self.labor, self.tools, self.totals)]
+        
+        index = np.arange(self.totals.size)
+        if order == 'asc':
+            index = np.argsort(columns[-1], kind='stable')
+        elif order == 'desc':
+            index = np.argsort(-columns[-1], kind='stable')
+        
+        table = np.column_stack(columns)[index]
+        return [tuple(row) for row in table.tolist()]
+
+class ProjectScenario:
+    """A project's line items held in NumPy arrays for repeated pricing"""
+    
+    def __init__(self, project_name, hourly_rate, material_quantities, material_costs,
+                 labor_hours, tool_hours, tool_rates):
+        np = _numpy()
+        self.project_name = project_name
+        self.hourly_rate = float(hourly_rate or 0)
+        self.material_quantities = np.asarray(material_quantities, dtype=float)
+        self.material_costs = np.asarray(material_costs, dtype=float)
+        self.labor_hours = np.asarray(labor_hours, dtype=float)
+        self.tool_hours = np.asarray(tool_hours, dtype=float)
+        self.tool_rates = np.asarray(tool_rates, dtype=float)
+        
+        # The model is linear in every axis, so the line items reduce to
+        # three base amounts once
+        self.materials_base = float(self.material_quantities @ self.material_costs)
+        self.labor_hours_total = float(self.labor_hours.sum())
+        self.tools_base = float(self.tool_hours @ self.tool_rates)
+    
+    @classmethod
+    def load(cls, cursor, project_id):
+        """
+        Load a project's line items
+        
+        Args:
+            cursor: SQLite cursor
+            project_id: ID of the project
+        
+        Returns:
+            ProjectScenario
+        """
+        cursor.execute('''
+            SELECT p.name, pr.hourly_rate_cents / 100.0
+            FROM projects p
+            LEFT JOIN profiles pr ON p.profile_id = pr.id
+            WHERE p.id = ?
+        ''', (project_id,))
+        project = cursor.fetchone()
+        if not project:
+            raise ValueError("Project not found")
+        
+        cursor.execute('''
+            SELECT IFNULL(quantity, 0), IFNULL(unit_cost_cents, 0) / 100.0 FROM materials WHERE project_id = ?
+        ''', (project_id,))
+        materials = cursor.fetchall()
+        cursor.execute('SELECT IFNULL(hours, 0) FROM labor WHERE project_id = ?', (project_id,))
+        labor = cursor.fetchall()
+        cursor.execute('''
+            SELECT IFNULL(tu.hours, 0), IFNULL(t.cost_per_hour_cents, 0) / 100.0
+            FROM tool_usage tu
+            JOIN tools t ON tu.tool_id = t.id
+            WHERE tu.project_id = ?
+        ''', (project_id,))
+        tools = cursor.fetchall()
+        
+        return cls(
+            project[0], project[1],
+            [m[0] for m in materials], [m[1] for m in materials],
+            [l[0] for l in labor],
+            [t[0] for t in tools], [t[1] for t in tools],
+        )
+    
+    def evaluate(self, hourly_rates=None, tool_rate_factors=None, material_inflation=None, markups=None):
+        """
+        Price every combination of the given axes in one vectorized pass
+        
+        Args:
+            hourly_rates: Hourly labor rates (default: the profile rate)
+            tool_rate_factors: Multipliers on tool rates (default: 1.0)
+            material_inflation: Material price changes as fractions (default: 0.0)
+            markups: Markups on the total as fractions (default: 0.0)
+        
+        Returns:
+            ScenarioGrid
+        """
+        np = _numpy()
+        axes = {
+            'hourly_rate': np.atleast_1d(np.asarray(
+                [self.hourly_rate] if hourly_rates is None else hourly_rates, dtype=float)),
+            'tool_rate_factor': np.atleast_1d(np.asarray(
+                [1.0] if tool_rate_factors is None else tool_rate_factors, dtype=float)),
+            'material_inflation': np.atleast_1d(np.asarray(
+                [0.0] if material_inflation is None else material_inflation, dtype=float)),
+            'markup': np.atleast_1d(np.asarray(
+                [0.0] if markups is None else markups, dtype=float)),
+        }
+        
+        # Each axis gets its own dimension so broadcasting forms the full grid
+        rate = axes['hourly_rate'][:, None, None, None]
+        factor = axes['tool_rate_factor'][None, :, None, None]
+        inflation = axes['material_inflation'][None, None, :, None]
+        markup = axes['markup'][None, None, None, :]
+        
+        materials = self.materials_base * (1.0 + inflation)
+        labor = self.labor_hours_total * rate
+        tools = self.tools_base * factor
+        totals = (materials + labor + tools) * (1.0 + markup)
+        
+        return ScenarioGrid(axes, materials, labor, tools, totals)
+    
+    def monte_carlo(self, iterations=10000, under=0.1, over=0.5, hourly_rate=None, markup=0.0, seed=None):
+        """
+        Simulate uncertain labor hours
+        
+        Each labor line's hours are drawn from a triangular distribution
+        between hours * (1 - under) and hours * (1 + over), peaking at the
+        entered hours.
+        
+        Args:
+            iterations: Number of simulated projects
+            under: Largest fractional underrun of each labor line
+            over: Largest fractional overrun of each labor line
+            hourly_rate: Rate to price labor at (default: the profile rate)
+            markup: Markup on the total as a fraction
+            seed: Optional random seed for repeatable results
+        
+        Returns:
+            Dictionary with mean, std, p5, p50, p95, p99 and the totals array
+        """
+        np = _numpy()
+        rng = np.random.default_rng(seed)
+        rate = self.hourly_rate if hourly_rate is None else float(hourly_rate)
+        iterations = int(iterations)
+        
+        fixed = self.materials_base + self.tools_base
+        if self.labor_hours.size and self.labor_hours.any():
+            mode = self.labor_hours
+            left = mode * (1.0 - under)
+            right = mode * (1.0 + over)
+            # triangular() needs left < right; zero-hour lines stay at zero
+            varying = right > left
+            hours = np.broadcast_to(mode, (iterations, mode.size)).copy()
+            if varying.any():
+                hours[:, varying] = rng.triangular(left[varying], mode[varying], right[varying],
+                                                   size=(iterations, int(varying.sum())))
+            labor = hours.sum(axis=1) * rate
+        else:
+            labor = np.zeros(iterations)
+        
+        totals = (fixed + labor) * (1.0 + markup)
+        p5, p50, p95, p99 = np.percentile(totals, [5, 50, 95, 99])
+        return {
+            'iterations': iterations,
+            'mean': float(totals.mean()),
+            'std': float(totals.std()),
+            'p5': float(p5),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'totals': totals,
+        }
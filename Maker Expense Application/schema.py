@@ -0,0 +1,283 @@
+"""
+Database schema for Project Pricer
+Shared by the desktop application and the headless tools so every entry
+point creates and upgrades the database the same way.
+"""
+import sqlite3
+
+from db_locking import VERSIONED_TABLES, configure, install_row_versions, write_transaction
+from db_replication import install_change_log, stop_change_log
+from export_cache import install_project_versions
+from pricing import install_project_totals
+from time_tracking import install_timer_events
+
+# Bumped by every migration; replicas reseed when it changes
+SCHEMA_VERSION = 10
+
+# (table, REAL dollar column, INTEGER cents column, definition) converted by version 6
+MONEY_COLUMNS = (
+    ('profiles', 'hourly_rate', 'hourly_rate_cents', 'INTEGER NOT NULL DEFAULT 0'),
+    ('tools', 'cost_per_hour', 'cost_per_hour_cents', 'INTEGER'),
+    ('materials', 'unit_cost', 'unit_cost_cents', 'INTEGER'),
+    ('material_prices', 'unit_cost', 'unit_cost_cents', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+def add_column(cursor, table, column, definition):
+    """Add a column to a table unless it already exists"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def migrate_cut_list(cursor):
+    """Version 1: stock dimensions on materials and the parts cut from them"""
+    add_column(cursor, 'materials', 'stock_length', 'REAL')
+    add_column(cursor, 'materials', 'stock_width', 'REAL')
+    add_column(cursor, 'materials', 'kerf', 'REAL')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cut_parts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER,
+            material_id INTEGER,
+            name TEXT NOT NULL,
+            length REAL NOT NULL,
+            width REAL,
+            count INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (project_id) REFERENCES projects (id),
+            FOREIGN KEY (material_id) REFERENCES materials (id)
+        )
+    ''')
+
+def migrate_price_history(cursor):
+    """Version 2: material price history, seeded from existing materials"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS material_prices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            material_key TEXT NOT NULL,
+            effective_date TEXT NOT NULL,
+            unit_cost REAL NOT NULL,
+            source TEXT
+        )
+    ''')
+    # As-of lookups seek (material_key, effective_date <= date) backwards
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_material_prices_key_date
+        ON material_prices (material_key, effective_date)
+    ''')
+    # Each project's costs are the prices known when it was created
+    cursor.execute('''
+        INSERT OR IGNORE INTO material_prices (material_key, effective_date, unit_cost, source)
+        SELECT lower(trim(m.name)), date(p.created_date), m.unit_cost, 'project'
+        FROM materials m
+        JOIN projects p ON m.project_id = p.id
+        WHERE m.unit_cost IS NOT NULL AND date(p.created_date) IS NOT NULL
+        ORDER BY p.created_date
+    ''')
+
+def migrate_catalog_ids(cursor):
+    """Version 3: supplier catalog IDs on materials and indexes for price list matching"""
+    add_column(cursor, 'materials', 'catalog_id', 'TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_materials_catalog_id ON materials (catalog_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_materials_name_key ON materials (lower(trim(name)))')
+
+def migrate_project_totals(cursor):
+    """Version 4: indexes for sorting and filtering the project list (totals are installed by version 6)"""
+    for sql in (
+        'CREATE INDEX IF NOT EXISTS idx_materials_project ON materials (project_id)',
+        'CREATE INDEX IF NOT EXISTS idx_labor_project ON labor (project_id)',
+        'CREATE INDEX IF NOT EXISTS idx_tool_usage_project ON tool_usage (project_id)',
+        'CREATE INDEX IF NOT EXISTS idx_tool_usage_tool ON tool_usage (tool_id)',
+        'CREATE INDEX IF NOT EXISTS idx_tools_profile ON tools (profile_id)',
+        'CREATE INDEX IF NOT EXISTS idx_cut_parts_material ON cut_parts (material_id)',
+        'CREATE INDEX IF NOT EXISTS idx_projects_profile ON projects (profile_id)',
+        'CREATE INDEX IF NOT EXISTS idx_projects_created ON projects (created_date)',
+        'CREATE INDEX IF NOT EXISTS idx_projects_name ON projects (name COLLATE NOCASE)',
+    ):
+        cursor.execute(sql)
+
+def migrate_scan_indexes(cursor):
+    """Version 5: indexes for queries found scanning by query_plan_check.py"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cut_parts_project ON cut_parts (project_id)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_description ON projects (IFNULL(description, ''))")
+
+def migrate_sort_indexes(cursor):
+    """Version 10: index the project date sort key, which keeps projects without a date in keyset pages"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_created_sort ON projects (IFNULL(created_date, ''))")
+
+def convert_money_columns(cursor):
+    """
+    Replace the REAL dollar columns of MONEY_COLUMNS with INTEGER cents
+    
+    Each value is rounded to the cent once. Tables that are missing or
+    already converted are skipped, so this is also safe on archive files.
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    for table, dollars, cents, definition in MONEY_COLUMNS:
+        cursor.execute(f'PRAGMA table_info({table})')
+        if dollars not in {row[1] for row in cursor.fetchall()}:
+            continue
+        add_column(cursor, table, cents, definition)
+        cursor.execute(f'UPDATE {table} SET {cents} = CAST(ROUND({dollars} * 100) AS INTEGER)')
+        cursor.execute(f'ALTER TABLE {table} DROP COLUMN {dollars}')
+
+def migrate_money(cursor):
+    """Version 6: money as integer cents, with project totals rebuilt exactly"""
+    # Triggers naming the old columns would block DROP COLUMN; the totals
+    # triggers are recreated below and the change log ones by init_schema
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name != 'change_log'")
+    for (trigger,) in cursor.fetchall():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute('DROP TABLE IF EXISTS project_totals')
+    convert_money_columns(cursor)
+    install_project_totals(cursor)
+
+def migrate_row_versions(cursor):
+    """Version 8: row versions for optimistic concurrency between sessions"""
+    for table in VERSIONED_TABLES:
+        add_column(cursor, table, 'row_version', 'INTEGER NOT NULL DEFAULT 1')
+    install_row_versions(cursor)
+
+# (version, function) pairs applied in order to older databases
+MIGRATIONS = [
+    (1, migrate_cut_list),
+    (2, migrate_price_history),
+    (3, migrate_catalog_ids),
+    (4, migrate_project_totals),
+    (5, migrate_scan_indexes),
+    (6, migrate_money),
+    (7, install_project_versions),
+    (8, migrate_row_versions),
+    (9, install_timer_events),
+    (10, migrate_sort_indexes),
+]
+
+def migrate(cursor):
+    """
+    Bring an existing database up to SCHEMA_VERSION
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    cursor.execute('PRAGMA user_version')
+    version = cursor.fetchone()[0]
+    for target, upgrade in MIGRATIONS:
+        if version < target:
+            upgrade(cursor)
+            cursor.execute(f'PRAGMA user_version = {target}')
+
+def init_schema(cursor):
+    """
+    Create any missing tables and triggers
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    # Tables as first released; money columns become integer cents in migration 6
+    
+    # User Profile table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            hourly_rate REAL NOT NULL,
+            created_date TEXT
+        )
+    ''')
+    
+    # Tools/Machines table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tools (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER,
+            name TEXT NOT NULL,
+            cost_per_hour REAL,
+            FOREIGN KEY (profile_id) REFERENCES profiles (id)
+        )
+    ''')
+    
+    # Projects table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_date TEXT,
+            FOREIGN KEY (profile_id) REFERENCES profiles (id)
+        )
+    ''')
+    
+    # Materials table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS materials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER,
+            name TEXT NOT NULL,
+            quantity REAL,
+            unit_cost REAL,
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )
+    ''')
+    
+    # Labor entries table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS labor (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER,
+            description TEXT,
+            hours REAL,
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )
+    ''')
+    
+    # Tool usage table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tool_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER,
+            tool_id INTEGER,
+            hours REAL,
+            FOREIGN KEY (project_id) REFERENCES projects (id),
+            FOREIGN KEY (tool_id) REFERENCES tools (id)
+        )
+    ''')
+    
+    # Application settings table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    
+    migrate(cursor)
+    
+    # Capture writes for incremental replication only while a replica is
+    # configured; otherwise nothing would ever trim the log
+    cursor.execute("SELECT value FROM settings WHERE key = 'replica_path'")
+    row = cursor.fetchone()
+    if row and row[0]:
+        install_change_log(cursor)
+    else:
+        stop_change_log(cursor)
+
+def connect(db_path, **kwargs):
+    """
+    Open a database connection and make sure the schema is current
+    
+    The connection is set up for sharing the file with other processes, and
+    the schema is checked under the write lock so two processes starting at
+    once cannot both migrate it.
+    
+    Args:
+        db_path: Database file
+        **kwargs: Extra arguments for sqlite3.connect
+    
+    Returns:
+        SQLite connection
+    """
+    conn = configure(sqlite3.connect(db_path, **kwargs))
+    with write_transaction(conn) as cursor:
+        init_schema(cursor)
+    return conn
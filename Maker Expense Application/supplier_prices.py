@@ -0,0 +1,263 @@
+"""
+Bulk supplier price list updates for Project Pricer
+Streams a supplier CSV into a temporary table, matches it against the
+materials of every project by catalog ID or name, and reprices them all
+with one UPDATE ... FROM join.
+
+The CSV needs a unit_cost (or price) column in dollars and a catalog_id
+and/or name column. Catalog ID matches win over name matches; names are compared
+ignoring case and surrounding spaces.
+
+Command line usage:
+    python supplier_prices.py prices.csv            (report only)
+    python supplier_prices.py prices.csv --apply
+"""
+import csv
+import os
+import sqlite3
+from contextlib import nullcontext
+
+from money import format_money, line_cost_sql, to_cents
+from price_history import material_key, material_key_sql, today
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+
+COST_COLUMNS = ('unit_cost', 'price', 'cost')
+
+def _rows(reader, cost_column):
+    """Yield (catalog_id, material_key, unit_cost_cents) from CSV rows, skipping bad costs"""
+    for row in reader:
+        catalog_id = (row.get('catalog_id') or '').strip() or None
+        key = material_key(row.get('name')) or None
+        try:
+            unit_cost_cents = to_cents(row[cost_column])
+        except ValueError:
+            continue
+        if unit_cost_cents is not None and (catalog_id or key):
+            yield catalog_id, key, unit_cost_cents
+
+def load_price_list(cursor, path):
+    """
+    Stream a supplier CSV into temp.price_list
+    
+    Later rows for the same catalog ID or name replace earlier ones.
+    
+    Args:
+        cursor: SQLite cursor
+        path: CSV file
+    
+    Returns:
+        Number of price list rows loaded
+    """
+    cursor.execute('DROP TABLE IF EXISTS temp.price_list')
+    # material_key is untyped: a TEXT column would apply affinity to
+    # lower(trim(name)) and stop SQLite using the expression index on materials
+    cursor.execute('''
+        CREATE TEMP TABLE price_list (
+            catalog_id TEXT,
+            material_key,
+            unit_cost_cents INTEGER NOT NULL
+        )
+    ''')
+    
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        fields = set(reader.fieldnames or [])
+        cost_column = next((name for name in COST_COLUMNS if name in fields), None)
+        if cost_column is None:
+            raise ValueError("CSV needs a unit_cost or price column")
+        if not fields & {'catalog_id', 'name'}:
+            raise ValueError("CSV needs a catalog_id or name column")
+        cursor.executemany('INSERT INTO temp.price_list VALUES (?, ?, ?)', _rows(reader, cost_column))
+    
+    # Keep the last row per catalog ID / name pair, then index for the joins
+    cursor.execute('''
+        DELETE FROM temp.price_list
+        WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM temp.price_list GROUP BY catalog_id, material_key
+        )
+    ''')
+    cursor.execute('CREATE INDEX temp.idx_price_list_catalog ON price_list (catalog_id)')
+    cursor.execute('CREATE INDEX temp.idx_price_list_key ON price_list (material_key)')
+    cursor.execute('SELECT COUNT(*) FROM temp.price_list')
+    return cursor.fetchone()[0]
+
+def match_price_list(cursor):
+    """
+    Match temp.price_list against materials into temp.price_matches
+    
+    Args:
+        cursor: SQLite cursor
+    
+    Returns:
+        Number of materials matched
+    """
+    cursor.execute('DROP TABLE IF EXISTS temp.price_matches')
+    cursor.execute('''
+        CREATE TEMP TABLE price_matches (
+            material_id INTEGER PRIMARY KEY,
+            old_cost INTEGER,
+            new_cost INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO temp.price_matches (material_id, old_cost, new_cost)
+        SELECT m.id, m.unit_cost_cents, pl.unit_cost_cents
+        FROM temp.price_list pl
+        JOIN materials m ON m.catalog_id = pl.catalog_id
+        WHERE pl.catalog_id IS NOT NULL
+        ORDER BY pl.rowid
+    ''')
+    # Name matches only fill in materials without a catalog ID match
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO temp.price_matches (material_id, old_cost, new_cost)
+        SELECT m.id, m.unit_cost_cents, pl.unit_cost_cents
+        FROM temp.price_list pl
+        JOIN materials m ON {material_key_sql('m.name')} = pl.material_key
+        WHERE pl.material_key IS NOT NULL
+        ORDER BY pl.rowid DESC
+    ''')
+    cursor.execute('SELECT COUNT(*) FROM temp.price_matches')
+    return cursor.fetchone()[0]
+
+def delta_report(cursor):
+    """
+    Summarize the cost change of each project affected by temp.price_matches
+    
+    Args:
+        cursor: SQLite cursor
+    
+    Returns:
+        List of (project_id, project_name, materials_changed, old_total, new_total)
+        with totals in cents and the largest change first
+    """
+    old_cost = line_cost_sql('m.quantity', 'pm.old_cost')
+    new_cost = line_cost_sql('m.quantity', 'pm.new_cost')
+    cursor.execute(f'''
+        SELECT p.id, p.name, COUNT(*), SUM({old_cost}), SUM({new_cost})
+        FROM temp.price_matches pm
+        JOIN materials m ON m.id = pm.material_id
+        JOIN projects p ON p.id = m.project_id
+        WHERE pm.old_cost IS NOT pm.new_cost
+        GROUP BY p.id
+        ORDER BY abs(SUM({new_cost}) - SUM({old_cost})) DESC
+    ''')
+    return cursor.fetchall()
+
+def unmatched_rows(cursor, limit=None):
+    """Return (catalog_id, material_key, unit_cost_cents) price list rows that matched no material"""
+    cursor.execute(f'''
+        SELECT pl.catalog_id, pl.material_key, pl.unit_cost_cents
+        FROM temp.price_list pl
+        WHERE NOT EXISTS (SELECT 1 FROM materials m WHERE m.catalog_id = pl.catalog_id)
+          AND NOT EXISTS (SELECT 1 FROM materials m WHERE {material_key_sql('m.name')} = pl.material_key)
+        ORDER BY pl.rowid
+        {'LIMIT ' + str(int(limit)) if limit else ''}
+    ''')
+    return cursor.fetchall()
+
+def apply_price_matches(cursor, effective_date=None):
+    """
+    Write temp.price_matches to materials and the price history
+    
+    Args:
+        cursor: SQLite cursor
+        effective_date: ISO date for the price history (default: today)
+    
+    Returns:
+        Number of materials updated
+    """
+    cursor.execute('''
+        UPDATE materials SET unit_cost_cents = pm.new_cost
+        FROM temp.price_matches pm
+        WHERE materials.id = pm.material_id AND materials.unit_cost_cents IS NOT pm.new_cost
+    ''')
+    updated = cursor.rowcount
+    
+    cursor.execute(f'''
+        INSERT INTO material_prices (material_key, effective_date, unit_cost_cents, source)
+        SELECT {material_key_sql('m.name')}, ?, pm.new_cost, 'supplier'
+        FROM temp.price_matches pm
+        JOIN materials m ON m.id = pm.material_id
+        WHERE true
+        GROUP BY {material_key_sql('m.name')}
+        ON CONFLICT (material_key, effective_date)
+        DO UPDATE SET unit_cost_cents = excluded.unit_cost_cents, source = excluded.source
+    ''', ((effective_date or today())[:10],))
+    return updated
+
+def drop_price_list(cursor):
+    """Remove the temporary price list tables"""
+    cursor.execute('DROP TABLE IF EXISTS temp.price_matches')
+    cursor.execute('DROP TABLE IF EXISTS temp.price_list')
+
+def update_from_price_list(conn, path, apply=True, effective_date=None, undo=None):
+    """
+    Load, match and optionally apply a supplier price list in one transaction
+    
+    Args:
+        conn: SQLite connection
+        path: Supplier CSV file
+        apply: False to only report the changes
+        effective_date: ISO date for the price history (default: today)
+        undo: Optional undo.UndoJournal to record the applied changes in
+    
+    Returns:
+        Dictionary with loaded, matched, updated, unmatched and report
+    """
+    cursor = conn.cursor()
+    try:
+        loaded = load_price_list(cursor, path)
+        matched = match_price_list(cursor)
+        report = delta_report(cursor)
+        unmatched = unmatched_rows(cursor)
+        updated = 0
+        if apply:
+            with undo.record("Apply Supplier Prices") if undo is not None else nullcontext():
+                updated = apply_price_matches(cursor, effective_date)
+        if apply:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        drop_price_list(cursor)
+    
+    return {'loaded': loaded, 'matched': matched, 'updated': updated,
+            'unmatched': unmatched, 'report': report}
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Update material costs from a supplier price list")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    parser.add_argument('csv_file', help="Supplier CSV with catalog_id and/or name, and unit_cost")
+    parser.add_argument('--apply', action='store_true', help="Write the new costs (default: report only)")
+    parser.add_argument('--date', help="Effective date for the price history (default: today)")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} not found")
+    
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        result = update_from_price_list(conn, args.csv_file, args.apply, args.date)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    
+    for project_id, name, changed, old_total, new_total in result['report']:
+        print(f"#{project_id:<6} {name:<30} {changed:>4} materials  "
+              f"{format_money(old_total)} -> {format_money(new_total)} "
+              f"({format_money(new_total - old_total, signed=True)})")
+    print(f"{result['loaded']} price list rows, {result['matched']} materials matched, "
+          f"{len(result['unmatched'])} rows unmatched")
+    print(f"{result['updated']} materials updated" if args.apply else "Report only; use --apply to update")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,345 @@
+"""
+Labor time tracking for Project Pricer
+Start/stop timers per project. While a timer runs a tick is recorded every
+few seconds, so little time is lost if the application closes without the
+timer being stopped. Events are held in memory and appended to the
+timer_events table in one batch per flush.
+
+Pricing never reads timer_events. Compaction, run in the background, rolls
+the events up into one labor row per project, description and day, adding
+to that row when it already exists, and deletes them; a timer that is still
+running keeps a single start event at the time it was last seen. Project
+totals are therefore computed from a few labor rows however many events
+were recorded, and the events table stays small.
+
+Command line usage:
+    python time_tracking.py status
+    python time_tracking.py compact
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from itertools import groupby
+
+from db_locking import write_transaction
+
+DEFAULT_DB_PATH = 'project_pricer.db'
+
+# Event kinds, stored as integers to keep the table compact
+START = 1
+TICK = 2
+STOP = 3
+
+# Seconds between ticks of a running timer
+TICK_SECONDS = 15
+# Seconds between writes of the held events
+FLUSH_SECONDS = 60
+# Seconds between background compactions
+COMPACT_SECONDS = 300
+# A timer with no event for this long was left running by a closed session;
+# its time is counted up to its last event
+STALE_SECONDS = 600
+# Description of labor rows for timers started without one
+DEFAULT_DESCRIPTION = "Tracked time"
+
+def install_timer_events(cursor):
+    """
+    Create the timer_events table
+    
+    Args:
+        cursor: SQLite cursor
+    """
+    # Append-only and read in ID order by compaction, so the rowid is the only index
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS timer_events (
+            id INTEGER PRIMARY KEY,
+            project_id INTEGER NOT NULL,
+            kind INTEGER NOT NULL,
+            at_ms INTEGER NOT NULL,
+            description TEXT
+        )
+    ''')
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def labor_description(description, at_ms):
+    """Description of the labor row a timer's time on a day is added to, e.g. 'Sanding (2024-05-02)'"""
+    day = datetime.fromtimestamp(at_ms / 1000).date().isoformat()
+    return f"{description or DEFAULT_DESCRIPTION} ({day})"
+
+def compact_events(cursor, at_ms=None, stale_seconds=STALE_SECONDS):
+    """
+    Roll every recorded timer event up into labor rows
+    
+    Run inside a write transaction. Each interval between consecutive events
+    of a running timer is counted on the day it started.
+    
+    Args:
+        cursor: SQLite cursor
+        at_ms: Current time in epoch milliseconds (default: now)
+        stale_seconds: Age of its last event after which a running timer is
+            treated as stopped
+    
+    Returns:
+        Dictionary with events compacted, labor as a list of
+        (project_id, labor_id) written, and hours added
+    """
+    at_ms = now_ms() if at_ms is None else at_ms
+    cursor.execute('SELECT project_id, kind, at_ms, description, id FROM timer_events ORDER BY project_id, id')
+    rows = cursor.fetchall()
+    if not rows:
+        return {'events': 0, 'labor': [], 'hours': 0}
+    last_id = max(row[4] for row in rows)
+    
+    added = {}
+    still_running = []
+    for project_id, events in groupby(rows, key=lambda row: row[0]):
+        running = None
+        for _, kind, event_ms, description, _ in events:
+            if kind == START:
+                running = (event_ms, description)
+                continue
+            if running is None:
+                # A tick or stop whose start was compacted away with a closed session
+                continue
+            started_ms, running_description = running
+            if event_ms > started_ms:
+                key = (project_id, labor_description(running_description, started_ms))
+                added[key] = added.get(key, 0) + event_ms - started_ms
+            running = None if kind == STOP else (event_ms, running_description)
+        if running is not None and at_ms - running[0] < stale_seconds * 1000:
+            still_running.append((project_id, START, running[0], running[1]))
+    
+    cursor.execute('DELETE FROM timer_events WHERE id <= ?', (last_id,))
+    cursor.executemany('INSERT INTO timer_events (project_id, kind, at_ms, description) VALUES (?, ?, ?, ?)',
+                       still_running)
+    
+    # Time tracked on a project deleted since is dropped with its events
+    project_ids = sorted({project_id for project_id, _ in added})
+    cursor.execute(f'SELECT id FROM projects WHERE id IN ({", ".join("?" * len(project_ids))})', project_ids)
+    existing = {row[0] for row in cursor.fetchall()}
+    
+    labor = []
+    hours_added = 0
+    for (project_id, description), ms in sorted(added.items()):
+        if project_id not in existing:
+            continue
+        hours = ms / 3600000
+        hours_added += hours
+        cursor.execute('SELECT id FROM labor WHERE project_id = ? AND description = ? ORDER BY id LIMIT 1',
+                       (project_id, description))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('UPDATE labor SET hours = ROUND(IFNULL(hours, 0) + ?, 4) WHERE id = ?', (hours, row[0]))
+            labor.append((project_id, row[0]))
+        else:
+            cursor.execute('INSERT INTO labor (project_id, description, hours) VALUES (?, ?, ROUND(?, 4))',
+                           (project_id, description, hours))
+            labor.append((project_id, cursor.lastrowid))
+    return {'events': len(rows), 'labor': labor, 'hours': hours_added}
+
+def compact_timer_events(conn, at_ms=None, stale_seconds=STALE_SECONDS):
+    """
+    Compact timer events in one write transaction
+    
+    Args:
+        conn: SQLite connection
+        at_ms: Current time in epoch milliseconds (default: now)
+        stale_seconds: Age of its last event after which a running timer is
+            treated as stopped
+    
+    Returns:
+        Result of compact_events
+    """
+    with write_transaction(conn) as cursor:
+        return compact_events(cursor, at_ms, stale_seconds)
+
+class TimeTracker:
+    """Running timers and their events not yet written; used from one thread"""
+    
+    def __init__(self, conn, clock=now_ms):
+        self.conn = conn
+        self.clock = clock
+        # project_id -> (started_ms, description)
+        self.running = {}
+        # (project_id, kind, at_ms, description) not yet flushed
+        self.pending = []
+    
+    def start(self, project_id, description=None):
+        """Start a project's timer unless it is already running"""
+        if project_id in self.running:
+            return
+        at_ms = self.clock()
+        self.running[project_id] = (at_ms, description)
+        self.pending.append((project_id, START, at_ms, description))
+    
+    def stop(self, project_id):
+        """Stop a project's timer if it is running"""
+        if self.running.pop(project_id, None) is not None:
+            self.pending.append((project_id, STOP, self.clock(), None))
+    
+    def stop_all(self):
+        for project_id in list(self.running):
+            self.stop(project_id)
+    
+    def is_running(self, project_id):
+        return project_id in self.running
+    
+    def elapsed_seconds(self, project_id):
+        """Seconds since a project's timer was started, or 0 if it is not running"""
+        started = self.running.get(project_id)
+        return 0 if started is None else (self.clock() - started[0]) / 1000
+    
+    def tick(self):
+        """Record that every running timer is still running"""
+        at_ms = self.clock()
+        self.pending.extend((project_id, TICK, at_ms, None) for project_id in self.running)
+    
+    def flush(self):
+        """
+        Append the held events to timer_events in one transaction
+        
+        Events are kept for the next flush if the write fails.
+        
+        Returns:
+            Number of events written
+        """
+        if not self.pending:
+            return 0
+        events = self.pending
+        with write_transaction(self.conn) as cursor:
+            cursor.executemany('INSERT INTO timer_events (project_id, kind, at_ms, description) VALUES (?, ?, ?, ?)',
+                               events)
+        self.pending = []
+        return len(events)
+
+class TimeTrackingScheduler:
+    """Ticks running timers, flushes them and compacts events on a worker thread, driven by the Tk event loop"""
+    
+    def __init__(self, root, tracker, db_path=DEFAULT_DB_PATH, on_compacted=None, tick_seconds=TICK_SECONDS,
+                 flush_seconds=FLUSH_SECONDS, compact_seconds=COMPACT_SECONDS):
+        self.root = root
+        self.tracker = tracker
+        self.db_path = db_path
+        # Optional callback(result, error) run on the Tk thread after every compaction
+        self.on_compacted = on_compacted
+        self.tick_ms = int(tick_seconds * 1000)
+        self.flush_seconds = flush_seconds
+        self.compact_seconds = compact_seconds
+        
+        self.last_result = None
+        self.last_error = None
+        self._last_flush = time.monotonic()
+        self._last_compact = time.monotonic()
+        self._after_id = None
+        self._thread = None
+        self._callbacks = []
+    
+    def start(self):
+        """Schedule the first tick; compacts events left by the last session"""
+        self._after_id = self.root.after(self.tick_ms, self._scheduled)
+        self.compact_now()
+    
+    def stop(self):
+        """Cancel ticks"""
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def _scheduled(self):
+        self.tracker.tick()
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+        if time.monotonic() - self._last_compact >= self.compact_seconds:
+            self.compact_now()
+        self._after_id = self.root.after(self.tick_ms, self._scheduled)
+    
+    def flush(self):
+        """Write the held events; a failed write is retried at the next flush"""
+        self._last_flush = time.monotonic()
+        try:
+            self.tracker.flush()
+        except sqlite3.Error as e:
+            self.last_error = e
+    
+    def compact_now(self, on_complete=None):
+        """
+        Flush, then compact events on a worker thread
+        
+        Args:
+            on_complete: Optional callback(result, error) run on the Tk thread
+        """
+        if on_complete:
+            self._callbacks.append(on_complete)
+        if self.is_running():
+            return
+        
+        self.flush()
+        self._last_compact = time.monotonic()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self.root.after(200, self._poll)
+    
+    def _worker(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            self.last_result = compact_timer_events(conn)
+            self.last_error = None
+        except sqlite3.Error as e:
+            self.last_result = None
+            self.last_error = e
+        finally:
+            conn.close()
+    
+    def _poll(self):
+        if self.is_running():
+            self.root.after(200, self._poll)
+            return
+        
+        callbacks, self._callbacks = self._callbacks, []
+        if self.on_compacted:
+            callbacks.insert(0, self.on_compacted)
+        for callback in callbacks:
+            callback(self.last_result, self.last_error)
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Project Pricer labor time tracking")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="Database file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="Show timer events waiting for compaction")
+    subparsers.add_parser('compact', help="Roll timer events up into labor rows now")
+    args = parser.parse_args()
+    
+    from schema import connect
+    conn = connect(args.db)
+    try:
+        if args.command == 'compact':
+            result = compact_timer_events(conn)
+            print(f"{result['events']} events compacted, {result['hours']:.2f} hours added to "
+                  f"{len(result['labor'])} labor rows")
+            return 0
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT project_id, COUNT(*), SUM(kind = ?), MIN(at_ms), MAX(at_ms)
+            FROM timer_events GROUP BY project_id ORDER BY project_id
+        ''', (START,))
+        rows = cursor.fetchall()
+        for project_id, events, starts, first_ms, last_ms in rows:
+            print(f"project {project_id}: {events} events, {starts} starts, "
+                  f"{datetime.fromtimestamp(first_ms / 1000):%Y-%m-%d %H:%M} to "
+                  f"{datetime.fromtimestamp(last_ms / 1000):%Y-%m-%d %H:%M}")
+        if not rows:
+            print("No timer events waiting for compaction")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,282 @@
+"""
+Undo and redo for Project Pricer
+While a step is being recorded, temporary triggers on this connection copy
+the before and after image of every row it writes, as JSON, into a journal
+in the connection's temp database. Undoing a step writes the before images
+back and redoing it writes the after images; each is one transaction.
+
+Journal rows are replayed in runs of consecutive changes to the same table
+by the same operation, so undoing a bulk delete of thousands of rows is one
+INSERT ... SELECT per table, much like the delete was one DELETE per table.
+Other sessions never see the journal, and it ends with the connection.
+
+Usage:
+    journal = UndoJournal(conn)
+    with write_transaction(conn) as cursor, journal.record("Delete project"):
+        cursor.execute(...)
+    journal.undo()
+    journal.redo()
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from db_locking import write_transaction
+from db_replication import REPLICATED_TABLES, OPERATIONS, row_json_sql, table_columns
+
+# Steps kept for undo; older ones are forgotten
+MAX_STEPS = 100
+# Total size of the row images kept; a single larger step is not kept at all
+MAX_BYTES = 32 * 1024 * 1024
+
+class UndoConflict(Exception):
+    """Raised when rows a step touched were changed since, so it cannot be reversed"""
+
+class UndoJournal:
+    """Bounded undo and redo stack of recorded write steps on one connection"""
+    
+    def __init__(self, conn, max_steps=MAX_STEPS, max_bytes=MAX_BYTES):
+        self.conn = conn
+        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+        self.columns = {}
+        self.install()
+    
+    def install(self):
+        """Create the temp journal tables and capture triggers for the current columns"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS undo_steps (
+                id INTEGER PRIMARY KEY,
+                label TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                undone INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS undo_rows (
+                step_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                table_name TEXT NOT NULL,
+                op TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                old_data TEXT,
+                new_data TEXT,
+                PRIMARY KEY (step_id, seq)
+            ) WITHOUT ROWID
+        ''')
+        # Holds the step being recorded; the triggers do nothing while it is empty
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS undo_recording (step_id INTEGER NOT NULL)')
+        
+        # Triggers cannot name a schema in their body; unqualified names
+        # resolve to the temp tables first
+        for table in REPLICATED_TABLES:
+            columns = self.columns[table] = table_columns(cursor, table)
+            for event, op in OPERATIONS.items():
+                trigger = f'undo_{table}_{event.lower()}'
+                old_data = row_json_sql(columns, 'OLD') if op != 'I' else 'NULL'
+                new_data = row_json_sql(columns, 'NEW') if op != 'D' else 'NULL'
+                row_id = 'OLD.id' if op == 'D' else 'NEW.id'
+                cursor.execute(f'DROP TRIGGER IF EXISTS temp.{trigger}')
+                cursor.execute(f'''
+                    CREATE TEMP TRIGGER {trigger} AFTER {event} ON main.{table}
+                    WHEN EXISTS (SELECT 1 FROM undo_recording)
+                    BEGIN
+                        INSERT INTO undo_rows (step_id, seq, table_name, op, row_id, old_data, new_data)
+                        SELECT r.step_id,
+                               IFNULL((SELECT MAX(seq) FROM undo_rows WHERE step_id = r.step_id), 0) + 1,
+                               '{table}', '{op}', {row_id}, {old_data}, {new_data}
+                        FROM undo_recording r;
+                    END
+                ''')
+    
+    @contextmanager
+    def record(self, label):
+        """
+        Record the writes made inside the block as one undoable step
+        
+        Use inside a write transaction so the step and its writes commit
+        or roll back together. Recording a new step discards the redo stack.
+        
+        Args:
+            label: Short description shown in the Edit menu, e.g. "Remove Material"
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM temp.undo_rows WHERE step_id IN (SELECT id FROM temp.undo_steps WHERE undone)')
+        cursor.execute('DELETE FROM temp.undo_steps WHERE undone')
+        cursor.execute('INSERT INTO temp.undo_steps (label, created_at) VALUES (?, ?)',
+                       (label, datetime.now().isoformat()))
+        step_id = cursor.lastrowid
+        cursor.execute('INSERT INTO temp.undo_recording (step_id) VALUES (?)', (step_id,))
+        try:
+            yield step_id
+        finally:
+            cursor.execute('DELETE FROM temp.undo_recording')
+        cursor.execute('''
+            UPDATE temp.undo_steps SET bytes = (
+                SELECT IFNULL(SUM(IFNULL(length(old_data), 0) + IFNULL(length(new_data), 0)), 0)
+                FROM temp.undo_rows WHERE step_id = ?
+            ) WHERE id = ?
+        ''', (step_id, step_id))
+        cursor.execute('''
+            DELETE FROM temp.undo_steps
+            WHERE id = ? AND NOT EXISTS (SELECT 1 FROM temp.undo_rows WHERE step_id = ?)
+        ''', (step_id, step_id))
+        self._trim(cursor)
+    
+    def _trim(self, cursor):
+        """Forget the oldest steps beyond max_steps or max_bytes"""
+        cursor.execute('''
+            SELECT id FROM (
+                SELECT id,
+                       ROW_NUMBER() OVER (ORDER BY id DESC) AS position,
+                       SUM(bytes) OVER (ORDER BY id DESC) AS kept_bytes
+                FROM temp.undo_steps
+            )
+            WHERE position > ? OR kept_bytes > ?
+        ''', (self.max_steps, self.max_bytes))
+        expired = [row[0] for row in cursor.fetchall()]
+        if expired:
+            first_kept = max(expired) + 1
+            cursor.execute('DELETE FROM temp.undo_rows WHERE step_id < ?', (first_kept,))
+            cursor.execute('DELETE FROM temp.undo_steps WHERE id < ?', (first_kept,))
+    
+    def _step(self, undone):
+        order = 'ASC' if undone else 'DESC'
+        cursor = self.conn.execute(f'SELECT id, label FROM temp.undo_steps WHERE undone = ? ORDER BY id {order} '
+                                   'LIMIT 1', (1 if undone else 0,))
+        return cursor.fetchone()
+    
+    def undo_label(self):
+        """Label of the step undo() would reverse, or None"""
+        step = self._step(False)
+        return step[1] if step else None
+    
+    def redo_label(self):
+        """Label of the step redo() would reapply, or None"""
+        step = self._step(True)
+        return step[1] if step else None
+    
+    def clear(self):
+        """Forget every step"""
+        with write_transaction(self.conn) as cursor:
+            cursor.execute('DELETE FROM temp.undo_rows')
+            cursor.execute('DELETE FROM temp.undo_steps')
+    
+    def undo(self):
+        """
+        Reverse the most recent step in one transaction
+        
+        Returns:
+            (label, tables) of the step, or None if there is nothing to undo
+        
+        Raises:
+            UndoConflict: If a row the step wrote was changed since
+        """
+        return self._replay(undone=False)
+    
+    def redo(self):
+        """
+        Reapply the most recently undone step in one transaction
+        
+        Returns:
+            (label, tables) of the step, or None if there is nothing to redo
+        
+        Raises:
+            UndoConflict: If a row the step wrote was changed since it was undone
+        """
+        return self._replay(undone=True)
+    
+    def _replay(self, undone):
+        with write_transaction(self.conn) as cursor:
+            step = self._step(undone)
+            if step is None:
+                return None
+            step_id, label = step
+            redo = bool(undone)
+            tables = self._check(cursor, step_id, redo)
+            
+            cursor.execute(f'''
+                SELECT table_name, op, MIN(seq), MAX(seq)
+                FROM (
+                    SELECT seq, table_name, op,
+                           ROW_NUMBER() OVER (ORDER BY seq)
+                           - ROW_NUMBER() OVER (PARTITION BY table_name, op ORDER BY seq) AS run
+                    FROM temp.undo_rows WHERE step_id = ?
+                )
+                GROUP BY table_name, op, run
+                ORDER BY MIN(seq) {'ASC' if redo else 'DESC'}
+            ''', (step_id,))
+            for table, op, first, last in cursor.fetchall():
+                self._apply_run(cursor, step_id, table, op, first, last, redo)
+            
+            cursor.execute('UPDATE temp.undo_steps SET undone = ? WHERE id = ?', (0 if redo else 1, step_id))
+        return label, tables
+    
+    def _check(self, cursor, step_id, redo):
+        """
+        Make sure every row a step touched is still as the step left it
+        
+        Row versions are ignored, since undo and redo bump them like any other update.
+        
+        Returns:
+            Names of the tables the step touched
+        """
+        cursor.execute('SELECT DISTINCT table_name FROM temp.undo_rows WHERE step_id = ?', (step_id,))
+        tables = [row[0] for row in cursor.fetchall()]
+        for table in tables:
+            # The image each row should have now: after the last change, or before the first once undone
+            image, pick = ('old_data', 'MIN') if redo else ('new_data', 'MAX')
+            cursor.execute(f'''
+                SELECT COUNT(*)
+                FROM (
+                    SELECT row_id, {image} AS expected, {pick}(seq)
+                    FROM temp.undo_rows WHERE step_id = ? AND table_name = ?
+                    GROUP BY row_id
+                ) u
+                LEFT JOIN main.{table} t ON t.id = u.row_id
+                WHERE CASE
+                    WHEN u.expected IS NULL THEN t.id IS NOT NULL
+                    ELSE t.id IS NULL OR json_remove({row_json_sql(self.columns[table], 't')}, '$.row_version')
+                                         IS NOT json_remove(u.expected, '$.row_version')
+                END
+            ''', (step_id, table))
+            if cursor.fetchone()[0]:
+                raise UndoConflict(f"Rows in {table} were changed since this step, so it cannot be "
+                                   f"{'redone' if redo else 'undone'}")
+        return tables
+    
+    def _apply_run(self, cursor, step_id, table, op, first, last, redo):
+        """Write back one run of same-table, same-operation changes"""
+        columns = self.columns[table]
+        run = 'step_id = ? AND seq BETWEEN ? AND ?'
+        params = (step_id, first, last)
+        # Undoing an insert or redoing a delete removes rows; the reverse puts images back
+        if op == ('D' if redo else 'I'):
+            cursor.execute(f'''
+                DELETE FROM main.{table}
+                WHERE id IN (SELECT row_id FROM temp.undo_rows WHERE {run})
+            ''', params)
+        elif op in ('I', 'D'):
+            image = 'new_data' if redo else 'old_data'
+            cursor.execute(f'''
+                INSERT INTO main.{table} ({', '.join(columns)})
+                SELECT {', '.join(f"json_extract({image}, '$.{col}')" for col in columns)}
+                FROM temp.undo_rows WHERE {run}
+                ORDER BY seq {'ASC' if redo else 'DESC'}
+            ''', params)
+        else:
+            # Several updates of one row collapse to its first old or last new image;
+            # row_version is left for the trigger to bump
+            image, pick = ('new_data', 'MAX') if redo else ('old_data', 'MIN')
+            assignments = ', '.join(f"{col} = json_extract(u.image, '$.{col}')"
+                                    for col in columns if col not in ('id', 'row_version'))
+            cursor.execute(f'''
+                UPDATE main.{table} SET {assignments}
+                FROM (
+                    SELECT row_id, {image} AS image, {pick}(seq)
+                    FROM temp.undo_rows WHERE {run}
+                    GROUP BY row_id
+                ) u
+                WHERE main.{table}.id = u.row_id
+            ''', params)